@@ -0,0 +1,138 @@
+"""
+Shared accounts version counter for MFA Manager
+Triggers on mfa_accounts bump a counter row in the database on every write, so
+each worker process can tell when accounts changed in any other process and
+drop its in-process caches (see code_cache.TOTPCodeCache.sync). The set of
+TOTP periods in use is re-read along with it, only when the version moves.
+"""
+
+import threading
+import time
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, MFAAccount
+from code_cache import code_cache
+
+STATE_TABLE = 'app_state'
+VERSION_KEY = 'accounts_version'
+
+_CREATE_STATEMENTS = [
+    f"CREATE TABLE IF NOT EXISTS {STATE_TABLE} (key VARCHAR(50) PRIMARY KEY, value INTEGER NOT NULL)",
+    f"INSERT OR IGNORE INTO {STATE_TABLE} (key, value) VALUES ('{VERSION_KEY}', 0)",
+] + [
+    f"""CREATE TRIGGER IF NOT EXISTS mfa_accounts_version_{operation.lower()} AFTER {operation} ON mfa_accounts BEGIN
+        UPDATE {STATE_TABLE} SET value = value + 1 WHERE key = '{VERSION_KEY}';
+    END"""
+    for operation in ('INSERT', 'UPDATE', 'DELETE')
+]
+
+_READ_SQL = text(f"SELECT value FROM {STATE_TABLE} WHERE key = '{VERSION_KEY}'")
+_PERIODS_SQL = text("SELECT DISTINCT period FROM mfa_accounts")
+
+
+def install_version_counter(connection):
+    """Create the version counter row and the triggers that bump it, if they don't exist yet"""
+    if connection.dialect.name != 'sqlite':
+        return
+    for statement in _CREATE_STATEMENTS:
+        connection.execute(text(statement))
+
+
+@event.listens_for(MFAAccount.__table__, 'after_create')
+def _create_version_counter(target, connection, **kw):
+    install_version_counter(connection)
+
+
+@event.listens_for(MFAAccount.__table__, 'after_drop')
+def _drop_version_counter(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {STATE_TABLE}"))
+
+
+def read_accounts_version(connection):
+    """
+    Read the shared accounts version through a connection or session.
+
+    Returns:
+        int: Current version, 0 if the counter hasn't been installed yet
+    """
+    try:
+        return connection.execute(_READ_SQL).scalar() or 0
+    except OperationalError:
+        if hasattr(connection, 'rollback'):
+            connection.rollback()
+        return 0
+
+
+def read_account_periods(connection):
+    """
+    Read the TOTP periods the accounts use through a connection or session (served by the period index).
+
+    Returns:
+        set: Distinct periods, empty if there are no accounts or the table doesn't exist yet
+    """
+    try:
+        return {period for (period,) in connection.execute(_PERIODS_SQL)}
+    except OperationalError:
+        if hasattr(connection, 'rollback'):
+            connection.rollback()
+        return set()
+
+
+def sync_cache(connection, cache):
+    """Bring a code cache up to date with the accounts version (and periods, if it moved) read through a connection"""
+    version = read_accounts_version(connection)
+    periods = None
+    if version != cache.version or cache.periods is None:
+        periods = read_account_periods(connection)
+    return cache.sync(version, periods)
+
+
+def sync_accounts_version(cache=code_cache):
+    """Bring a code cache up to date with the shared accounts version of the session's database (needs an app context)"""
+    return sync_cache(db.session, cache)
+
+
+class AccountsVersionWatcher:
+    """Background thread that syncs code caches with the shared accounts version of their databases"""
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._targets = {}
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, engine, cache=code_cache):
+        """
+        Keep a code cache in sync with the database behind an engine.
+
+        Starts the watcher for this process if it isn't running (threads don't survive a fork).
+        """
+        with self._lock:
+            self._targets[engine] = cache
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='accounts-version-watcher', daemon=True)
+            self._thread.start()
+
+    def unwatch(self, engine):
+        """Stop syncing the cache of an engine that is about to be disposed"""
+        with self._lock:
+            self._targets.pop(engine, None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                targets = list(self._targets.items())
+            for engine, cache in targets:
+                try:
+                    with engine.connect() as connection:
+                        sync_cache(connection, cache)
+                except Exception as e:
+                    print(f"⚠️  Warning: Could not read accounts version: {e}")
+
+
+version_watcher = AccountsVersionWatcher()
@@ -1,43 +1,188 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, session
-from models import db, MFAAccount
+from flask import Flask, render_template, stream_template, request, redirect, url_for, flash, get_flashed_messages, jsonify, session, Response, stream_with_context, make_response
+from models import db, MFAAccount, AuditEvent, apply_sqlite_pragmas, provisioning_uri
+from tenants import shards, current_tenant, current_engine, current_code_cache
+from accounts_version import sync_accounts_version, version_watcher
+from qr_cache import qr_cache, CONTENT_TYPES
+from fragment_cache import fragment_cache, slot, fill
+from secret_store import secret_store
+from search_index import find_accounts
+from bulk_import import import_accounts
+from metrics import metrics
+from profiler import profiler
+from compression import compressor
+from audit_log import audit_log, ACTIONS as AUDIT_ACTIONS, CLIENT_ACTIONS as AUDIT_CLIENT_ACTIONS
+from step_scheduler import StepScheduler, period_groups
+import totp_engine
+from sqlalchemy import select, update, delete, text
+from sqlalchemy.orm import load_only
+from werkzeug.local import LocalProxy
 import pyotp
 import os
-from config import get_secret_key, get_database_path
+import time
+import threading
+import hashlib
+from datetime import datetime, timezone
+from config import get_secret_key, get_database_path, get_engine_options, get_sqlite_pragmas, get_profiler_options, get_compression_options, get_encryption_options, get_tenant_options, get_audit_options, get_stream_options
+
+try:
+    import msgpack
+except ImportError:
+    # MessagePack responses are optional, JSON is always available
+    msgpack = None
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = get_secret_key()
+# Derive the master key for secrets at rest once, at startup
+secret_store.configure(get_encryption_options())
 # Use environment variable for database path in Docker, fallback to current directory
 database_path = get_database_path()
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = get_engine_options(database_path)
 
 # Initialize database
 db.init_app(app)
 
+# Route each tenant's requests to its own database (TENANT_MODE, off by default)
+shards.init_app(app, get_tenant_options(), get_engine_options(), get_sqlite_pragmas())
+
+# The code cache for the request's accounts: its tenant's, or the process-wide one
+code_cache = LocalProxy(current_code_cache)
+
+# Apply the SQLite performance profile (WAL, busy timeout, ...) to every connection
+with app.app_context():
+    apply_sqlite_pragmas(db.engine, get_sqlite_pragmas())
+    metrics.instrument_engine(db.engine)
+
+# Time every request for /metrics
+metrics.init_app(app)
+
+# Opt-in slow-request log and sampled cProfile runs (SLOW_REQUEST_MS, PROFILE_*)
+with app.app_context():
+    profiler.init_app(app, db.engine, get_profiler_options())
+
+# Negotiated brotli/gzip compression of larger JSON and HTML responses
+compressor.init_app(app, get_compression_options())
+
+# Write-behind audit log of code views and copies (AUDIT_*)
+with app.app_context():
+    audit_log.init_app(app, db.engine, get_audit_options())
+
+# Live code streams each hold a server thread, so a process serves at most MAX_STREAMS of them
+MAX_STREAMS = get_stream_options()['max_streams']
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Maximum number of lookahead codes the code APIs will return
+MAX_CODE_WINDOW = 10
+
+# Number of account cards the dashboard renders per page
+DASHBOARD_PAGE_SIZE = 60
+
+# Characters of dashboard HTML collected before each write to the client
+DASHBOARD_STREAM_BUFFER = 4096
+
+# Maximum page size for the listing APIs, and the largest valid cursor (an account id)
+MAX_PAGE_SIZE = 500
+MAX_CURSOR = 2 ** 63 - 1
+
+# Response shapes for /api/codes: a list of objects, or parallel arrays per field
+CODE_FORMATS = ('rows', 'columnar')
+
+# Fields the listing APIs can return, in response order
+CODE_FIELDS = ('id', 'account_name', 'totp_code', 'remaining_time')
+SEARCH_FIELDS = ('id', 'account_name', 'issuer', 'totp_code', 'remaining_time')
+
+# Batch API actions, and the most account ids one batch operation may list
+BATCH_ACTIONS = ('hide', 'unhide', 'delete', 'set_issuer')
+MAX_BATCH_IDS = 10000
+
+# Export formats as (mimetype, file extension), and how many rows are read from the database at a time
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'otpauth': ('text/plain', 'txt')
+}
+EXPORT_BATCH_SIZE = 500
+
+# Audit events per page of /api/audit when no limit is given
+AUDIT_PAGE_SIZE = 100
+
+_FIELD_GETTERS = {
+    'id': lambda account: account.id,
+    'account_name': lambda account: account.account_name,
+    'issuer': lambda account: account.issuer,
+    'totp_code': lambda account: code_cache.get_code(account),
+    'remaining_time': lambda account: account.get_remaining_time()
+}
+
+def _accounts_changed(account_id):
+    """Drop this process's cached state for an account after a committed write"""
+    code_cache.invalidate(account_id)
+    # Adopt the new shared version right away instead of waiting for the watcher
+    sync_accounts_version(code_cache)
+
 @app.route('/')
 def index():
     """Main dashboard showing all MFA accounts and their current codes"""
     # Check if user wants to show all accounts (including hidden)
     show_all = request.args.get('show_all', 'false').lower() == 'true'
+    # Later pages are loaded lazily by the dashboard as card fragments
+    cursor = request.args.get('cursor', type=int)
+    partial = request.args.get('partial', 'false').lower() == 'true'
     
-    if show_all:
-        accounts = MFAAccount.query.all()
-    else:
-        accounts = MFAAccount.query.filter_by(hidden=False).all()
-    
-    account_data = []
-    
-    for account in accounts:
-        account_data.append({
-            'id': account.id,
-            'account_name': account.account_name,
-            'issuer': account.issuer,
-            'hidden': account.hidden,
-            'totp_code': account.get_totp_code(),
-            'remaining_time': account.get_remaining_time()
-        })
+    accounts, next_cursor = _paginate(_account_query(show_all), cursor, DASHBOARD_PAGE_SIZE)
+    
+    if partial:
+        cards = [_account_card(account, show_all) for account in accounts]
+        response = make_response(render_template('_account_cards.html', cards=cards, show_all=show_all))
+        response.headers.update(_next_cursor_headers(next_cursor))
+        return response
     
-    return render_template('index.html', accounts=account_data, show_all=show_all, theme=session.get('theme', 'light'))
+    # The session can't be saved once streaming starts, so pop the flashed messages now
+    get_flashed_messages(with_categories=True)
+    # Cards are rendered as the template reaches them, after the page head has been sent
+    cards = (_account_card(account, show_all) for account in accounts)
+    stream = stream_template('index.html', accounts=accounts, cards=cards, show_all=show_all,
+                             next_cursor=next_cursor, live_streams=MAX_STREAMS > 0, theme=session.get('theme', 'light'))
+    return Response(_buffered(stream, DASHBOARD_STREAM_BUFFER), mimetype='text/html')
+
+def _remaining_class(remaining_time):
+    """Countdown style for a code about to expire"""
+    if remaining_time <= 10:
+        return 'critical'
+    if remaining_time <= 15:
+        return 'warning'
+    return ''
+
+def _account_card(account, show_all):
+    """Dashboard card for an account: the cached markup with its current code filled in"""
+    parts = fragment_cache.get(
+        (current_tenant(), account.id, account.updated_at, show_all),
+        lambda: render_template('_account_card.html', account=account, show_all=show_all, totp_code=slot('totp_code'),
+                                remaining_time=slot('remaining_time'), remaining_class=slot('remaining_class'))
+    )
+    with profiler.span('codes'):
+        remaining_time = account.get_remaining_time()
+        return fill(parts, {
+            'totp_code': code_cache.get_code(account),
+            'remaining_time': remaining_time,
+            'remaining_class': _remaining_class(remaining_time)
+        })
+
+def _buffered(chunks, size):
+    """Join a template stream's many small strings into chunks of at least size characters"""
+    buffer, buffered = [], 0
+    try:
+        for chunk in chunks:
+            buffer.append(chunk)
+            buffered += len(chunk)
+            if buffered >= size:
+                yield ''.join(buffer)
+                buffer, buffered = [], 0
+        if buffer:
+            yield ''.join(buffer)
+    finally:
+        # Closing the template stream ends its request context if the client went away
+        chunks.close()
 
 @app.route('/add', methods=['GET', 'POST'])
 def add_account():
@@ -59,6 +204,12 @@ def add_account():
             flash(f'Invalid secret format: {str(e)}', 'error')
             return render_template('add_account.html', theme=session.get('theme', 'light'))
         
+        try:
+            digits, period, algorithm = _totp_params_from_form()
+        except ValueError as e:
+            flash(f'Invalid TOTP settings: {str(e)}', 'error')
+            return render_template('add_account.html', theme=session.get('theme', 'light'))
+        
         # Check if account name already exists
         existing = MFAAccount.query.filter_by(account_name=account_name).first()
         if existing:
@@ -69,12 +220,16 @@ def add_account():
         new_account = MFAAccount(
             account_name=account_name,
             secret=secret.upper().replace(' ', ''),  # Normalize secret
-            issuer=issuer
+            issuer=issuer,
+            digits=digits,
+            period=period,
+            algorithm=algorithm
         )
         
         try:
             db.session.add(new_account)
             db.session.commit()
+            _accounts_changed(new_account.id)
             flash(f'Account "{account_name}" added successfully!', 'success')
             return redirect(url_for('index'))
         except Exception as e:
@@ -83,6 +238,19 @@ def add_account():
     
     return render_template('add_account.html', theme=session.get('theme', 'light'))
 
+def _totp_params_from_form(account=None):
+    """
+    Read the TOTP digits, period and algorithm from the submitted form, defaulting to the account's (or the standard) values.
+    
+    Raises:
+        ValueError: If a parameter is not supported (see totp_engine.validate_params)
+    """
+    return totp_engine.validate_params(
+        request.form.get('digits') or getattr(account, 'digits', totp_engine.DEFAULT_DIGITS),
+        request.form.get('period') or getattr(account, 'period', totp_engine.DEFAULT_PERIOD),
+        request.form.get('algorithm') or getattr(account, 'algorithm', totp_engine.DEFAULT_ALGORITHM)
+    )
+
 @app.route('/generate_secret')
 def generate_secret():
     """Generate a random secret for testing purposes"""
@@ -93,6 +261,7 @@ def generate_secret():
 def view_account(account_id):
     """View details for a specific account including QR code"""
     account = MFAAccount.query.get_or_404(account_id)
+    audit_log.record('view', account.id)
     
     account_data = {
         'id': account.id,
@@ -100,13 +269,33 @@ def view_account(account_id):
         'issuer': account.issuer,
         'secret': account.secret,
         'hidden': account.hidden,
-        'totp_code': account.get_totp_code(),
+        'digits': account.digits,
+        'period': account.period,
+        'algorithm': account.algorithm,
+        'totp_code': code_cache.get_code(account),
         'remaining_time': account.get_remaining_time(),
-        'qr_code_image': account.generate_qr_code_image(),
         'qr_code_url': account.get_qr_code_url()
     }
     
-    return render_template('account_detail.html', account=account_data, theme=session.get('theme', 'light'))
+    return render_template('account_detail.html', account=account_data, live_streams=MAX_STREAMS > 0,
+                           theme=session.get('theme', 'light'))
+
+@app.route('/account/<int:account_id>/qr.<any(png, svg):image_format>')
+def account_qr_code(account_id, image_format):
+    """Serve the account's provisioning QR code as a cached PNG or SVG image"""
+    account = MFAAccount.query.get_or_404(account_id)
+    with profiler.span('qr'):
+        image, etag = qr_cache.get(account, image_format)
+    
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(image, mimetype=CONTENT_TYPES[image_format])
+    
+    response.set_etag(etag)
+    # The image encodes the secret, so only the user's browser may keep it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/toggle_hidden/<int:account_id>', methods=['POST'])
 def toggle_hidden(account_id):
@@ -117,6 +306,7 @@ def toggle_hidden(account_id):
     
     try:
         db.session.commit()
+        _accounts_changed(account.id)
         flash(f'Account "{account.account_name}" is now {status}.', 'success')
     except Exception as e:
         db.session.rollback()
@@ -133,10 +323,12 @@ def delete_account(account_id):
     """Delete an MFA account"""
     account = MFAAccount.query.get_or_404(account_id)
     account_name = account.account_name
+    qr_cache.invalidate(account)
     
     try:
         db.session.delete(account)
         db.session.commit()
+        _accounts_changed(account_id)
         flash(f'Account "{account_name}" deleted successfully!', 'success')
     except Exception as e:
         db.session.rollback()
@@ -165,6 +357,12 @@ def edit_account(account_id):
             flash(f'Invalid secret format: {str(e)}', 'error')
             return render_template('edit_account.html', account=account, theme=session.get('theme', 'light'))
         
+        try:
+            digits, period, algorithm = _totp_params_from_form(account)
+        except ValueError as e:
+            flash(f'Invalid TOTP settings: {str(e)}', 'error')
+            return render_template('edit_account.html', account=account, theme=session.get('theme', 'light'))
+        
         # Check if new account name conflicts with existing (excluding current)
         if new_account_name != account.account_name:
             existing = MFAAccount.query.filter_by(account_name=new_account_name).first()
@@ -175,14 +373,22 @@ def edit_account(account_id):
         # Get hidden status (checkbox returns 'on' if checked, otherwise not present)
         hidden = request.form.get('hidden') == 'on'
         
+        # Drop the QR code rendered from the old secret, name, issuer and TOTP settings
+        qr_cache.invalidate(account)
+        
         # Update account
         account.account_name = new_account_name
-        account.secret = new_secret.upper().replace(' ', '')
+        new_secret = new_secret.upper().replace(' ', '')
+        if new_secret != account.secret:
+            # Re-encrypting an unchanged secret would only churn the caches keyed on the stored value
+            account.secret = new_secret
         account.issuer = new_issuer
         account.hidden = hidden
+        account.digits, account.period, account.algorithm = digits, period, algorithm
         
         try:
             db.session.commit()
+            _accounts_changed(account.id)
             flash(f'Account "{new_account_name}" updated successfully!', 'success')
             return redirect(url_for('view_account', account_id=account.id))
         except Exception as e:
@@ -191,69 +397,611 @@ def edit_account(account_id):
     
     return render_template('edit_account.html', account=account, theme=session.get('theme', 'light'))
 
+def _code_window(account, window):
+    """Get the current code plus the next ``window`` codes of the account's period with absolute validity timestamps"""
+    period = account.period
+    step = code_cache.current_step(period=period)
+    
+    return [{
+        'totp_code': code_cache.get_code(account, (step + offset) * period),
+        'valid_from': (step + offset) * period,
+        'valid_until': (step + offset + 1) * period
+    } for offset in range(window + 1)]
+
+def _serialize(account, fields):
+    """Serialize the requested fields of an account, computing its code only if asked for"""
+    return {field: _FIELD_GETTERS[field](account) for field in fields}
+
+def _code_entry(account, window=None, fields=CODE_FIELDS):
+    """Serialize an account's current code (and optional lookahead window) for the code APIs"""
+    entry = _serialize(account, fields)
+    if window is not None:
+        entry['codes'] = _code_window(account, window)
+    return entry
+
+def _account_query(show_all=False, fields=None):
+    """
+    Query for visible accounts, or for every account with show_all.
+    
+    With fields, only the columns needed to serialize them are loaded.
+    """
+    query = MFAAccount.query
+    if not show_all:
+        query = query.filter_by(hidden=False)
+    if fields is not None:
+        columns = {MFAAccount.id, MFAAccount.stored_secret, MFAAccount.period, MFAAccount.digits, MFAAccount.algorithm}
+        columns.update(getattr(MFAAccount, field) for field in fields if field in ('account_name', 'issuer'))
+        query = query.options(load_only(*columns))
+    return query
+
+def _paginate(query, cursor=None, limit=None, through=None):
+    """
+    Get one keyset page of a query ordered by account id, ending at id through if given.
+    
+    Returns:
+        tuple: (accounts, next cursor or None when this is the last page)
+    """
+    query = query.order_by(MFAAccount.id)
+    if cursor is not None:
+        query = query.filter(MFAAccount.id > cursor)
+    if through is not None:
+        query = query.filter(MFAAccount.id <= through)
+    if limit is None:
+        return query.all(), None
+    
+    # Fetch one extra row to know whether there is another page
+    accounts = query.limit(limit + 1).all()
+    if len(accounts) > limit:
+        return accounts[:limit], accounts[limit - 1].id
+    return accounts, None
+
+def _list_codes(show_all=False, window=None, fields=None, cursor=None, limit=None, through=None):
+    """
+    Get code entries for visible accounts, or for every account with show_all.
+    
+    With through, only accounts up to that id are listed, e.g. the dashboard
+    cards loaded so far.
+    
+    Returns:
+        tuple: (entries, headers), where headers carry X-Next-Cursor if there are more pages
+    """
+    accounts, next_cursor = _paginate(_account_query(show_all, fields), cursor, limit, through)
+    entries = [_code_entry(account, window, fields or CODE_FIELDS) for account in accounts]
+    return entries, _next_cursor_headers(next_cursor)
+
+def _next_cursor_headers(next_cursor):
+    """Response headers pointing clients at the next page"""
+    return {'X-Next-Cursor': str(next_cursor)} if next_cursor is not None else {}
+
+def _int_arg(name, minimum, maximum):
+    """
+    Parse an optional bounded integer query parameter.
+    
+    Returns:
+        int or None: The value, None if the parameter was not given
+    
+    Raises:
+        ValueError: If the value is not an integer from minimum to maximum
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    
+    try:
+        value = int(value)
+    except ValueError:
+        value = None
+    if value is None or not minimum <= value <= maximum:
+        raise ValueError(f'{name} must be an integer from {minimum} to {maximum}')
+    return value
+
+def _fields_arg(allowed):
+    """
+    Parse the optional fields=a,b,c selector (id is always included).
+    
+    Returns:
+        tuple or None: Selected fields in canonical order, None if not given
+    
+    Raises:
+        ValueError: If an unknown field is requested
+    """
+    value = request.args.get('fields')
+    if value is None:
+        return None
+    
+    requested = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = requested - set(allowed)
+    if unknown:
+        raise ValueError(f'unknown fields: {", ".join(sorted(unknown))} (allowed: {", ".join(allowed)})')
+    return tuple(field for field in allowed if field == 'id' or field in requested)
+
+def _format_arg():
+    """
+    Parse the optional format=rows|columnar selector.
+    
+    Raises:
+        ValueError: If the format is unknown
+    """
+    value = request.args.get('format', 'rows')
+    if value not in CODE_FORMATS:
+        raise ValueError(f'format must be one of: {", ".join(CODE_FORMATS)}')
+    return value
+
+def _columnar(entries, fields, window=None):
+    """
+    Reshape code entries into parallel arrays, one per field.
+    
+    With a window, codes holds each account's current and lookahead codes,
+    valid_until when its current code expires and period the length of its
+    time step, so the code at position k expires at valid_until + k * period.
+    """
+    payload = {field: [entry[field] for entry in entries] for field in fields}
+    if window is not None:
+        payload['codes'] = [[code['totp_code'] for code in entry['codes']] for entry in entries]
+        payload['valid_until'] = [entry['codes'][0]['valid_until'] for entry in entries]
+        payload['period'] = [entry['codes'][0]['valid_until'] - entry['codes'][0]['valid_from'] for entry in entries]
+    return payload
+
+def _bad_request(error):
+    """JSON error response for an invalid query parameter"""
+    return jsonify({'status': 'error', 'message': str(error)}), 400
+
+def _codes_etag(mimetype='application/json'):
+    """
+    Strong ETag for the code APIs at the current time steps.
+    
+    Derived from the tenant, the current step of every period the accounts use, the shared accounts version
+    counter and the request path and query, so it changes whenever a code rolls over or an
+    account is added, edited, hidden or deleted by any worker process. The remaining_time in a body is as of
+    when it was generated; clients count down from there.
+    """
+    # Another worker process may have changed the accounts
+    sync_accounts_version(code_cache)
+    steps = code_cache.steps()
+    variant = f'{current_tenant()}:{steps}:{code_cache.version}:{request.full_path}:{mimetype}'
+    return hashlib.sha1(variant.encode()).hexdigest()
+
+def _response_mimetype():
+    """Negotiate JSON, or MessagePack if it is installed and the client's Accept header prefers it"""
+    if msgpack is None:
+        return 'application/json'
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-msgpack'], 'application/json')
+
+def _conditional_json(build_payload):
+    """
+    Return 304 Not Modified if the client has the current payload, else the JSON
+    (or MessagePack, see _response_mimetype) from build_payload().
+    
+    build_payload() may return a (payload, headers) tuple to add response headers.
+    """
+    mimetype = _response_mimetype()
+    etag = _codes_etag(mimetype)
+    
+    # Weak comparison, since compressed responses carry a weak ETag
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        with profiler.span('codes'):
+            payload = build_payload()
+        headers = {}
+        if isinstance(payload, tuple):
+            payload, headers = payload
+        with profiler.span('serialize'):
+            if mimetype == 'application/x-msgpack':
+                response = Response(msgpack.packb(payload), mimetype=mimetype)
+            else:
+                response = jsonify(payload)
+        response.headers.update(headers)
+    
+    if msgpack is not None:
+        response.vary.add('Accept')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def _event_stream(build_payload, periods=None):
+    """
+    Yield Server-Sent Events with the payload from build_payload().
+    
+    A new event is pushed whenever the accounts change and at every time step
+    boundary of the periods the payload depends on: periods() if given (it may
+    change as build_payload() runs), else every period the accounts use. The
+    stream ends if build_payload() returns None.
+    """
+    # Wakes this process's streams when another worker changes the accounts
+    version_watcher.ensure_started(current_engine(), current_code_cache())
+    yield 'retry: 2000\n\n'
+    
+    scheduler = None
+    while True:
+        sync_accounts_version(code_cache)
+        version = code_cache.version
+        payload = build_payload()
+        # Don't hold a read transaction open while the client is idle
+        db.session.close()
+        
+        if payload is None:
+            yield 'event: deleted\ndata: {}\n\n'
+            return
+        
+        yield f'event: codes\ndata: {app.json.dumps(payload)}\n\n'
+        
+        stream_periods = periods() if periods is not None else code_cache.periods
+        if scheduler is None or scheduler.periods != period_groups(stream_periods):
+            scheduler = StepScheduler(stream_periods)
+        # Sleep until one of our period groups rolls over, or the accounts change
+        while not code_cache.wait_for_change(version, scheduler.next_boundary() - time.time()):
+            if scheduler.due():
+                break
+
+def _event_stream_response(events):
+    """
+    Wrap an event generator in a streaming text/event-stream response.
+    
+    Returns 503 instead if this process already serves MAX_STREAMS streams,
+    and the page falls back to polling the code APIs.
+    """
+    if not _stream_slots.acquire(blocking=False):
+        response = jsonify({'status': 'error', 'message': 'Too many live streams, poll the code APIs instead'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(totp_engine.DEFAULT_PERIOD)
+        return response
+    
+    response = Response(
+        stream_with_context(events),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # The server closes the response when the client goes away, which frees the slot
+    response.call_on_close(_stream_slots.release)
+    return response
+
 @app.route('/api/codes')
 def get_all_codes():
     """API endpoint to get all current TOTP codes (for auto-refresh)"""
     # Check if user wants to show all accounts (including hidden)
     show_all = request.args.get('show_all', 'false').lower() == 'true'
     
-    if show_all:
-        accounts = MFAAccount.query.all()
-    else:
-        accounts = MFAAccount.query.filter_by(hidden=False).all()
+    try:
+        window = _int_arg('window', 0, MAX_CODE_WINDOW)
+        cursor = _int_arg('cursor', 0, MAX_CURSOR)
+        limit = _int_arg('limit', 1, MAX_PAGE_SIZE)
+        through = _int_arg('through', 0, MAX_CURSOR)
+        fields = _fields_arg(CODE_FIELDS)
+        code_format = _format_arg()
+    except ValueError as e:
+        return _bad_request(e)
     
-    codes = []
+    def build_payload():
+        entries, headers = _list_codes(show_all, window, fields, cursor, limit, through)
+        if code_format == 'columnar':
+            return _columnar(entries, fields or CODE_FIELDS, window), headers
+        return entries, headers
     
-    for account in accounts:
-        codes.append({
-            'id': account.id,
-            'account_name': account.account_name,
-            'totp_code': account.get_totp_code(),
-            'remaining_time': account.get_remaining_time()
-        })
+    return _conditional_json(build_payload)
+
+@app.route('/api/codes/stream')
+def stream_all_codes():
+    """Server-Sent Events stream of all current TOTP codes, pushed once per time step"""
+    show_all = request.args.get('show_all', 'false').lower() == 'true'
     
-    return jsonify(codes)
+    try:
+        window = _int_arg('window', 0, MAX_CODE_WINDOW)
+        through = _int_arg('through', 0, MAX_CURSOR)
+        fields = _fields_arg(CODE_FIELDS)
+        code_format = _format_arg()
+    except ValueError as e:
+        return _bad_request(e)
+    
+    def build_payload():
+        entries = _list_codes(show_all, window, fields, through=through)[0]
+        if code_format == 'columnar':
+            return _columnar(entries, fields or CODE_FIELDS, window)
+        return entries
+    
+    return _event_stream_response(_event_stream(build_payload))
 
 @app.route('/api/code/<int:account_id>')
 def get_single_code(account_id):
     """API endpoint to get TOTP code for a specific account"""
-    account = MFAAccount.query.get_or_404(account_id)
+    try:
+        window = _int_arg('window', 0, MAX_CODE_WINDOW)
+        fields = _fields_arg(CODE_FIELDS) or CODE_FIELDS
+    except ValueError as e:
+        return _bad_request(e)
     
-    return jsonify({
-        'id': account.id,
-        'account_name': account.account_name,
-        'totp_code': account.get_totp_code(),
-        'remaining_time': account.get_remaining_time()
-    })
+    # The detail page marks its repeat polls, which were audited with its first one like a stream connect
+    repeat_poll = request.args.get('poll') == '1'
+    
+    def build_payload():
+        account = MFAAccount.query.get_or_404(account_id)
+        # Only audited when the code is actually sent, not on 304 revalidations
+        if not repeat_poll:
+            audit_log.record('code', account.id)
+        return _code_entry(account, window, fields)
+    
+    return _conditional_json(build_payload)
+
+@app.route('/api/code/<int:account_id>/stream')
+def stream_single_code(account_id):
+    """Server-Sent Events stream of the TOTP code for a specific account, pushed once per time step of its period"""
+    periods = {MFAAccount.query.get_or_404(account_id).period}
+    
+    try:
+        window = _int_arg('window', 0, MAX_CODE_WINDOW)
+        fields = _fields_arg(CODE_FIELDS) or CODE_FIELDS
+    except ValueError as e:
+        return _bad_request(e)
+    
+    def build_payload():
+        account = db.session.get(MFAAccount, account_id)
+        if account is None:
+            return None
+        # The account's period may have been edited since the stream started
+        periods.clear()
+        periods.add(account.period)
+        return _code_entry(account, window, fields)
+    
+    response = _event_stream_response(_event_stream(build_payload, lambda: periods))
+    # Audited once per connect, unless the stream was refused and the page polls instead
+    if response.status_code == 200:
+        audit_log.record('code', account_id)
+    return response
+
+def _search_results(query, fields=None, cursor=None, limit=None):
+    """
+    Get search result entries for accounts matching the query in name or issuer.
+    
+    Without a query every account is listed in keyset pages. Ranked search
+    results are bounded by limit only, since they are not ordered by id.
+    
+    Returns:
+        tuple: (entries, headers), where headers carry X-Next-Cursor if there are more pages
+    """
+    next_cursor = None
+    if not query:
+        # Return all accounts if no query provided
+        accounts, next_cursor = _paginate(_account_query(True, fields), cursor, limit)
+    else:
+        # Search the index for accounts matching the query in account_name or issuer
+        accounts = find_accounts(query, limit)
+    
+    results = [_serialize(account, fields or SEARCH_FIELDS) for account in accounts]
+    return results, _next_cursor_headers(next_cursor)
 
 @app.route('/api/search')
 def search_accounts():
     """API endpoint to search for accounts by name or issuer"""
     query = request.args.get('q', '').strip()
     
-    if not query:
-        # Return all accounts if no query provided
-        accounts = MFAAccount.query.all()
-    else:
-        # Search for accounts matching the query in account_name or issuer
-        accounts = MFAAccount.query.filter(
-            db.or_(
-                MFAAccount.account_name.ilike(f'%{query}%'),
-                MFAAccount.issuer.ilike(f'%{query}%')
-            )
-        ).all()
+    try:
+        cursor = _int_arg('cursor', 0, MAX_CURSOR)
+        limit = _int_arg('limit', 1, MAX_PAGE_SIZE)
+        fields = _fields_arg(SEARCH_FIELDS)
+    except ValueError as e:
+        return _bad_request(e)
+    
+    if query and cursor is not None:
+        return _bad_request('cursor is only supported when listing without a query')
     
+    return _conditional_json(lambda: _search_results(query, fields, cursor, limit))
+
+@app.route('/api/import', methods=['POST'])
+def import_accounts_api():
+    """API endpoint to bulk import otpauth:// URIs or authenticator export payloads, one per line"""
+    # Read the upload line by line instead of loading it into memory
+    upload = request.files.get('file')
+    lines = upload.stream if upload else request.stream
+
+    report = import_accounts(lines)
+    if report['imported']:
+        _accounts_changed(None)
+
+    return jsonify({'status': 'success', **report})
+
+def _batch_operations(data):
+    """
+    Validate a batch request body of the form {"operations": [{"action": ..., "ids": [...]}, ...]}.
+
+    Returns:
+        list: (action, ids, issuer) tuples
+
+    Raises:
+        ValueError: If the body or any operation is invalid
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('operations must be a non-empty list')
+
+    parsed = []
+    for operation in operations:
+        action = operation.get('action') if isinstance(operation, dict) else None
+        if action not in BATCH_ACTIONS:
+            raise ValueError(f'action must be one of: {", ".join(BATCH_ACTIONS)}')
+
+        ids = operation.get('ids')
+        if (not isinstance(ids, list) or not 0 < len(ids) <= MAX_BATCH_IDS
+                or not all(isinstance(account_id, int) and not isinstance(account_id, bool) for account_id in ids)):
+            raise ValueError(f'ids must be a list of 1 to {MAX_BATCH_IDS} account ids')
+
+        issuer = operation.get('issuer')
+        if action == 'set_issuer' and (not isinstance(issuer, str) or not issuer or len(issuer) > 100):
+            raise ValueError('set_issuer needs an issuer of 1 to 100 characters')
+
+        parsed.append((action, ids, issuer))
+    return parsed
+
+@app.route('/api/accounts/batch', methods=['POST'])
+def batch_update_accounts():
+    """API endpoint to hide, unhide, delete or re-issue many accounts in one transaction"""
+    try:
+        operations = _batch_operations(request.get_json(silent=True))
+    except ValueError as e:
+        return _bad_request(e)
+
     results = []
-    for account in accounts:
-        results.append({
-            'id': account.id,
-            'account_name': account.account_name,
-            'issuer': account.issuer,
-            'totp_code': account.get_totp_code(),
-            'remaining_time': account.get_remaining_time()
-        })
+    try:
+        for action, ids, issuer in operations:
+            if action in ('delete', 'set_issuer'):
+                # Drop QR codes rendered from the values about to change
+                for row in db.session.execute(
+                    select(MFAAccount.stored_secret, MFAAccount.account_name, MFAAccount.issuer,
+                           MFAAccount.digits, MFAAccount.period, MFAAccount.algorithm).where(MFAAccount.id.in_(ids))
+                ):
+                    qr_cache.invalidate(row)
+
+            if action == 'delete':
+                statement = delete(MFAAccount)
+            else:
+                values = {'issuer': issuer} if action == 'set_issuer' else {'hidden': action == 'hide'}
+                statement = update(MFAAccount).values(**values)
+
+            result = db.session.execute(
+                statement.where(MFAAccount.id.in_(ids)).execution_options(synchronize_session=False)
+            )
+            results.append({'action': action, 'affected': result.rowcount})
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'status': 'error', 'message': f'Error updating accounts: {str(e)}'}), 500
+
+    _accounts_changed(None)
+    return jsonify({'status': 'success', 'results': results})
+
+def _export_lines(export_format):
+    """Yield one export line per account, reading the table in batches"""
+    rows = db.session.execute(
+        select(MFAAccount.id, MFAAccount.account_name, MFAAccount.stored_secret, MFAAccount.issuer, MFAAccount.hidden,
+               MFAAccount.digits, MFAAccount.period, MFAAccount.algorithm)
+        .order_by(MFAAccount.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    for row in rows:
+        # Decrypted directly, a one-off export shouldn't fill the key cache
+        secret = secret_store.decrypt(row.stored_secret)
+        if export_format == 'otpauth':
+            yield provisioning_uri(secret, row.account_name, row.issuer, row.digits, row.period, row.algorithm) + '\n'
+        else:
+            yield app.json.dumps({
+                'id': row.id,
+                'account_name': row.account_name,
+                'issuer': row.issuer,
+                'secret': secret,
+                'hidden': row.hidden,
+                'digits': row.digits,
+                'period': row.period,
+                'algorithm': row.algorithm
+            }) + '\n'
+
+@app.route('/api/export')
+def export_accounts():
+    """API endpoint to stream every account as NDJSON or otpauth:// URIs"""
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return _bad_request(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    audit_log.record('export', None)
+    response = Response(stream_with_context(_export_lines(export_format)), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=mfa-accounts.{extension}'
+    # Exports contain secrets
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+@app.route('/api/audit', methods=['POST'])
+def record_audit_event():
+    """API endpoint for the browser to report copying an account's code, secret or setup URI"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = {}
+    action = data.get('action')
+    account_id = data.get('account_id')
+    if action not in AUDIT_CLIENT_ACTIONS:
+        return _bad_request(f'action must be one of: {", ".join(AUDIT_CLIENT_ACTIONS)}')
+    if not isinstance(account_id, int) or isinstance(account_id, bool):
+        return _bad_request('account_id must be an account id')
+    
+    account = MFAAccount.query.get_or_404(account_id)
+    audit_log.record(action, account.id)
+    return jsonify({'status': 'accepted'}), 202
+
+def _datetime_arg(name):
+    """
+    Parse an optional ISO 8601 timestamp query parameter, taken as UTC if it has no offset.
+    
+    Raises:
+        ValueError: If the value is not an ISO 8601 timestamp
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be an ISO 8601 timestamp') from None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    # Stored without an offset, in UTC
+    return parsed.replace(tzinfo=None)
+
+@app.route('/api/audit')
+def get_audit_events():
+    """API endpoint to page through the audit log, newest first, optionally by account, action and time range"""
+    action = request.args.get('action')
+    try:
+        account_id = _int_arg('account_id', 0, MAX_CURSOR)
+        cursor = _int_arg('cursor', 0, MAX_CURSOR)
+        limit = _int_arg('limit', 1, MAX_PAGE_SIZE) or AUDIT_PAGE_SIZE
+        since = _datetime_arg('since')
+        until = _datetime_arg('until')
+        if action is not None and action not in AUDIT_ACTIONS:
+            raise ValueError(f'action must be one of: {", ".join(AUDIT_ACTIONS)}')
+    except ValueError as e:
+        return _bad_request(e)
+    
+    # Keyset pages by descending id, served by the (account_id, id) and (action, id) indexes
+    query = AuditEvent.query.order_by(AuditEvent.id.desc())
+    if account_id is not None:
+        query = query.filter(AuditEvent.account_id == account_id)
+    if action is not None:
+        query = query.filter(AuditEvent.action == action)
+    if since is not None:
+        query = query.filter(AuditEvent.occurred_at >= since)
+    if until is not None:
+        query = query.filter(AuditEvent.occurred_at < until)
+    if cursor is not None:
+        query = query.filter(AuditEvent.id < cursor)
     
-    return jsonify(results)
+    events = query.limit(limit + 1).all()
+    next_cursor = events[limit - 1].id if len(events) > limit else None
+    response = jsonify([event.to_dict() for event in events[:limit]])
+    response.headers.update(_next_cursor_headers(next_cursor))
+    return response
+
+@app.route('/api/audit/stats')
+def get_audit_stats():
+    """API endpoint to get this process's audit queue depth and recorded/dropped/written counters"""
+    return jsonify(audit_log.stats())
+
+@app.route('/api/cache/stats')
+def get_cache_stats():
+    """API endpoint to get TOTP code cache hit/miss counters"""
+    return jsonify(code_cache.stats())
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus metrics for this process"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def healthz():
+    """Cheap health check: confirms the database answers, without rendering templates or computing codes"""
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    return jsonify({'status': 'ok'})
 
 @app.route('/api/theme', methods=['POST'])
 def set_theme():
@@ -283,17 +1031,11 @@ def internal_error(error):
 
 if __name__ == '__main__':
     from config import get_port, get_host, is_production
+    from migrations import upgrade
     
     with app.app_context():
-        db.create_all()
-        # Run migration to add hidden column if it doesn't exist
-        try:
-            from migrate_add_hidden_column import migrate
-            migrate()
-        except Exception as e:
-            # Migration will be handled automatically by SQLAlchemy if column doesn't exist
-            # This is just a safety check for existing databases
-            pass
+        # Create tables and apply any pending schema migrations
+        upgrade(db.engine)
     
     # Get configuration from environment variables
     host = get_host()
@@ -0,0 +1,492 @@
+"""
+Asynchronous (ASGI) serving path for MFA Manager's read-only code APIs
+Serves GET /api/codes, /api/code/<account_id> and their /stream variants
+with the same parameters, payloads and ETags as the Flask app (JSON only),
+for deployments with thousands of open dashboards. Every live stream is a
+coroutine waiting on an asyncio.Event rather than a worker thread.
+
+Each database's accounts are held in an in-memory snapshot of MFAAccount
+rows, read through on demand and reloaded in a worker thread only when the
+shared accounts version (see accounts_version.py) moves. A single timer
+task sleeps until the next step boundary of any period in use (see
+step_scheduler.py) and publishes once per stream variant whose accounts
+rolled over: the event is built once and the same bytes are sent to every
+subscriber.
+
+Run it next to the Flask app and route the code API paths to it, e.g.:
+    uvicorn asgi:application --host 127.0.0.1 --port 4571
+Tenants (TENANT_MODE) are routed the same way as in the Flask app, and code
+fetches and stream connects for one account are audited like its routes.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import time
+from contextlib import contextmanager
+from itertools import islice
+from urllib.parse import parse_qs
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session, load_only
+
+import migrations
+from app import app, CODE_FIELDS, CODE_FORMATS, MAX_CODE_WINDOW, MAX_CURSOR, MAX_PAGE_SIZE
+from accounts_version import read_accounts_version
+from audit_log import audit_log
+from code_cache import TOTPCodeCache
+from models import db, MFAAccount
+from tenants import shards, split_tenant_prefix, UnknownTenant
+from step_scheduler import StepScheduler, period_groups
+
+# Seconds between checks of the accounts version, like the Flask app's version watcher
+VERSION_POLL_INTERVAL = 1.0
+
+_ACCOUNT_COLUMNS = (MFAAccount.id, MFAAccount.account_name, MFAAccount.issuer, MFAAccount.hidden,
+                    MFAAccount.stored_secret, MFAAccount.period, MFAAccount.digits, MFAAccount.algorithm)
+
+with app.app_context():
+    _default_engine = db.engine
+
+
+def _dumps(payload):
+    # Matches Flask's compact, sorted JSON so both paths send identical bodies
+    return json.dumps(payload, sort_keys=True, separators=(',', ':')).encode()
+
+
+class Snapshot:
+    """In-memory copy of one database's accounts, reloaded only when its accounts version moves"""
+
+    def __init__(self, tenant):
+        self.tenant = tenant
+        self.version = None
+        self.accounts = []
+        self.ids = []
+        self.by_id = {}
+        self.code_cache = TOTPCodeCache()
+        self.scheduler = StepScheduler()
+        self.channels = {}
+        self.checked = 0.0
+        self.last_used = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @contextmanager
+    def _connect(self):
+        if not self.tenant:
+            with _default_engine.connect() as connection:
+                yield connection
+            return
+        shard = shards.acquire(self.tenant)
+        try:
+            with shard.engine.connect() as connection:
+                yield connection
+        finally:
+            shards.release(shard)
+
+    def _read(self, known_version):
+        """Read the accounts version and, if it isn't known_version, every account (runs in a worker thread)"""
+        with self._connect() as connection:
+            # Read the version first: rows newer than it only cause one extra reload
+            version = read_accounts_version(connection)
+            if version == known_version:
+                return version, None
+            with Session(bind=connection) as session:
+                accounts = session.scalars(
+                    select(MFAAccount).options(load_only(*_ACCOUNT_COLUMNS)).order_by(MFAAccount.id)
+                ).all()
+                session.expunge_all()
+            return version, accounts
+
+    async def refresh(self, max_age=0.0):
+        """
+        Reload the accounts if they changed since the last check, at most once per max_age seconds.
+
+        Returns:
+            bool: True if the accounts were reloaded
+
+        Raises:
+            ValueError, UnknownTenant: If the snapshot's tenant is invalid or has no database
+        """
+        async with self._lock:
+            if time.monotonic() - self.checked < max_age:
+                return False
+            version, accounts = await asyncio.to_thread(self._read, self.version)
+            self.checked = time.monotonic()
+            if accounts is None:
+                return False
+            self.accounts = accounts
+            self.ids = [account.id for account in accounts]
+            self.by_id = {account.id: account for account in accounts}
+            self.version = version
+            periods = {account.period for account in accounts}
+            self.code_cache.sync(version, periods)
+            if self.scheduler.periods != period_groups(periods):
+                self.scheduler = StepScheduler(periods)
+            return True
+
+    def account_periods(self, account_id):
+        """The period of an account as a set, empty if there's no such account"""
+        account = self.by_id.get(account_id)
+        return {account.period} if account is not None else set()
+
+    def _entry(self, account, fields, window, now):
+        period = account.period
+        step = int(now) // period
+        entry = {}
+        for field in fields:
+            if field == 'totp_code':
+                entry[field] = self.code_cache.get_code(account, step * period)
+            elif field == 'remaining_time':
+                entry[field] = period - int(now) % period
+            else:
+                entry[field] = getattr(account, field)
+        if window is not None:
+            entry['codes'] = [{
+                'totp_code': self.code_cache.get_code(account, (step + offset) * period),
+                'valid_from': (step + offset) * period,
+                'valid_until': (step + offset + 1) * period
+            } for offset in range(window + 1)]
+        return entry
+
+    def codes(self, show_all, fields, window, code_format, cursor=None, limit=None, through=None):
+        """
+        Get the /api/codes payload for the current time steps, up to account id through if given.
+
+        Returns:
+            tuple: (payload, next cursor or None when this is the last page)
+        """
+        now = time.time()
+        start = bisect.bisect_right(self.ids, cursor) if cursor is not None else 0
+        stop = bisect.bisect_right(self.ids, through) if through is not None else None
+        visible = (account for account in islice(self.accounts, start, stop) if show_all or not account.hidden)
+        if limit is None:
+            page, next_cursor = list(visible), None
+        else:
+            page = list(islice(visible, limit + 1))
+            next_cursor = page[limit - 1].id if len(page) > limit else None
+            page = page[:limit]
+
+        entries = [self._entry(account, fields, window, now) for account in page]
+        if code_format != 'columnar':
+            return entries, next_cursor
+
+        # Same shape as the Flask app's _columnar()
+        payload = {field: [entry[field] for entry in entries] for field in fields}
+        if window is not None:
+            payload['codes'] = [[code['totp_code'] for code in entry['codes']] for entry in entries]
+            payload['valid_until'] = [entry['codes'][0]['valid_until'] for entry in entries]
+            payload['period'] = [account.period for account in page]
+        return payload, next_cursor
+
+    def code(self, account_id, fields, window):
+        """Get the /api/code/<account_id> payload for the current time step, or None if there's no such account"""
+        account = self.by_id.get(account_id)
+        if account is None:
+            return None
+        return self._entry(account, fields, window, time.time())
+
+
+class Channel:
+    """The latest event of one stream variant, built once per publish and shared by all its subscribers"""
+
+    def __init__(self, build, periods):
+        self.build = build
+        # Periods whose rollover changes the payload, as a callable since accounts can be edited
+        self.periods = periods
+        self.message = None
+        self.subscribers = 0
+        self.published = asyncio.Event()
+
+    async def publish(self):
+        """Build the current event off the event loop and wake every subscriber"""
+        payload = await asyncio.to_thread(self.build)
+        self.message = None if payload is None else b'event: codes\ndata: ' + _dumps(payload) + b'\n\n'
+        published, self.published = self.published, asyncio.Event()
+        published.set()
+
+
+class CodeServer:
+    """ASGI application serving the read-only code APIs from in-memory snapshots"""
+
+    def __init__(self, poll_interval=VERSION_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self.snapshots = {}
+        self._ticker = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._handle(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                # Cheap when the schema is current, as it is when the Flask app already runs
+                await asyncio.to_thread(migrations.upgrade, _default_engine)
+                self._ensure_ticker()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _ensure_ticker(self):
+        if self._ticker is None or self._ticker.done():
+            self._ticker = asyncio.get_running_loop().create_task(self._tick())
+
+    async def shutdown(self):
+        """Stop the timer task"""
+        if self._ticker is not None:
+            self._ticker.cancel()
+            try:
+                await self._ticker
+            except asyncio.CancelledError:
+                pass
+            self._ticker = None
+
+    async def _tick(self):
+        while True:
+            now = time.time()
+            next_boundary = min((snapshot.scheduler.next_boundary() for snapshot in self.snapshots.values()
+                                 if snapshot.channels), default=now + self.poll_interval)
+            # Wake just after the boundary, or sooner to notice account changes
+            await asyncio.sleep(min(next_boundary - now + 0.001, self.poll_interval))
+            await self.poll()
+
+    async def poll(self):
+        """Reload changed snapshots and publish to every stream whose accounts changed or whose codes rolled over"""
+        for tenant, snapshot in list(self.snapshots.items()):
+            if not snapshot.channels:
+                if time.monotonic() - snapshot.last_used > shards.idle_seconds:
+                    del self.snapshots[tenant]
+                continue
+            try:
+                changed = await snapshot.refresh()
+            except Exception as e:
+                print(f"⚠️  Warning: Could not reload accounts for the code streams: {e}")
+                continue
+            rolled = snapshot.scheduler.due()
+            for channel in list(snapshot.channels.values()):
+                if changed or rolled & channel.periods():
+                    await channel.publish()
+
+    async def snapshot(self, tenant):
+        """Get the up-to-date snapshot of a tenant's accounts ('' for the shared database)"""
+        snapshot = self.snapshots.get(tenant)
+        if snapshot is None:
+            snapshot = Snapshot(tenant)
+            await snapshot.refresh()
+            snapshot = self.snapshots.setdefault(tenant, snapshot)
+        else:
+            await snapshot.refresh(max_age=self.poll_interval)
+        snapshot.last_used = time.monotonic()
+        return snapshot
+
+    def _route(self, scope, headers):
+        """Get (tenant, path) for a request, the tenant being None if tenants are on but it names none"""
+        path = scope['path']
+        if shards.mode == 'off':
+            return '', path
+        if shards.mode == 'header':
+            name = headers.get(shards.header.lower())
+        elif shards.mode == 'subdomain':
+            name = shards.tenant_for_host(headers.get('host', ''))
+        else:
+            name, path = split_tenant_prefix(path)
+        return (name.lower() if name else None), path
+
+    async def _handle(self, scope, receive, send):
+        headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+        tenant, path = self._route(scope, headers)
+        parts = path.strip('/').split('/')
+        account_id = None
+        if parts[:2] == ['api', 'codes'] and len(parts) <= 3:
+            stream = parts[2:] == ['stream']
+        elif parts[:2] == ['api', 'code'] and len(parts) in (3, 4) and parts[2].isdigit():
+            account_id = int(parts[2])
+            stream = parts[3:] == ['stream']
+        else:
+            stream = None
+        extra_headers = [(b'vary', shards.header.encode())] if shards.mode == 'header' else []
+
+        if stream is None or tenant is None:
+            return await _send_json(send, 404, {'status': 'error', 'message': 'Not found'}, extra_headers)
+        if scope['method'] != 'GET':
+            return await _send_json(send, 405, {'status': 'error', 'message': 'Method not allowed'}, extra_headers)
+
+        query_string = scope.get('query_string', b'').decode('latin-1')
+        try:
+            query = _Query(parse_qs(query_string, keep_blank_values=True))
+            show_all = query.get('show_all', 'false').lower() == 'true'
+            window = query.int_arg('window', 0, MAX_CODE_WINDOW)
+            fields = query.fields_arg(CODE_FIELDS)
+            if account_id is None:
+                code_format = query.format_arg()
+                cursor = None if stream else query.int_arg('cursor', 0, MAX_CURSOR)
+                limit = None if stream else query.int_arg('limit', 1, MAX_PAGE_SIZE)
+                through = query.int_arg('through', 0, MAX_CURSOR)
+        except ValueError as e:
+            return await _send_json(send, 400, {'status': 'error', 'message': str(e)}, extra_headers)
+
+        try:
+            snapshot = await self.snapshot(tenant)
+        except ValueError as e:
+            return await _send_json(send, 400, {'status': 'error', 'message': str(e)}, extra_headers)
+        except UnknownTenant as e:
+            return await _send_json(send, 404, {'status': 'error', 'message': str(e)}, extra_headers)
+
+        if account_id is None:
+            key = ('codes', show_all, fields, window, code_format, through)
+
+            def build():
+                return snapshot.codes(show_all, fields or CODE_FIELDS, window, code_format, through=through)[0]
+
+            def periods():
+                return snapshot.scheduler.periods
+        else:
+            if snapshot.code(account_id, (), None) is None:
+                return await _send_json(send, 404, {'status': 'error', 'message': 'Not found'}, extra_headers)
+            key = ('code', account_id, fields, window)
+
+            def build():
+                return snapshot.code(account_id, fields or CODE_FIELDS, window)
+
+            def periods():
+                return snapshot.account_periods(account_id)
+
+        if stream:
+            if account_id is not None:
+                _audit_code(scope, headers, tenant, account_id)
+            return await self._stream(snapshot, key, build, periods, receive, send, extra_headers)
+
+        # Same ETag as the Flask app for the same request, so clients can revalidate against either
+        steps = snapshot.code_cache.steps()
+        variant = f'{snapshot.tenant}:{steps}:{snapshot.version}:{path}?{query_string}:application/json'
+        etag = hashlib.sha1(variant.encode()).hexdigest()
+        extra_headers += [(b'etag', f'"{etag}"'.encode()), (b'cache-control', b'no-cache')]
+        if _etag_matches(headers.get('if-none-match'), etag):
+            return await _send(send, 304, b'', extra_headers)
+
+        if account_id is None:
+            payload, next_cursor = await asyncio.to_thread(
+                snapshot.codes, show_all, fields or CODE_FIELDS, window, code_format, cursor, limit, through
+            )
+            if next_cursor is not None:
+                extra_headers.append((b'x-next-cursor', str(next_cursor).encode()))
+        else:
+            # Only audited when the code is actually sent, not on 304 revalidations or a page's repeat polls
+            if query.get('poll') != '1':
+                _audit_code(scope, headers, tenant, account_id)
+            payload = await asyncio.to_thread(build)
+        await _send_json(send, 200, payload, extra_headers)
+
+    async def _stream(self, snapshot, key, build, periods, receive, send, extra_headers):
+        """Send a channel's events until the client disconnects or the account is deleted"""
+        channel = snapshot.channels.get(key)
+        if channel is None:
+            channel = Channel(build, periods)
+            await channel.publish()
+            # Another client may have created the channel meanwhile
+            channel = snapshot.channels.setdefault(key, channel)
+        channel.subscribers += 1
+        self._ensure_ticker()
+
+        disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+        try:
+            await send({'type': 'http.response.start', 'status': 200, 'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'), (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no')
+            ] + extra_headers})
+            await send({'type': 'http.response.body', 'body': b'retry: 2000\n\n', 'more_body': True})
+            while True:
+                published = channel.published
+                if channel.message is None:
+                    await send({'type': 'http.response.body', 'body': b'event: deleted\ndata: {}\n\n'})
+                    return
+                await send({'type': 'http.response.body', 'body': channel.message, 'more_body': True})
+
+                waiter = asyncio.ensure_future(published.wait())
+                await asyncio.wait((waiter, disconnected), return_when=asyncio.FIRST_COMPLETED)
+                if disconnected.done():
+                    waiter.cancel()
+                    return
+        except OSError:
+            # The client went away mid-send
+            return
+        finally:
+            disconnected.cancel()
+            channel.subscribers -= 1
+            if not channel.subscribers and snapshot.channels.get(key) is channel:
+                del snapshot.channels[key]
+
+
+class _Query:
+    """Query parameters, validated like the Flask app's _int_arg, _fields_arg and _format_arg"""
+
+    def __init__(self, params):
+        self.params = params
+
+    def get(self, name, default=None):
+        values = self.params.get(name)
+        return values[0] if values else default
+
+    def int_arg(self, name, minimum, maximum):
+        value = self.get(name)
+        if value is None:
+            return None
+        try:
+            value = int(value)
+        except ValueError:
+            value = None
+        if value is None or not minimum <= value <= maximum:
+            raise ValueError(f'{name} must be an integer from {minimum} to {maximum}')
+        return value
+
+    def fields_arg(self, allowed):
+        value = self.get('fields')
+        if value is None:
+            return None
+        requested = {field.strip() for field in value.split(',') if field.strip()}
+        unknown = requested - set(allowed)
+        if unknown:
+            raise ValueError(f'unknown fields: {", ".join(sorted(unknown))} (allowed: {", ".join(allowed)})')
+        return tuple(field for field in allowed if field == 'id' or field in requested)
+
+    def format_arg(self):
+        value = self.get('format', 'rows')
+        if value not in CODE_FORMATS:
+            raise ValueError(f'format must be one of: {", ".join(CODE_FORMATS)}')
+        return value
+
+
+def _audit_code(scope, headers, tenant, account_id):
+    """Record a 'code' audit event like the Flask app's code routes, for the client of the ASGI request"""
+    client = scope.get('client')
+    audit_log.record_for('code', account_id, tenant, client[0] if client else None, headers.get('user-agent'))
+
+
+def _etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    tags = {tag.strip().removeprefix('W/').strip('"') for tag in if_none_match.split(',')}
+    return '*' in tags or etag in tags
+
+
+async def _wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def _send(send, status, body, headers):
+    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def _send_json(send, status, payload, headers):
+    await _send(send, status, _dumps(payload) + b'\n', [(b'content-type', b'application/json')] + headers)
+
+
+application = CodeServer()
@@ -0,0 +1,204 @@
+"""
+Write-behind audit log for MFA Manager
+Records who viewed, copied or exported account codes and secrets without adding
+a write to the request: events go into a bounded in-memory queue and a
+background thread writes them in batches, one transaction per database
+(the tenant's, if tenants are on). When the queue is full new events are
+dropped and counted instead of slowing requests down. Queued events are
+written before the process exits.
+
+Everything is configured through config.get_audit_options().
+"""
+
+import atexit
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flask import request
+from sqlalchemy import insert
+
+from models import AuditEvent
+from tenants import shards, current_tenant
+
+# Actions the server records, and the ones browsers report themselves (copies happen client-side).
+# An export covers every account, so it is one event without an account id.
+ACTIONS = ('view', 'code', 'copy_code', 'copy_secret', 'copy_uri', 'export')
+CLIENT_ACTIONS = ('copy_code', 'copy_secret', 'copy_uri')
+
+# Seconds close() waits for queued events to be written
+CLOSE_TIMEOUT = 10.0
+
+_STOP = object()
+
+
+class AuditLog:
+    """Bounded queue of audit events drained by a batching writer thread"""
+
+    def __init__(self):
+        self.enabled = False
+        self.batch_size = 500
+        self.flush_interval = 1.0
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self._engine = None
+        self._queue = queue.Queue(maxsize=10000)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, engine, options):
+        """Write events for the shared database through engine, and flush the queue when the process exits"""
+        self._engine = engine
+        self.configure(options)
+        atexit.register(self.close)
+
+    def configure(self, options):
+        """Apply settings from config.get_audit_options(), writing any events queued under the old ones first"""
+        self.close()
+        self.enabled = options['enabled']
+        self.batch_size = options['batch_size']
+        self.flush_interval = options['flush_ms'] / 1000
+        self._queue = queue.Queue(maxsize=options['queue_size'])
+
+    def record(self, action, account_id):
+        """
+        Queue an event for the current request's client (needs a request context), never blocking.
+
+        Returns:
+            bool: False if auditing is off or the event was dropped because the queue is full
+        """
+        if not self.enabled:
+            return False
+        return self.record_for(action, account_id, current_tenant(), request.remote_addr, request.user_agent.string)
+
+    def record_for(self, action, account_id, tenant, actor, user_agent):
+        """
+        Queue an event for an explicit tenant ('' for the shared database) and client, never blocking.
+
+        For servers without a Flask request context, such as asgi.py.
+
+        Returns:
+            bool: False if auditing is off or the event was dropped because the queue is full
+        """
+        if not self.enabled:
+            return False
+        row = {
+            'occurred_at': datetime.now(timezone.utc),
+            'action': action,
+            'account_id': account_id,
+            'actor': (actor or '')[:64] or None,
+            'user_agent': (user_agent or '')[:200] or None
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((tenant, row))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.recorded += 1
+        return True
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so each worker process starts its own writer
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, args=(self._queue,), name='audit-writer', daemon=True)
+            self._thread.start()
+
+    def flush(self):
+        """Block until every queued event has been written (or has failed to be)"""
+        if self._queue.unfinished_tasks:
+            self._ensure_started()
+            self._queue.join()
+
+    def close(self, timeout=CLOSE_TIMEOUT):
+        """Write the queued events and stop the writer thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if self._queue.unfinished_tasks and (thread is None or not thread.is_alive()):
+            thread = threading.Thread(target=self._run, args=(self._queue,), name='audit-writer', daemon=True)
+            thread.start()
+        if thread is None or not thread.is_alive():
+            return
+        self._queue.put(_STOP)
+        thread.join(timeout)
+
+    def _run(self, events):
+        while True:
+            item = events.get()
+            stop = item is _STOP
+            batch = [] if stop else [item]
+            # Give the batch until the flush interval to fill up
+            deadline = time.monotonic() + self.flush_interval
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = events.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
+
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stop):
+                events.task_done()
+            if stop:
+                return
+
+    @contextmanager
+    def _begin(self, tenant):
+        if not tenant:
+            with self._engine.begin() as connection:
+                yield connection
+            return
+        shard = shards.acquire(tenant, create=False)
+        try:
+            with shard.engine.begin() as connection:
+                yield connection
+        finally:
+            shards.release(shard)
+
+    def _write(self, batch):
+        """Insert a batch, one transaction per database"""
+        by_tenant = {}
+        for tenant, row in batch:
+            by_tenant.setdefault(tenant, []).append(row)
+
+        for tenant, rows in by_tenant.items():
+            try:
+                with self._begin(tenant) as connection:
+                    connection.execute(insert(AuditEvent), rows)
+            except Exception as e:
+                with self._lock:
+                    self.failed += len(rows)
+                print(f"⚠️  Warning: Could not write {len(rows)} audit events: {e}")
+                continue
+            with self._lock:
+                self.written += len(rows)
+                self.batches += 1
+
+    def stats(self):
+        """Get queue depth and recorded/dropped/written counters"""
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'queued': self._queue.qsize(),
+                'recorded': self.recorded,
+                'dropped': self.dropped,
+                'written': self.written,
+                'failed': self.failed,
+                'batches': self.batches
+            }
+
+
+audit_log = AuditLog()
@@ -0,0 +1,262 @@
+"""
+Benchmark suite for MFA Manager
+Seeds a temporary SQLite database with increasing numbers of accounts and
+times the request hot paths through the Flask test client.
+
+Usage:
+    python benchmark.py                                   # 10, 1k, 10k and 100k accounts
+    python benchmark.py --sizes 10,1000 --output results.json
+    python benchmark.py --baseline results.json           # exits 1 on regressions
+    python benchmark.py --encryption off                  # compare against plaintext secrets
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+DEFAULT_SIZES = (10, 1000, 10000, 100000)
+DEFAULT_ITERATIONS = 50
+DEFAULT_MAX_SECONDS = 5.0
+DEFAULT_THRESHOLD = 0.2
+SEED_CHUNK_SIZE = 5000
+
+# Name of each benchmarked path and the request it makes, as
+# (method, path(iteration, size), form data(iteration) or None)
+SCENARIOS = [
+    ('index', 'GET', lambda i, size: '/', None),
+    ('api_codes', 'GET', lambda i, size: '/api/codes', None),
+    ('api_code', 'GET', lambda i, size: f'/api/code/{i % size + 1}', None),
+    ('api_search', 'GET', lambda i, size: f'/api/search?q=Account%20{i % size}', None),
+    ('view_account', 'GET', lambda i, size: f'/account/{i % size + 1}', None),
+    ('account_qr_code', 'GET', lambda i, size: f'/account/{i % size + 1}/qr.png', None),
+    ('add_account', 'POST', lambda i, size: '/add', lambda i: {
+        'account_name': f'Benchmark {i}', 'secret': 'JBSWY3DPEHPK3PXP', 'issuer': 'Benchmark'
+    }),
+    ('edit_account', 'POST', lambda i, size: f'/edit/{i % size + 1}', lambda i: {
+        'account_name': f'Edited {i}', 'secret': 'JBSWY3DPEHPK3PXP', 'issuer': 'Benchmark'
+    }),
+]
+
+
+def seed_accounts(db, count):
+    """Recreate the schema and insert count accounts with random secrets (encrypted if a master key is set)"""
+    from sqlalchemy import insert
+    from models import MFAAccount
+    from secret_store import secret_store
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    for start in range(0, count, SEED_CHUNK_SIZE):
+        db.session.execute(insert(MFAAccount), [
+            {
+                'account_name': f'Account {index}',
+                'stored_secret': secret_store.encrypt(base64.b32encode(os.urandom(20)).decode()),
+                'issuer': f'Issuer {index % 50}'
+            }
+            for index in range(start, min(start + SEED_CHUNK_SIZE, count))
+        ])
+    db.session.commit()
+
+
+def _summarize(samples, elapsed):
+    """Latency percentiles in milliseconds and throughput in requests per second"""
+    ordered = sorted(samples)
+
+    def percentile(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000
+
+    return {
+        'requests': len(samples),
+        'min_ms': round(ordered[0] * 1000, 3),
+        'mean_ms': round(statistics.mean(ordered) * 1000, 3),
+        'p50_ms': round(percentile(0.50), 3),
+        'p95_ms': round(percentile(0.95), 3),
+        'p99_ms': round(percentile(0.99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3),
+        'requests_per_second': round(len(samples) / elapsed, 1)
+    }
+
+
+def run_scenario(client, scenario, size, iterations, max_seconds):
+    """
+    Time one scenario against a seeded database.
+
+    Each sample runs until the whole response body has been read. Stops
+    early once max_seconds have passed (after at least 3 requests), so the
+    largest sizes finish in reasonable time.
+    """
+    name, method, path, data = scenario
+    samples = []
+    started = time.perf_counter()
+
+    for i in range(iterations):
+        request_started = time.perf_counter()
+        response = client.open(path(i, size), method=method, data=data(i) if data else None)
+        # Read the whole body, since streamed responses (the dashboard) render while it is read
+        response.get_data()
+        samples.append(time.perf_counter() - request_started)
+        response.close()
+
+        if response.status_code >= 400:
+            raise RuntimeError(f'{name} returned HTTP {response.status_code} for {path(i, size)}')
+        if i >= 2 and time.perf_counter() - started > max_seconds:
+            break
+
+    return _summarize(samples, time.perf_counter() - started)
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, iterations=DEFAULT_ITERATIONS, max_seconds=DEFAULT_MAX_SECONDS,
+                   scenarios=None, encryption=None, log=None):
+    """
+    Run every scenario at every database size.
+
+    The app's database is dropped and reseeded for each size, so point
+    DATABASE_PATH at a scratch file before the app is first imported.
+    Secrets are encrypted as configured, or with encryption=True/False
+    under a throwaway master key or in plaintext.
+
+    Returns:
+        dict: Results keyed by size, then by scenario name
+    """
+    from app import app, db
+    from code_cache import code_cache
+    from qr_cache import qr_cache
+    from secret_store import secret_store
+
+    app.config['TESTING'] = True
+    if encryption is not None:
+        secret_store.configure({
+            'master_key': os.urandom(32) if encryption else None,
+            'previous_keys': [],
+            'key_cache_size': secret_store.maxsize
+        })
+    results = {}
+
+    with app.app_context():
+        for size in sizes:
+            if log:
+                log(f'Seeding {size} accounts...')
+            seed_accounts(db, size)
+            results[str(size)] = {}
+
+            for scenario in scenarios or SCENARIOS:
+                code_cache.clear()
+                qr_cache.clear()
+                secret_store.clear()
+                # Each scenario gets a fresh client (and session) against the same data
+                results[str(size)][scenario[0]] = run_scenario(
+                    app.test_client(), scenario, size, iterations, max_seconds
+                )
+                if log:
+                    stats = results[str(size)][scenario[0]]
+                    log(f'  {scenario[0]:<16} p50 {stats["p50_ms"]:>9.2f} ms  '
+                        f'p95 {stats["p95_ms"]:>9.2f} ms  {stats["requests_per_second"]:>8.1f} req/s')
+
+        db.session.remove()
+        db.drop_all()
+
+    return results
+
+
+def compare_results(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare median latencies against a baseline run.
+
+    Returns:
+        list: One entry per scenario present in both runs, with regression set
+        where the median is more than threshold (a fraction) slower
+    """
+    comparison = []
+    for size, scenarios in results.items():
+        for name, stats in scenarios.items():
+            base = baseline.get(size, {}).get(name)
+            if not base or not base['p50_ms']:
+                continue
+            ratio = stats['p50_ms'] / base['p50_ms']
+            comparison.append({
+                'size': size,
+                'scenario': name,
+                'baseline_p50_ms': base['p50_ms'],
+                'p50_ms': stats['p50_ms'],
+                'ratio': round(ratio, 3),
+                'regression': ratio > 1 + threshold
+            })
+    return comparison
+
+
+def _environment():
+    return {
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MFA Manager request hot paths')
+    parser.add_argument('--sizes', default=','.join(str(size) for size in DEFAULT_SIZES),
+                        help='Comma-separated account counts to seed (default: %(default)s)')
+    parser.add_argument('--iterations', type=int, default=DEFAULT_ITERATIONS,
+                        help='Requests per scenario (default: %(default)s)')
+    parser.add_argument('--max-seconds', type=float, default=DEFAULT_MAX_SECONDS,
+                        help='Time budget per scenario before stopping early (default: %(default)s)')
+    parser.add_argument('--output', help='Write the JSON results to this file instead of stdout')
+    parser.add_argument('--baseline', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--encryption', choices=('on', 'off'),
+                        help='Store secrets encrypted under a throwaway master key, or in plaintext '
+                             '(default: as configured by ENCRYPTION_KEY_FILE/SECRET_KEY)')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Allowed median slowdown before a scenario counts as a regression (default: %(default)s)')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+
+    def log(message):
+        print(message, file=sys.stderr)
+
+    with tempfile.TemporaryDirectory() as directory:
+        # Must be set before the app is imported, since the engine is created at import time
+        os.environ['DATABASE_PATH'] = os.path.join(directory, 'benchmark.db')
+        encryption = {'on': True, 'off': False}.get(args.encryption)
+        report = {
+            'environment': _environment(),
+            'iterations': args.iterations,
+            'results': run_benchmarks(sizes, args.iterations, args.max_seconds, encryption=encryption, log=log)
+        }
+        from secret_store import secret_store
+        report['encryption'] = secret_store.enabled
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        report['comparison'] = compare_results(report['results'], baseline['results'], args.threshold)
+        regressions = [entry for entry in report['comparison'] if entry['regression']]
+        for entry in regressions:
+            log(f'❌ Regression: {entry["scenario"]} at {entry["size"]} accounts is '
+                f'{entry["ratio"]:.2f}x the baseline median ({entry["baseline_p50_ms"]} ms -> {entry["p50_ms"]} ms)')
+        if not regressions:
+            log('✅ No regressions against the baseline')
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
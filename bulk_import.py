@@ -0,0 +1,291 @@
+"""
+Bulk account import for MFA Manager
+Streams otpauth:// URIs and Google Authenticator export payloads
+(otpauth-migration://) line by line, validates them in chunks and inserts
+each chunk in a single transaction.
+
+Run directly to import a file into the configured database:
+    python bulk_import.py accounts.txt
+"""
+
+import base64
+from urllib.parse import parse_qs, unquote, urlparse
+
+from sqlalchemy import insert
+
+import totp_engine
+from models import db, MFAAccount
+from secret_store import secret_store
+
+DEFAULT_CHUNK_SIZE = 500
+MAX_FIELD_LENGTH = 100
+
+# Google Authenticator export enums (0 is "unspecified", which authenticators treat as the default)
+_MIGRATION_ALGORITHMS = {0: 'sha1', 1: 'sha1', 2: 'sha256', 3: 'sha512'}
+_MIGRATION_DIGITS = {0: 6, 1: 6, 2: 8}
+
+
+class ImportRecord:
+    """An account parsed from an import line"""
+
+    __slots__ = ('line', 'account_name', 'secret', 'issuer', 'digits', 'period', 'algorithm')
+
+    def __init__(self, line, account_name, secret, issuer=None, digits=totp_engine.DEFAULT_DIGITS,
+                 period=totp_engine.DEFAULT_PERIOD, algorithm=totp_engine.DEFAULT_ALGORITHM):
+        self.line = line
+        self.account_name = account_name
+        self.secret = secret
+        self.issuer = issuer
+        self.digits = digits
+        self.period = period
+        self.algorithm = algorithm
+
+
+def _split_label(label, issuer):
+    """Split an otpauth label of the form 'Issuer:account' into (account, issuer)"""
+    if ':' in label:
+        label_issuer, account_name = label.split(':', 1)
+        return account_name.strip(), issuer or label_issuer.strip()
+    return label.strip(), issuer
+
+
+def parse_otpauth_uri(uri):
+    """
+    Parse an otpauth://totp/ URI.
+
+    Returns:
+        tuple: (account_name, base32 secret, issuer or None, digits, period, algorithm)
+
+    Raises:
+        ValueError: If the URI is not a usable TOTP URI
+    """
+    parsed = urlparse(uri)
+    if parsed.scheme != 'otpauth':
+        raise ValueError('not an otpauth:// URI')
+    if parsed.netloc.lower() != 'totp':
+        raise ValueError(f'unsupported OTP type: {parsed.netloc}')
+
+    params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+    if 'secret' not in params:
+        raise ValueError('missing secret')
+    digits, period, algorithm = totp_engine.validate_params(
+        params.get('digits', totp_engine.DEFAULT_DIGITS),
+        params.get('period', totp_engine.DEFAULT_PERIOD),
+        params.get('algorithm', totp_engine.DEFAULT_ALGORITHM)
+    )
+
+    account_name, issuer = _split_label(unquote(parsed.path.lstrip('/')), params.get('issuer'))
+    return account_name, params['secret'], issuer, digits, period, algorithm
+
+
+def _read_varint(data, position):
+    result = shift = 0
+    while True:
+        if position >= len(data):
+            raise ValueError('truncated payload')
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, position
+        shift += 7
+
+
+def _read_fields(data):
+    """Yield (field number, value) pairs from a protobuf message (varint and length-delimited fields only)"""
+    position = 0
+    while position < len(data):
+        key, position = _read_varint(data, position)
+        field, wire_type = key >> 3, key & 0x07
+        if wire_type == 0:
+            value, position = _read_varint(data, position)
+        elif wire_type == 2:
+            length, position = _read_varint(data, position)
+            value = data[position:position + length]
+            if len(value) != length:
+                raise ValueError('truncated payload')
+            position += length
+        else:
+            raise ValueError(f'unsupported protobuf wire type {wire_type}')
+        yield field, value
+
+
+def parse_migration_payload(uri):
+    """
+    Parse a Google Authenticator otpauth-migration://offline?data=... export.
+
+    Returns:
+        list: (account_name, base32 secret, issuer or None, digits, period, algorithm) tuples,
+        or a ValueError in place of each entry that can't be imported
+    """
+    parsed = urlparse(uri)
+    data = parse_qs(parsed.query).get('data')
+    if parsed.scheme != 'otpauth-migration' or not data:
+        raise ValueError('not an otpauth-migration:// URI with a data parameter')
+
+    try:
+        payload = base64.b64decode(data[0] + '=' * (-len(data[0]) % 4))
+    except ValueError as e:
+        raise ValueError(f'invalid payload encoding: {e}') from e
+
+    entries = []
+    for field, value in _read_fields(payload):
+        if field != 1:
+            continue
+        otp = {'algorithm': 1, 'digits': 1, 'type': 2}
+        for otp_field, otp_value in _read_fields(value):
+            name = {1: 'secret', 2: 'name', 3: 'issuer', 4: 'algorithm', 5: 'digits', 6: 'type'}.get(otp_field)
+            if name:
+                otp[name] = otp_value
+
+        account_name, issuer = _split_label(otp.get('name', b'').decode(), otp.get('issuer', b'').decode() or None)
+        if otp['type'] != 2:
+            entries.append(ValueError(f'{account_name}: only TOTP accounts can be imported'))
+        elif otp['algorithm'] not in _MIGRATION_ALGORITHMS or otp['digits'] not in _MIGRATION_DIGITS:
+            entries.append(ValueError(f'{account_name}: only SHA1, SHA256 or SHA512 accounts with 6 or 8 digits '
+                                      'can be imported'))
+        else:
+            # The export format has no period, every account in it uses 30 seconds
+            entries.append((account_name, base64.b32encode(otp.get('secret', b'')).decode().rstrip('='), issuer,
+                            _MIGRATION_DIGITS[otp['digits']], totp_engine.DEFAULT_PERIOD,
+                            _MIGRATION_ALGORITHMS[otp['algorithm']]))
+    return entries
+
+
+def iter_records(lines):
+    """
+    Parse import lines lazily.
+
+    Blank lines and lines starting with # are skipped.
+
+    Yields:
+        ImportRecord or tuple: A record, or (line number, error message) for a bad line
+    """
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+
+        try:
+            if line.startswith('otpauth-migration:'):
+                entries = parse_migration_payload(line)
+            else:
+                entries = [parse_otpauth_uri(line)]
+        except ValueError as e:
+            yield number, str(e)
+            continue
+
+        for entry in entries:
+            if isinstance(entry, ValueError):
+                yield number, str(entry)
+            else:
+                yield ImportRecord(number, *entry)
+
+
+def _validate(record):
+    """Normalize a record's secret, returning an error message if it can't be imported"""
+    record.secret = record.secret.upper().replace(' ', '')
+    if not record.account_name:
+        return 'missing account name'
+    if len(record.account_name) > MAX_FIELD_LENGTH or len(record.issuer or '') > MAX_FIELD_LENGTH:
+        return f'account name and issuer must be at most {MAX_FIELD_LENGTH} characters'
+    try:
+        if not totp_engine.decode_secret(record.secret):
+            return 'empty secret'
+    except ValueError as e:
+        return str(e)
+    return None
+
+
+def _import_chunk(records, seen_names, report):
+    """Validate, dedupe and insert one chunk of records in a single transaction"""
+    valid = []
+    for record in records:
+        error = _validate(record)
+        if error is None and record.account_name in seen_names:
+            error = 'duplicate account name in import'
+        if error:
+            report['errors'].append({'line': record.line, 'account_name': record.account_name, 'error': error})
+        else:
+            seen_names.add(record.account_name)
+            valid.append(record)
+
+    if not valid:
+        return
+
+    # One set-based query for every name in the chunk
+    existing = {name for (name,) in db.session.query(MFAAccount.account_name).filter(
+        MFAAccount.account_name.in_([record.account_name for record in valid])
+    )}
+
+    rows = []
+    for record in valid:
+        if record.account_name in existing:
+            report['errors'].append({
+                'line': record.line, 'account_name': record.account_name, 'error': 'account name already exists'
+            })
+        else:
+            rows.append({
+                'account_name': record.account_name,
+                'stored_secret': secret_store.encrypt(record.secret),
+                'issuer': record.issuer or 'MFA Manager',
+                'digits': record.digits,
+                'period': record.period,
+                'algorithm': record.algorithm
+            })
+
+    if rows:
+        db.session.execute(insert(MFAAccount), rows)
+        db.session.commit()
+        report['imported'] += len(rows)
+
+
+def import_accounts(lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Import accounts from an iterable of lines (needs an app context).
+
+    Each chunk is committed on its own, so a bad line never rolls back
+    accounts from other chunks.
+
+    Returns:
+        dict: Report with the number imported and a per-line list of errors
+    """
+    report = {'imported': 0, 'errors': []}
+    seen_names = set()
+    chunk = []
+
+    for item in iter_records(lines):
+        if isinstance(item, ImportRecord):
+            chunk.append(item)
+            if len(chunk) >= chunk_size:
+                _import_chunk(chunk, seen_names, report)
+                chunk = []
+        else:
+            report['errors'].append({'line': item[0], 'account_name': None, 'error': item[1]})
+
+    if chunk:
+        _import_chunk(chunk, seen_names, report)
+
+    report['errors'].sort(key=lambda error: error['line'])
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    from app import app
+    from accounts_version import sync_accounts_version
+
+    parser = argparse.ArgumentParser(description='Import otpauth:// URIs or Google Authenticator exports')
+    parser.add_argument('file', help='File with one otpauth:// or otpauth-migration:// URI per line')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Accounts per transaction')
+    args = parser.parse_args()
+
+    with app.app_context(), open(args.file, encoding='utf-8') as import_file:
+        result = import_accounts(import_file, args.chunk_size)
+        sync_accounts_version()
+
+    print(json.dumps(result, indent=2))
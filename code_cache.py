@@ -0,0 +1,134 @@
+"""
+TOTP code cache for MFA Manager
+Keeps each account's code for the current time step of its period so the
+polling endpoints only compute it once per window. Codes are grouped by
+period, and a group is only pruned when its own step rolls over.
+"""
+
+import threading
+import time
+
+from totp_engine import DEFAULT_PERIOD
+from step_scheduler import current_steps
+from lru import hit_stats
+
+
+class TOTPCodeCache:
+    """Cache of generated TOTP codes keyed on (account id, period, time step)"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.version = 0
+        # Periods used by the accounts of this cache's database, None until the first sync reads them
+        self.periods = None
+        self._codes = {}
+        self._floors = {}
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    @staticmethod
+    def current_step(timestamp=None, period=DEFAULT_PERIOD):
+        """Get the TOTP time step of a period for a timestamp (defaults to now)"""
+        if timestamp is None:
+            timestamp = time.time()
+        return int(timestamp) // period
+
+    def steps(self, timestamp=None):
+        """Get the current (period, step) of every period group, which changes whenever any code rolls over"""
+        return current_steps(self.periods, timestamp)
+
+    def get_code(self, account, timestamp=None):
+        """
+        Get the code for an account, computing it at most once per time step.
+
+        The cached entry remembers the stored (encrypted) secret, digits and
+        algorithm it was computed from, so an account whose secret changed
+        behind our back is never served a stale code.
+        """
+        period = account.period
+        step = self.current_step(timestamp, period)
+        key = (account.id, period, step)
+        source = (account.stored_secret, account.digits, account.algorithm)
+
+        with self._lock:
+            entry = self._codes.get(key)
+            if entry is not None and entry[0] == source:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        code = account.get_totp_code(for_time=step * period)
+        # Lookahead requests compute future steps, never prune past the current one
+        floor = min(step, self.current_step(period=period))
+
+        with self._lock:
+            if floor > self._floors.get(period, floor - 1):
+                # A new window of this period started, its older entries are now useless
+                self._codes = {k: v for k, v in self._codes.items() if k[1] != period or k[2] >= floor}
+                self._floors[period] = floor
+            self._codes[key] = (source, code)
+
+        return code
+
+    def invalidate(self, account_id=None):
+        """Drop cached codes for one account, or for every account if no id is given"""
+        with self._lock:
+            if account_id is None:
+                self._codes.clear()
+            else:
+                self._codes = {k: v for k, v in self._codes.items() if k[0] != account_id}
+
+    def sync(self, version, periods=None):
+        """
+        Adopt the shared accounts version (see accounts_version.py), and the
+        accounts' periods if they were read along with it.
+
+        If the version moved, every cached code is dropped and anyone waiting in
+        wait_for_change() is woken up.
+
+        Returns:
+            bool: True if the version changed
+        """
+        with self._lock:
+            if periods is not None:
+                self.periods = frozenset(periods)
+            if version == self.version:
+                return False
+            self._codes.clear()
+            self.version = version
+            self._changed.notify_all()
+            return True
+
+    def wait_for_change(self, version, timeout=None):
+        """
+        Block until the cache version moves past ``version`` or the timeout expires.
+
+        Returns:
+            bool: True if the accounts changed, False on timeout
+        """
+        with self._changed:
+            return self._changed.wait_for(lambda: self.version != version, timeout)
+
+    def clear(self):
+        """Drop all cached codes and reset the hit/miss counters and version"""
+        with self._lock:
+            self._codes.clear()
+            self._floors.clear()
+            self.periods = None
+            self.version = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Get hit/miss counters for the cache"""
+        with self._lock:
+            return {
+                'version': self.version,
+                'periods': sorted(self.periods or ()),
+                **hit_stats(self.hits, self.misses),
+                'size': len(self._codes)
+            }
+
+
+code_cache = TOTPCodeCache()
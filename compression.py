@@ -0,0 +1,114 @@
+"""
+Response compression for MFA Manager
+Compresses JSON, MessagePack, HTML and SVG responses above a size threshold
+with brotli or gzip, whichever the client prefers (brotli only if the
+optional brotli package is installed). Streamed HTML, such as the dashboard,
+is compressed chunk by chunk with a flush after each one so the browser can
+render what has arrived; the live code streams and exports are not
+compressible types and are left alone so events are not held back.
+"""
+
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    # Brotli is optional, gzip is always available
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    'application/json',
+    'application/x-msgpack',
+    'text/html',
+    'image/svg+xml',
+}
+
+
+class ResponseCompressor:
+    """after_request hook that negotiates Content-Encoding for buffered responses"""
+
+    def __init__(self):
+        self.enabled = False
+        self.min_size = 1024
+        self.gzip_level = 6
+        self.brotli_quality = 4
+
+    def init_app(self, app, options):
+        self.enabled = options['enabled']
+        self.min_size = options['min_size']
+        self.gzip_level = options['gzip_level']
+        self.brotli_quality = options['brotli_quality']
+        if self.enabled:
+            app.after_request(self.compress)
+
+    def choose_encoding(self):
+        """Pick 'br' or 'gzip' from the request's Accept-Encoding, or None"""
+        accepted = request.accept_encodings
+        candidates = (['br'] if brotli else []) + ['gzip']
+        # Highest quality wins; ties go to the first candidate (brotli)
+        best = max(candidates, key=lambda encoding: (accepted[encoding], -candidates.index(encoding)))
+        return best if accepted[best] else None
+
+    def compress(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+            return response
+        response.vary.add('Accept-Encoding')
+
+        if (response.status_code != 200 or response.direct_passthrough
+                or 'Content-Encoding' in response.headers):
+            return response
+
+        if response.is_streamed:
+            encoding = self.choose_encoding()
+            if encoding is not None:
+                response.response = self._compress_stream(response.response, encoding)
+                response.headers.pop('Content-Length', None)
+                response.headers['Content-Encoding'] = encoding
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        encoding = self.choose_encoding()
+        if encoding is None:
+            return response
+
+        if encoding == 'br':
+            response.set_data(brotli.compress(data, quality=self.brotli_quality))
+        else:
+            response.set_data(gzip.compress(data, compresslevel=self.gzip_level))
+        response.headers['Content-Encoding'] = encoding
+
+        # The compressed bytes differ from the identity ones, so a strong ETag becomes weak
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
+
+    def _compress_stream(self, chunks, encoding):
+        """Compress each chunk of a streamed body and flush it, so nothing is held back waiting for more"""
+        if encoding == 'br':
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            compress, flush, finish = compressor.process, compressor.flush, compressor.finish
+        else:
+            # wbits 31 selects the gzip container
+            compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            compress, flush, finish = compressor.compress, lambda: compressor.flush(zlib.Z_SYNC_FLUSH), compressor.flush
+        try:
+            for chunk in chunks:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode()
+                data = compress(chunk) + flush()
+                if data:
+                    yield data
+            yield finish()
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+
+compressor = ResponseCompressor()
@@ -4,8 +4,10 @@ Configuration module for MFA Manager
 Handles environment variables and application configuration
 """
 
+import hashlib
 import os
-from typing import Union
+import sys
+from typing import Dict, List, Union
 
 # Try to load .env file if python-dotenv is available
 try:
@@ -36,9 +38,9 @@ def get_port() -> int:
             if 1 <= port <= 65535:
                 return port
             else:
-                print(f"⚠️  Warning: Invalid port {port} (must be 1-65535), using default 4570")
+                print(f"⚠️  Warning: Invalid port {port} (must be 1-65535), using default 4570", file=sys.stderr)
         except ValueError:
-            print(f"⚠️  Warning: Invalid port value '{port_str}', using default 4570")
+            print(f"⚠️  Warning: Invalid port value '{port_str}', using default 4570", file=sys.stderr)
     
     return 4570
 
@@ -87,4 +89,317 @@ def get_secret_key() -> str:
         str: Secret key for Flask application
     """
     import secrets
-    return os.environ.get('SECRET_KEY', secrets.token_hex(32))
\ No newline at end of file
+    return os.environ.get('SECRET_KEY', secrets.token_hex(32))
+
+def _get_int_env(name: str, default: int, minimum: Union[int, None] = None) -> int:
+    """
+    Get an integer from an environment variable with fallback to default.
+    
+    Args:
+        name: Environment variable name
+        default: Value to use when the variable is unset or invalid
+        minimum: Smallest accepted value (optional)
+    
+    Returns:
+        int: Parsed value or default
+    """
+    value_str = os.environ.get(name)
+    
+    if value_str:
+        try:
+            value = int(value_str)
+            if minimum is None or value >= minimum:
+                return value
+            else:
+                print(f"⚠️  Warning: Invalid {name} {value} (must be at least {minimum}), using default {default}", file=sys.stderr)
+        except ValueError:
+            print(f"⚠️  Warning: Invalid {name} value '{value_str}', using default {default}", file=sys.stderr)
+    
+    return default
+
+
+def get_sqlite_pragmas() -> Dict[str, Union[int, str]]:
+    """
+    Get the SQLite performance profile applied to every new database connection.
+    
+    Each PRAGMA can be overridden with an environment variable:
+    - SQLITE_JOURNAL_MODE: Journal mode (default: WAL, lets readers run alongside a writer)
+    - SQLITE_SYNCHRONOUS: Sync level (default: NORMAL, safe with WAL)
+    - SQLITE_BUSY_TIMEOUT: Milliseconds to wait for a lock (default: 5000)
+    - SQLITE_MMAP_SIZE: Bytes of the database to memory-map (default: 256 MiB)
+    - SQLITE_CACHE_SIZE: Page cache size, negative values are KiB (default: -65536, 64 MiB)
+    
+    Returns:
+        dict: PRAGMA names mapped to values, in the order they should be applied
+    """
+    journal_mode = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL').upper()
+    if journal_mode not in ('DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'):
+        print(f"⚠️  Warning: Invalid SQLITE_JOURNAL_MODE '{journal_mode}', using default WAL", file=sys.stderr)
+        journal_mode = 'WAL'
+    
+    synchronous = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    if synchronous not in ('OFF', 'NORMAL', 'FULL', 'EXTRA'):
+        print(f"⚠️  Warning: Invalid SQLITE_SYNCHRONOUS '{synchronous}', using default NORMAL", file=sys.stderr)
+        synchronous = 'NORMAL'
+    
+    return {
+        'journal_mode': journal_mode,
+        'synchronous': synchronous,
+        'busy_timeout': _get_int_env('SQLITE_BUSY_TIMEOUT', 5000, minimum=0),
+        'mmap_size': _get_int_env('SQLITE_MMAP_SIZE', 256 * 1024 * 1024, minimum=0),
+        'cache_size': _get_int_env('SQLITE_CACHE_SIZE', -64 * 1024),
+    }
+
+
+def get_engine_options(database_path: Union[str, None] = None) -> Dict[str, int]:
+    """
+    Get SQLAlchemy connection pool sizing from environment variables.
+    
+    - DB_POOL_SIZE: Connections kept open in the pool (default: 10)
+    - DB_MAX_OVERFLOW: Extra connections allowed under load (default: 20)
+    - DB_POOL_TIMEOUT: Seconds to wait for a free connection (default: 30)
+    
+    Only file databases get a sized pool: an in-memory database is a single
+    connection shared through a StaticPool, which takes none of these options.
+    
+    Args:
+        database_path: The SQLite database path, if known
+    
+    Returns:
+        dict: Keyword arguments for SQLAlchemy's create_engine
+    """
+    if database_path in ('', ':memory:'):
+        return {}
+    
+    return {
+        'pool_size': _get_int_env('DB_POOL_SIZE', 10, minimum=1),
+        'max_overflow': _get_int_env('DB_MAX_OVERFLOW', 20, minimum=0),
+        'pool_timeout': _get_int_env('DB_POOL_TIMEOUT', 30, minimum=1),
+    }
+
+
+def get_server_mode() -> str:
+    """
+    Get the server used by run.py from the SERVER_MODE environment variable.
+    
+    - development: Flask's built-in development server (default outside production)
+    - gunicorn: Pre-fork multi-process server with threaded workers (default in production)
+    
+    Returns:
+        str: 'development' or 'gunicorn'
+    """
+    default = 'gunicorn' if is_production() else 'development'
+    mode = os.environ.get('SERVER_MODE', default).lower()
+    
+    if mode not in ('development', 'gunicorn'):
+        print(f"⚠️  Warning: Invalid SERVER_MODE '{mode}', using default {default}", file=sys.stderr)
+        return default
+    
+    return mode
+
+
+def get_server_options() -> Dict[str, int]:
+    """
+    Get production server sizing from environment variables.
+    
+    - WEB_WORKERS: Worker processes (default: 2 x CPU cores + 1)
+    - WEB_THREADS: Threads per worker, each serves one request or live stream (default: 8)
+    - WEB_TIMEOUT: Seconds before a silent worker is restarted (default: 30)
+    - WEB_GRACEFUL_TIMEOUT: Seconds workers get to finish requests on restart (default: 30)
+    - WEB_MAX_REQUESTS: Recycle a worker after this many requests, 0 disables (default: 0)
+    
+    Returns:
+        dict: Server settings
+    """
+    cpu_count = os.cpu_count() or 1
+    
+    return {
+        'workers': _get_int_env('WEB_WORKERS', 2 * cpu_count + 1, minimum=1),
+        'threads': _get_int_env('WEB_THREADS', 8, minimum=1),
+        'timeout': _get_int_env('WEB_TIMEOUT', 30, minimum=1),
+        'graceful_timeout': _get_int_env('WEB_GRACEFUL_TIMEOUT', 30, minimum=1),
+        'max_requests': _get_int_env('WEB_MAX_REQUESTS', 0, minimum=0),
+    }
+
+
+def get_stream_options() -> Dict[str, int]:
+    """
+    Get the live code stream (Server-Sent Events) settings from environment variables.
+    
+    Each open stream holds a server thread for as long as its page is open, so a
+    process serves only a few and further pages poll once per period instead.
+    
+    - MAX_STREAMS: Live streams per process, 0 makes every page poll (default: a quarter of WEB_THREADS, at least 1)
+    
+    Returns:
+        dict: Stream settings
+    """
+    threads = get_server_options()['threads']
+    
+    return {
+        'max_streams': _get_int_env('MAX_STREAMS', max(1, threads // 4), minimum=0),
+    }
+
+
+def get_profiler_options() -> Dict[str, Union[bool, float, int, str]]:
+    """
+    Get the opt-in request profiling settings from environment variables.
+    
+    - SLOW_REQUEST_MS: Log requests slower than this with a time-by-phase breakdown, 0 disables (default: 0)
+    - PROFILE_REQUESTS: Set to 'true' to run cProfile on sampled requests (default: false)
+    - PROFILE_SAMPLE_RATE: Fraction of requests to profile, 0-1 (default: 0.1)
+    - PROFILE_DIR: Directory for .prof files of sampled requests over SLOW_REQUEST_MS (default: profiles)
+    
+    Returns:
+        dict: Profiler settings
+    """
+    sample_rate_str = os.environ.get('PROFILE_SAMPLE_RATE', '0.1')
+    try:
+        sample_rate = float(sample_rate_str)
+        if not 0 <= sample_rate <= 1:
+            raise ValueError
+    except ValueError:
+        print(f"⚠️  Warning: Invalid PROFILE_SAMPLE_RATE '{sample_rate_str}' (must be 0-1), using default 0.1", file=sys.stderr)
+        sample_rate = 0.1
+    
+    return {
+        'slow_request_ms': _get_int_env('SLOW_REQUEST_MS', 0, minimum=0),
+        'profile_requests': os.environ.get('PROFILE_REQUESTS', 'false').lower() == 'true',
+        'sample_rate': sample_rate,
+        'directory': os.environ.get('PROFILE_DIR', 'profiles'),
+    }
+
+
+def get_compression_options() -> Dict[str, Union[bool, int]]:
+    """
+    Get response compression settings from environment variables.
+    
+    - COMPRESSION: Set to 'false' to turn off brotli/gzip compression, e.g. behind a compressing proxy (default: true)
+    - COMPRESSION_MIN_SIZE: Smallest response body in bytes worth compressing (default: 1024)
+    - GZIP_LEVEL: gzip level, 1-9 (default: 6)
+    - BROTLI_QUALITY: brotli quality, 0-11 (default: 4, fast enough for per-request use)
+    
+    Returns:
+        dict: Compression settings
+    """
+    gzip_level = _get_int_env('GZIP_LEVEL', 6, minimum=1)
+    brotli_quality = _get_int_env('BROTLI_QUALITY', 4, minimum=0)
+    
+    return {
+        'enabled': os.environ.get('COMPRESSION', 'true').lower() != 'false',
+        'min_size': _get_int_env('COMPRESSION_MIN_SIZE', 1024, minimum=0),
+        'gzip_level': min(gzip_level, 9),
+        'brotli_quality': min(brotli_quality, 11),
+    }
+
+
+def _read_master_key(variable: str, secret_key_variable: str) -> Union[bytes, None]:
+    """
+    Get a 32-byte master key from a key file, or derived from a secret key.
+    
+    A key file should hold at least 32 random bytes (e.g. from `secrets.token_hex(32)`)
+    and is simply hashed. A secret key may be a passphrase, so it is stretched with scrypt.
+    """
+    path = os.environ.get(variable)
+    if path:
+        try:
+            with open(path, 'rb') as key_file:
+                material = key_file.read().strip()
+        except OSError as e:
+            # Never fall back to another key, secrets written with it would be unreadable later
+            raise ValueError(f"Can't read {variable} {path}: {e}") from e
+        if len(material) < 32:
+            raise ValueError(f"{variable} {path} must hold at least 32 bytes of key material")
+        return hashlib.sha256(material).digest()
+    
+    secret_key = os.environ.get(secret_key_variable)
+    if secret_key:
+        return hashlib.scrypt(secret_key.encode(), salt=b'mfa-manager secrets', n=2 ** 14, r=8, p=1, dklen=32)
+    return None
+
+
+def get_encryption_options() -> Dict[str, Union[bytes, None, List[bytes], int]]:
+    """
+    Get the master keys for encrypting account secrets at rest, deriving them once.
+    
+    - ENCRYPTION_KEY_FILE: File holding the master key material (takes precedence over SECRET_KEY)
+    - SECRET_KEY: The master key is derived from it when no key file is set
+    - PREVIOUS_ENCRYPTION_KEY_FILE, PREVIOUS_SECRET_KEY: The key being rotated away from, still accepted for reading
+    - KEY_CACHE_SIZE: Decrypted account keys kept in memory (default: 4096)
+    
+    Without a key file or SECRET_KEY (whose random fallback changes on every
+    start), secrets are stored unencrypted.
+    
+    Returns:
+        dict: Current master key (or None), previous master keys and key cache size
+    """
+    master_key = _read_master_key('ENCRYPTION_KEY_FILE', 'SECRET_KEY')
+    if master_key is None:
+        print("⚠️  Warning: Neither ENCRYPTION_KEY_FILE nor SECRET_KEY is set, account secrets are stored unencrypted", file=sys.stderr)
+    previous_key = _read_master_key('PREVIOUS_ENCRYPTION_KEY_FILE', 'PREVIOUS_SECRET_KEY')
+    
+    return {
+        'master_key': master_key,
+        'previous_keys': [previous_key] if previous_key else [],
+        'key_cache_size': _get_int_env('KEY_CACHE_SIZE', 4096, minimum=1),
+    }
+
+
+def get_tenant_options() -> Dict[str, Union[bool, int, str, None]]:
+    """
+    Get multi-tenant sharding settings from environment variables.
+    
+    - TENANT_MODE: How a request names its tenant: off, header, subdomain or path (default: off, one shared database)
+    - TENANT_HEADER: Request header naming the tenant in header mode (default: X-Tenant)
+    - TENANT_DOMAIN: Parent domain in subdomain mode, e.g. mfa.example.com for acme.mfa.example.com
+    - TENANT_DIRECTORY: Directory of the per-tenant SQLite files, relative paths are in the instance folder (default: tenants)
+    - TENANT_AUTO_CREATE: Set to 'true' to create a tenant's database on its first request (default: false)
+    - MAX_OPEN_SHARDS: Tenant databases kept open per process (default: 64)
+    - SHARD_IDLE_SECONDS: Close a tenant database unused for this long (default: 300)
+    - SHARD_POOL_SIZE: Connections kept open per tenant database (default: 2)
+    
+    In path mode every URL is prefixed with /t/<tenant>.
+    
+    Returns:
+        dict: Tenant settings
+    """
+    mode = os.environ.get('TENANT_MODE', 'off').lower()
+    if mode not in ('off', 'header', 'subdomain', 'path'):
+        print(f"⚠️  Warning: Invalid TENANT_MODE '{mode}', using default off", file=sys.stderr)
+        mode = 'off'
+    
+    domain = os.environ.get('TENANT_DOMAIN', '').lower().strip('.') or None
+    if mode == 'subdomain' and domain is None:
+        print("⚠️  Warning: TENANT_MODE is subdomain but TENANT_DOMAIN is not set, tenants are off", file=sys.stderr)
+        mode = 'off'
+    
+    return {
+        'mode': mode,
+        'header': os.environ.get('TENANT_HEADER', 'X-Tenant'),
+        'domain': domain,
+        'directory': os.environ.get('TENANT_DIRECTORY', 'tenants'),
+        'auto_create': os.environ.get('TENANT_AUTO_CREATE', 'false').lower() == 'true',
+        'max_open': _get_int_env('MAX_OPEN_SHARDS', 64, minimum=1),
+        'idle_seconds': _get_int_env('SHARD_IDLE_SECONDS', 300, minimum=1),
+        'pool_size': _get_int_env('SHARD_POOL_SIZE', 2, minimum=1),
+    }
+
+
+def get_audit_options() -> Dict[str, Union[bool, int]]:
+    """
+    Get the write-behind audit log settings from environment variables.
+    
+    - AUDIT_LOG: Set to 'false' to stop recording code views and copies (default: true)
+    - AUDIT_QUEUE_SIZE: Events held in memory waiting to be written; more are dropped and counted (default: 10000)
+    - AUDIT_BATCH_SIZE: Most events written in one transaction (default: 500)
+    - AUDIT_FLUSH_MS: Longest an event waits for its batch to fill before being written (default: 1000)
+    
+    Returns:
+        dict: Audit log settings
+    """
+    return {
+        'enabled': os.environ.get('AUDIT_LOG', 'true').lower() != 'false',
+        'queue_size': _get_int_env('AUDIT_QUEUE_SIZE', 10000, minimum=1),
+        'batch_size': _get_int_env('AUDIT_BATCH_SIZE', 500, minimum=1),
+        'flush_ms': _get_int_env('AUDIT_FLUSH_MS', 1000, minimum=0),
+    }
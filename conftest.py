@@ -0,0 +1,15 @@
+"""
+Test setup for MFA Manager
+The database engine is created when app is imported, so the tests point
+DATABASE_PATH at a scratch file before any test module imports it. Without
+this they would create and drop tables in the real instance/mfa_manager.db.
+"""
+
+import atexit
+import os
+import shutil
+import tempfile
+
+_directory = tempfile.mkdtemp(prefix='mfa-manager-tests-')
+os.environ['DATABASE_PATH'] = os.path.join(_directory, 'mfa_manager.db')
+atexit.register(shutil.rmtree, _directory, ignore_errors=True)
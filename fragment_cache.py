@@ -0,0 +1,59 @@
+"""
+Dashboard card fragment cache for MFA Manager
+Keeps the rendered markup of each account card in a bounded LRU cache keyed
+on (account id, updated_at, show_all). Values that change every period
+(the code and its remaining time) are rendered as named slots and filled
+in on each request, so a card's template only runs again after the account
+itself is edited.
+"""
+
+import re
+
+from markupsafe import Markup
+
+from lru import LRUCache
+
+# Slot markers can't appear in escaped template output, so splitting on them is unambiguous
+_SLOT = re.compile('\x00(\\w+)\x00')
+
+
+def slot(name):
+    """Placeholder to render in place of a value that is filled in on every request"""
+    return Markup(f'\x00{name}\x00')
+
+
+def fill(parts, values):
+    """Fill a cached fragment's slots (odd-numbered parts) with values"""
+    return Markup(''.join(
+        part if index % 2 == 0 else str(values[part]) for index, part in enumerate(parts)
+    ))
+
+
+class FragmentCache:
+    """Bounded LRU cache of rendered markup fragments with slots"""
+
+    def __init__(self, maxsize=1024):
+        self._fragments = LRUCache(maxsize)
+
+    def get(self, key, render):
+        """
+        Get a fragment, calling render() to produce its markup only on a cache miss.
+
+        Keys include the account's updated_at, so edits never need explicit
+        invalidation; superseded versions age out of the LRU.
+
+        Returns:
+            list: Markup split into literal text (even indexes) and slot names (odd indexes), for fill()
+        """
+        return self._fragments.get(key, lambda: _SLOT.split(str(render())))
+
+    def clear(self):
+        """Drop all cached fragments and reset the hit/miss counters"""
+        self._fragments.clear()
+
+    def stats(self):
+        """Get hit/miss counters for the cache"""
+        return self._fragments.stats()
+
+
+fragment_cache = FragmentCache()
@@ -0,0 +1,118 @@
+"""
+Bulk encryption and master key rotation for MFA Manager secrets
+Walks the accounts table in id order, a chunk at a time, rewriting stored
+secrets with secret_store: encrypting plaintext secrets, or re-wrapping data
+keys under the current master key. Each row is only rewritten if it still
+holds the value that was read, so edits made meanwhile are never lost.
+
+To rotate the master key, move the old key to PREVIOUS_ENCRYPTION_KEY_FILE
+(or PREVIOUS_SECRET_KEY), configure the new one, restart, and run rotate.
+
+Usage:
+    python key_rotation.py encrypt    # encrypt secrets still stored in plaintext
+    python key_rotation.py rotate     # re-wrap every secret under the current master key
+    python key_rotation.py rotate --tenant acme    # ...in one tenant's database (see tenants.py)
+"""
+
+import argparse
+import sys
+
+from sqlalchemy import bindparam, select
+
+from models import MFAAccount
+from secret_store import secret_store, is_encrypted
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def rewrite_secrets(connection, transform, chunk_size=DEFAULT_CHUNK_SIZE, commit=True):
+    """
+    Rewrite stored secrets chunk by chunk.
+
+    Args:
+        connection: SQLAlchemy connection
+        transform: Function returning the new stored value for a stored secret, or None to leave it
+        chunk_size: Rows read and written per chunk
+        commit: Commit after each chunk (pass False to run inside a caller's transaction)
+
+    Returns:
+        int: Number of rows rewritten
+    """
+    table = MFAAccount.__table__
+    # Rotation isn't an edit, so keep updated_at (and the dashboard card cache) as they are
+    statement = (
+        table.update()
+        .where(table.c.id == bindparam('row_id'), table.c.secret == bindparam('old_secret'))
+        .values(secret=bindparam('new_secret'), updated_at=table.c.updated_at)
+    )
+    rewritten = 0
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            select(table.c.id, table.c.secret).where(table.c.id > last_id).order_by(table.c.id).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        changes = []
+        for row in rows:
+            new_secret = transform(row.secret)
+            if new_secret is not None:
+                changes.append({'row_id': row.id, 'old_secret': row.secret, 'new_secret': new_secret})
+        if changes:
+            rewritten += connection.execute(statement, changes).rowcount
+        if commit:
+            connection.commit()
+    return rewritten
+
+
+def encrypt_secrets(connection, chunk_size=DEFAULT_CHUNK_SIZE, commit=True):
+    """Encrypt every secret still stored in plaintext, returning the number encrypted"""
+    if not secret_store.enabled:
+        raise ValueError('No master key is configured, set ENCRYPTION_KEY_FILE or SECRET_KEY')
+    return rewrite_secrets(
+        connection, lambda stored: None if is_encrypted(stored) else secret_store.encrypt(stored), chunk_size, commit
+    )
+
+
+def rotate_secrets(connection, chunk_size=DEFAULT_CHUNK_SIZE, commit=True):
+    """Re-wrap (or encrypt) every secret not yet under the current master key, returning the number rewritten"""
+    if not secret_store.enabled:
+        raise ValueError('No master key is configured, set ENCRYPTION_KEY_FILE or SECRET_KEY')
+    return rewrite_secrets(
+        connection, lambda stored: None if secret_store.is_current(stored) else secret_store.rewrap(stored),
+        chunk_size, commit
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Encrypt stored MFA secrets or rotate their master key')
+    parser.add_argument('command', choices=('encrypt', 'rotate'))
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Accounts per transaction (default: %(default)s)')
+    parser.add_argument('--tenant', help="Rewrite a tenant's database instead of the shared one")
+    args = parser.parse_args()
+
+    # Use the app's engine and key configuration so everything resolves exactly as when serving
+    from app import app
+    from models import db
+    from tenants import shards, UnknownTenant
+
+    command = encrypt_secrets if args.command == 'encrypt' else rotate_secrets
+    with app.app_context():
+        try:
+            shard = shards.acquire(args.tenant, create=False) if args.tenant else None
+            with (shard.engine if shard else db.engine).connect() as connection:
+                rewritten = command(connection, args.chunk_size)
+        except (ValueError, UnknownTenant) as e:
+            print(f"❌ {e}", file=sys.stderr)
+            return 1
+        finally:
+            shards.close_all()
+    print(f"✓ {rewritten} secret(s) {'encrypted' if args.command == 'encrypt' else 're-wrapped'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
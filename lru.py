@@ -0,0 +1,76 @@
+"""
+Bounded LRU cache for MFA Manager
+The thread-safe, least recently used map with hit/miss counters behind the
+QR code image, dashboard fragment and decrypted key caches. Values are
+computed outside the lock, so a slow render or decryption never blocks
+lookups of other keys.
+"""
+
+import threading
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+def hit_stats(hits, misses):
+    """Hit/miss counters and their hit ratio, as reported by every cache's stats()"""
+    lookups = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / lookups, 4) if lookups else 0.0
+    }
+
+
+class LRUCache:
+    """Bounded, thread-safe LRU map that counts hits and misses"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, create):
+        """
+        Get the value for a key, calling create() to compute it only on a miss.
+
+        Two threads missing the same key may both call create(); the last
+        value stored wins.
+        """
+        with self._lock:
+            value = self._entries.get(key, _MISSING)
+            if value is not _MISSING:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        value = create()
+
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+        return value
+
+    def discard(self, predicate):
+        """Drop every entry whose key matches predicate(key)"""
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self):
+        """Drop all entries and reset the hit/miss counters"""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Get hit/miss counters and the number of entries"""
+        with self._lock:
+            return {**hit_stats(self.hits, self.misses), 'size': len(self._entries), 'maxsize': self.maxsize}
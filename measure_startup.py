@@ -0,0 +1,107 @@
+"""
+Startup time measurement for MFA Manager
+Starts fresh Python processes and times what a container restart or a new
+worker pays before serving: importing the app, the schema version check,
+and the first request. Also reports which optional heavy modules were
+loaded, since those should only be imported on first use.
+
+Usage:
+    python measure_startup.py                     # median of 5 runs, first request GET /
+    python measure_startup.py --path /api/codes --runs 10
+    python measure_startup.py --importtime        # also list the slowest imports
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# Modules that should stay unloaded until a feature needs them
+LAZY_MODULES = ('qrcode', 'PIL', 'PIL.Image', 'cProfile')
+
+_CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from app import app, db
+imported = time.perf_counter()
+from migrations import upgrade
+with app.app_context():
+    upgrade(db.engine)
+checked = time.perf_counter()
+response = app.test_client().get(sys.argv[1])
+served = time.perf_counter()
+json.dump({
+    'status': response.status_code,
+    'import_ms': (imported - started) * 1000,
+    'schema_check_ms': (checked - imported) * 1000,
+    'first_request_ms': (served - checked) * 1000,
+    'total_ms': (served - started) * 1000,
+    'lazy_modules_loaded': [name for name in sys.argv[2:] if name in sys.modules],
+}, sys.stdout)
+"""
+
+
+def _run_child(path, environment, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', _CHILD, path, *LAZY_MODULES]
+    result = subprocess.run(
+        command, env=environment, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)), check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def _slowest_imports(importtime_output, count):
+    """Modules imported directly by top-level imports (such as app) with the largest cumulative time"""
+    imports = []
+    for line in importtime_output.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # importtime indents each nesting level by two spaces; deeper entries are included in their parent
+        if len(name) - len(name.lstrip()) == 3:
+            imports.append((int(cumulative), name.strip()))
+    return [{'module': name, 'cumulative_ms': round(micros / 1000, 1)}
+            for micros, name in sorted(imports, reverse=True)[:count]]
+
+
+def measure(path='/', runs=5, importtime=False):
+    """
+    Measure startup in fresh processes against a temporary, already migrated database.
+
+    Returns:
+        dict: Median timings in milliseconds, the lazy modules loaded, and
+        optionally the slowest imports
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        environment = dict(os.environ, DATABASE_PATH=os.path.join(directory, 'startup.db'))
+        # The first run creates the database, so it isn't counted
+        _run_child(path, environment)
+        samples = [_run_child(path, environment)[0] for _ in range(runs)]
+        report = {
+            'path': path,
+            'runs': runs,
+            'status': samples[-1]['status'],
+            'lazy_modules_loaded': samples[-1]['lazy_modules_loaded'],
+        }
+        for key in ('import_ms', 'schema_check_ms', 'first_request_ms', 'total_ms'):
+            report[key] = round(statistics.median(sample[key] for sample in samples), 1)
+        if importtime:
+            report['slowest_imports'] = _slowest_imports(_run_child(path, environment, importtime=True)[1], 15)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure MFA Manager import time and time to first request')
+    parser.add_argument('--path', default='/', help='Path of the first request (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes to time (default: %(default)s)')
+    parser.add_argument('--importtime', action='store_true', help='Also list the slowest modules the app imports')
+    args = parser.parse_args()
+
+    print(json.dumps(measure(args.path, args.runs, args.importtime), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""
+Prometheus metrics for MFA Manager
+Collects per-route request counts and latency histograms through Flask
+request hooks, SQL query counts and durations through SQLAlchemy engine
+events, and reads the TOTP and QR code cache counters, then renders them in
+the Prometheus text exposition format.
+
+Metrics are kept per process; with several server workers each scrape
+reports the worker that answered it.
+"""
+
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+
+from code_cache import code_cache
+from qr_cache import qr_cache
+from fragment_cache import fragment_cache
+from secret_store import secret_store
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    def __init__(self, name, description, labels=()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labels, label_values)} {_number(value)}')
+        return lines
+
+
+class Histogram:
+    """Histogram with fixed upper bounds, rendered with cumulative buckets"""
+
+    def __init__(self, name, description, buckets, labels=()):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    break
+            else:
+                index = len(self.buckets)
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f'{self.name}_bucket{_labels(self.labels, label_values, le)} {cumulative}')
+                lines.append(f'{self.name}_sum{_labels(self.labels, label_values)} {_number(total)}')
+                lines.append(f'{self.name}_count{_labels(self.labels, label_values)} {cumulative}')
+        return lines
+
+
+def _scalar(name, description, value, metric_type='gauge'):
+    return [f'# HELP {name} {description}', f'# TYPE {name} {metric_type}', f'{name} {_number(value)}']
+
+
+class Metrics:
+    """Registry of the application's metrics"""
+
+    def __init__(self):
+        self.requests = Counter(
+            'mfa_http_requests_total', 'HTTP requests by route, method and status.',
+            ('route', 'method', 'status')
+        )
+        self.request_duration = Histogram(
+            'mfa_http_request_duration_seconds', 'Time to produce a response by route (streams: time to headers).',
+            REQUEST_BUCKETS, ('route', 'method')
+        )
+        self.query_duration = Histogram(
+            'mfa_db_query_duration_seconds', 'SQL statement execution time.', QUERY_BUCKETS
+        )
+        self.started = time.time()
+
+    def init_app(self, app):
+        """Time every request through Flask hooks"""
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def instrument_engine(self, engine):
+        """Count and time every SQL statement run on an engine"""
+        event.listen(engine, 'before_cursor_execute', self._start_query)
+        event.listen(engine, 'after_cursor_execute', self._finish_query)
+        event.listen(engine, 'handle_error', self._abandon_query)
+
+    def _start_request(self):
+        g._metrics_started = time.perf_counter()
+
+    def _finish_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            # Label by URL rule, not path, to keep the number of series bounded
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            self.request_duration.observe(time.perf_counter() - started, route, request.method)
+            self.requests.inc(route, request.method, response.status_code)
+        return response
+
+    @staticmethod
+    def _start_query(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('_metrics_query_started', []).append(time.perf_counter())
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['_metrics_query_started'].pop()
+        self.query_duration.observe(time.perf_counter() - started)
+
+    @staticmethod
+    def _abandon_query(context):
+        # after_cursor_execute doesn't fire for a failed statement, so drop its start time here
+        conn = context.connection
+        if conn is not None and conn.info.get('_metrics_query_started'):
+            conn.info['_metrics_query_started'].pop()
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        code_stats = code_cache.stats()
+        qr_stats = qr_cache.stats()
+        fragment_stats = fragment_cache.stats()
+        key_stats = secret_store.stats()
+        # Imported here because audit_log imports tenants, which imports this module
+        from audit_log import audit_log
+        audit_stats = audit_log.stats()
+
+        lines = self.requests.render() + self.request_duration.render() + self.query_duration.render()
+        lines += _scalar('mfa_totp_codes_computed_total', 'TOTP codes computed (code cache misses).',
+                         code_stats['misses'], 'counter')
+        lines += _scalar('mfa_code_cache_hits_total', 'TOTP code cache hits.', code_stats['hits'], 'counter')
+        lines += _scalar('mfa_code_cache_hit_ratio', 'TOTP code cache hit ratio.', code_stats['hit_ratio'])
+        lines += _scalar('mfa_code_cache_entries', 'Codes held in the TOTP code cache.', code_stats['size'])
+        lines += _scalar('mfa_accounts_version', 'Shared accounts version this process has seen.',
+                         code_stats['version'])
+        lines += _scalar('mfa_qr_renders_total', 'QR code images rendered (QR cache misses).',
+                         qr_stats['misses'], 'counter')
+        lines += _scalar('mfa_qr_cache_hits_total', 'QR code image cache hits.', qr_stats['hits'], 'counter')
+        lines += _scalar('mfa_qr_cache_hit_ratio', 'QR code image cache hit ratio.', qr_stats['hit_ratio'])
+        lines += _scalar('mfa_card_renders_total', 'Dashboard cards rendered (fragment cache misses).',
+                         fragment_stats['misses'], 'counter')
+        lines += _scalar('mfa_card_cache_hit_ratio', 'Dashboard card fragment cache hit ratio.',
+                         fragment_stats['hit_ratio'])
+        lines += _scalar('mfa_secret_decryptions_total', 'Account secrets decrypted (key cache misses).',
+                         key_stats['misses'], 'counter')
+        lines += _scalar('mfa_key_cache_hit_ratio', 'Decrypted account key cache hit ratio.', key_stats['hit_ratio'])
+        lines += _scalar('mfa_audit_events_recorded_total', 'Audit events queued for writing.',
+                         audit_stats['recorded'], 'counter')
+        lines += _scalar('mfa_audit_events_dropped_total', 'Audit events dropped because the queue was full.',
+                         audit_stats['dropped'], 'counter')
+        lines += _scalar('mfa_audit_events_written_total', 'Audit events written to the database.',
+                         audit_stats['written'], 'counter')
+        lines += _scalar('mfa_audit_events_failed_total', 'Audit events that could not be written.',
+                         audit_stats['failed'], 'counter')
+        lines += _scalar('mfa_audit_queue_depth', 'Audit events waiting to be written.', audit_stats['queued'])
+        lines += _scalar('mfa_process_start_time_seconds', 'Unix time the process started.', self.started)
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Command-line TOTP codes for MFA Manager
+Reads accounts straight from the SQLite database with sqlite3 and generates
+codes with totp_engine, without importing Flask, SQLAlchemy or qrcode, so a
+code is printed in a few tens of milliseconds. Encrypted secrets are
+decrypted with the master key the web app uses (ENCRYPTION_KEY_FILE or
+SECRET_KEY), which is only loaded once an encrypted secret is found.
+
+Usage:
+    python mfa_cli.py                        # codes for all visible accounts
+    python mfa_cli.py github                 # accounts whose name contains "github"
+    python mfa_cli.py --issuer 'Goo*' --json
+    python mfa_cli.py --id 3 --code-only     # just the code, for scripts
+    python mfa_cli.py --watch                # refresh whenever a period rolls over
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+import totp_engine
+from secret_store import SecretStore, is_encrypted
+from step_scheduler import StepScheduler
+
+
+def resolve_database_path(path=None):
+    """
+    Resolve the database path the way the web app does.
+
+    Flask-SQLAlchemy puts relative SQLite paths in the app's instance folder,
+    so a relative DATABASE_PATH is resolved against <app directory>/instance.
+    """
+    if not path:
+        # config loads .env through python-dotenv, which costs more than the rest
+        # of this script; it never overrides a variable that is already set
+        path = os.environ.get('DATABASE_PATH')
+        if path is None:
+            from config import get_database_path
+            path = get_database_path()
+    if os.path.isabs(path):
+        return path
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', path)
+
+
+def _uri_path(path):
+    """Quote the characters that are special in an SQLite URI filename"""
+    return path.replace('%', '%25').replace('?', '%3f').replace('#', '%23')
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _like_pattern(pattern):
+    """Turn a shell-style pattern (* and ?) into a LIKE pattern with \\ as the escape character"""
+    return _escape_like(pattern).replace('*', '%').replace('?', '_')
+
+
+def find_accounts(connection, name=None, issuer=None, ids=None, include_hidden=False):
+    """
+    Select accounts by name substring, issuer pattern and/or ids (all case-insensitive).
+
+    Accounts asked for by id are returned even if hidden.
+
+    Returns:
+        list: sqlite3.Row objects with id, account_name, secret, issuer, digits, period and algorithm, ordered by name
+    """
+    conditions, parameters = [], []
+    if name:
+        conditions.append("account_name LIKE ? ESCAPE '\\'")
+        parameters.append('%' + _escape_like(name) + '%')
+    if issuer:
+        conditions.append("issuer LIKE ? ESCAPE '\\'")
+        parameters.append(_like_pattern(issuer))
+    if ids:
+        conditions.append(f"id IN ({', '.join('?' * len(ids))})")
+        parameters.extend(ids)
+    elif not include_hidden:
+        conditions.append("NOT hidden")
+
+    sql = "SELECT id, account_name, secret, issuer, digits, period, algorithm FROM mfa_accounts"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return connection.execute(sql + " ORDER BY account_name COLLATE NOCASE, id", parameters).fetchall()
+
+
+def load_keys(store, accounts):
+    """Configure a SecretStore with the master keys, if any account's secret is encrypted"""
+    if not store.configured and any(is_encrypted(account['secret']) for account in accounts):
+        # Imported here for the same reason as in resolve_database_path
+        from config import get_encryption_options
+        store.configure(get_encryption_options())
+
+
+def code_entries(accounts, timestamp=None, store=None):
+    """
+    Current code for each account, in the same shape as the /api/codes entries plus issuer.
+
+    Raises:
+        ValueError: If a secret is encrypted and the store can't decrypt it
+    """
+    if timestamp is None:
+        timestamp = time.time()
+    if store is None:
+        store = SecretStore()
+    return [{
+        'id': account['id'],
+        'account_name': account['account_name'],
+        'issuer': account['issuer'],
+        'totp_code': store.totp_key(
+            account['secret'], account['digits'], account['period'], account['algorithm']
+        ).code_at(timestamp),
+        'remaining_time': totp_engine.remaining_time(timestamp, account['period']),
+        'valid_until': (int(timestamp) // account['period'] + 1) * account['period']
+    } for account in accounts]
+
+
+def format_entries(entries, output_format):
+    """Render entries as text lines, JSON, or bare codes"""
+    if output_format == 'json':
+        import json
+        return json.dumps(entries)
+    if output_format == 'code':
+        return '\n'.join(entry['totp_code'] for entry in entries)
+
+    width = max(len(entry['account_name']) for entry in entries)
+    return '\n'.join(
+        f"{entry['totp_code']}  {entry['account_name']:<{width}}  {entry['issuer'] or ''}  ({entry['remaining_time']}s)"
+        for entry in entries
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Print TOTP codes from the MFA Manager database')
+    parser.add_argument('name', nargs='?', help='Case-insensitive substring of the account name')
+    parser.add_argument('--issuer', help="Issuer pattern, * and ? are wildcards (e.g. 'Goo*')")
+    parser.add_argument('--id', type=int, action='append', dest='ids', help='Account id (repeatable)')
+    parser.add_argument('--all', action='store_true', help='Include hidden accounts')
+    parser.add_argument('--json', action='store_const', const='json', dest='output_format',
+                        help='Print a JSON array (one array per line in watch mode)')
+    parser.add_argument('--code-only', action='store_const', const='code', dest='output_format',
+                        help='Print only the codes, one per line')
+    parser.add_argument('--watch', action='store_true', help="Print fresh codes whenever an account's period rolls over")
+    parser.add_argument('--database', help='Database file (default: DATABASE_PATH, resolved as the web app does)')
+    args = parser.parse_args(argv)
+
+    path = os.path.abspath(args.database) if args.database else resolve_database_path()
+    if not os.path.exists(path):
+        print(f"❌ Database not found: {path}", file=sys.stderr)
+        return 2
+
+    store = SecretStore()
+    try:
+        while True:
+            # Re-read the accounts each time so watch mode follows edits made in the web app
+            connection = sqlite3.connect(f'file:{_uri_path(path)}?mode=ro', uri=True)
+            connection.row_factory = sqlite3.Row
+            try:
+                accounts = find_accounts(connection, args.name, args.issuer, args.ids, args.all)
+            except sqlite3.OperationalError as e:
+                print(f"❌ Could not read accounts from {path}: {e}", file=sys.stderr)
+                return 2
+            finally:
+                connection.close()
+
+            if not accounts:
+                print("No matching accounts.", file=sys.stderr)
+                return 1
+
+            try:
+                load_keys(store, accounts)
+                entries = code_entries(accounts, store=store)
+            except ValueError as e:
+                print(f"❌ Could not decrypt secrets from {path}: {e}", file=sys.stderr)
+                return 2
+
+            print(format_entries(entries, args.output_format or 'text'), flush=True)
+            if not args.watch:
+                return 0
+            # Sleep until the first of the accounts' period groups rolls over
+            time.sleep(max(0, StepScheduler({account['period'] for account in accounts}).next_boundary() - time.time()))
+            if args.output_format != 'json':
+                print()
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,152 @@
+"""
+Versioned schema migrations for MFA Manager
+The schema version is recorded in the SQLite database itself (PRAGMA user_version),
+so startup is two cheap reads (the version and the table names) when the database
+is already current.
+
+Run directly to upgrade the configured database:
+    python migrations.py
+"""
+
+from sqlalchemy import inspect, text
+
+from models import db, AuditEvent
+from search_index import install_search_index, fts5_available, FTS_TABLE
+from accounts_version import install_version_counter, STATE_TABLE
+from secret_store import secret_store
+
+
+def _create_tables(connection):
+    """Create any missing tables for the current models"""
+    db.metadata.create_all(connection)
+
+
+def _add_hidden_column(connection):
+    """Add the hidden column to databases created before it existed"""
+    columns = [column['name'] for column in inspect(connection).get_columns('mfa_accounts')]
+    if 'hidden' not in columns:
+        connection.execute(text("ALTER TABLE mfa_accounts ADD COLUMN hidden BOOLEAN NOT NULL DEFAULT 0"))
+
+
+def _add_performance_indexes(connection):
+    """Index the columns the dashboard filters and name checks use"""
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_mfa_accounts_hidden ON mfa_accounts (hidden)"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_mfa_accounts_issuer ON mfa_accounts (issuer)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_mfa_accounts_account_name_nocase "
+        "ON mfa_accounts (account_name COLLATE NOCASE)"
+    ))
+
+
+def _add_search_index(connection):
+    """Add the FTS5 search index and its sync triggers"""
+    install_search_index(connection)
+
+
+def _add_accounts_version_counter(connection):
+    """Add the shared accounts version counter and the triggers that bump it"""
+    install_version_counter(connection)
+
+
+def _encrypt_secrets(connection):
+    """Encrypt plaintext secrets if a master key is configured (otherwise run key_rotation.py encrypt later)"""
+    if secret_store.enabled:
+        # Imported here because key_rotation imports models, like this module, and is otherwise only a command
+        from key_rotation import encrypt_secrets
+        encrypt_secrets(connection, commit=False)
+
+
+def _add_totp_parameter_columns(connection):
+    """Add per-account period, digits and algorithm (existing accounts keep 30 seconds, 6 digits, SHA1)"""
+    columns = [column['name'] for column in inspect(connection).get_columns('mfa_accounts')]
+    for name, definition in (
+        ('period', "INTEGER NOT NULL DEFAULT 30"),
+        ('digits', "INTEGER NOT NULL DEFAULT 6"),
+        ('algorithm', "VARCHAR(10) NOT NULL DEFAULT 'sha1'"),
+    ):
+        if name not in columns:
+            connection.execute(text(f"ALTER TABLE mfa_accounts ADD COLUMN {name} {definition}"))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_mfa_accounts_period ON mfa_accounts (period)"))
+
+
+def _add_audit_log(connection):
+    """Add the audit_events table and its indexes"""
+    AuditEvent.__table__.create(connection, checkfirst=True)
+
+
+# Ordered list of (version, description, function); never renumber or remove entries
+MIGRATIONS = [
+    (1, 'create tables', _create_tables),
+    (2, 'add hidden column', _add_hidden_column),
+    (3, 'add performance indexes', _add_performance_indexes),
+    (4, 'add search index', _add_search_index),
+    (5, 'add accounts version counter', _add_accounts_version_counter),
+    (6, 'encrypt stored secrets', _encrypt_secrets),
+    (7, 'add totp parameter columns', _add_totp_parameter_columns),
+    (8, 'add audit log', _add_audit_log),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(connection):
+    """Get the schema version recorded in the database"""
+    return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def _missing_tables(connection):
+    """Tables of the current schema that the database doesn't have"""
+    required = {'mfa_accounts', STATE_TABLE, AuditEvent.__tablename__}
+    if fts5_available():
+        required.add(FTS_TABLE)
+    existing = connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars()
+    return required - set(existing)
+
+
+def _set_schema_version(connection, version):
+    # PRAGMA values can't be bound parameters
+    connection.execute(text(f"PRAGMA user_version = {int(version)}"))
+
+
+def upgrade(engine, verbose=False):
+    """
+    Apply any pending migrations to the database behind an engine.
+
+    Does nothing beyond reading the schema version and table names if it is
+    already current. A database whose recorded version outlived its tables
+    (e.g. they were dropped) is rebuilt by applying every migration again;
+    each of them skips what already exists.
+
+    Returns:
+        list: Versions that were applied
+    """
+    with engine.connect() as connection:
+        if get_schema_version(connection) >= LATEST_VERSION and not _missing_tables(connection):
+            return []
+
+    applied = []
+    with engine.begin() as connection:
+        current = get_schema_version(connection)
+        if current and _missing_tables(connection):
+            current = 0
+        for version, description, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            if verbose:
+                print(f"Applying migration {version}: {description}")
+            migrate(connection)
+            _set_schema_version(connection, version)
+            applied.append(version)
+    return applied
+
+
+if __name__ == '__main__':
+    # Use the app's engine so the database path resolves exactly as it does when serving
+    from app import app
+
+    with app.app_context():
+        applied = upgrade(db.engine, verbose=True)
+    if applied:
+        print(f"Database upgraded to schema version {LATEST_VERSION}.")
+    else:
+        print(f"Database is already at schema version {LATEST_VERSION}.")
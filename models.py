@@ -1,11 +1,54 @@
+from flask import g, has_app_context
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
 from datetime import datetime, timezone
+import time
+import hashlib
 import pyotp
-import qrcode
-import io
-import base64
+import totp_engine
+from secret_store import secret_store
+
+
+class TenantSession(Session):
+    """Session that runs against the current request's tenant database, if it has one (see tenants.py)"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and has_app_context():
+            shard = g.get('shard')
+            if shard is not None:
+                return shard.engine
+        return super().get_bind(mapper, clause, bind, **kwargs)
+
+
+db = SQLAlchemy(session_options={'class_': TenantSession})
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Apply PRAGMAs (e.g. from config.get_sqlite_pragmas) to every new connection of an SQLite engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+        cursor.close()
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def provisioning_uri(secret, account_name, issuer, digits=totp_engine.DEFAULT_DIGITS,
+                     period=totp_engine.DEFAULT_PERIOD, algorithm=totp_engine.DEFAULT_ALGORITHM):
+    """otpauth:// URI for authenticator apps, naming the parameters only where they differ from the defaults"""
+    return pyotp.totp.TOTP(secret, digits=digits, interval=period, digest=getattr(hashlib, algorithm)).provisioning_uri(
+        name=account_name,
+        issuer_name=issuer
+    )
 
-db = SQLAlchemy()
 
 class MFAAccount(db.Model):
     """Model for storing MFA account information"""
@@ -13,52 +56,86 @@ class MFAAccount(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     account_name = db.Column(db.String(100), nullable=False, unique=True)
-    secret = db.Column(db.String(100), nullable=False)
+    # Encrypted by secret_store (see the secret property); the column keeps its original name
+    stored_secret = db.Column('secret', db.String(512), nullable=False)
     issuer = db.Column(db.String(100), nullable=True, default='MFA Manager')
 
     hidden = db.Column(db.Boolean, nullable=False, default=False)
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
+    # TOTP parameters (see totp_engine.validate_params); accounts sharing a period roll over together
+    period = db.Column(db.Integer, nullable=False, default=totp_engine.DEFAULT_PERIOD,
+                       server_default=str(totp_engine.DEFAULT_PERIOD), index=True)
+    digits = db.Column(db.Integer, nullable=False, default=totp_engine.DEFAULT_DIGITS,
+                       server_default=str(totp_engine.DEFAULT_DIGITS))
+    algorithm = db.Column(db.String(10), nullable=False, default=totp_engine.DEFAULT_ALGORITHM,
+                          server_default=totp_engine.DEFAULT_ALGORITHM)
+    created_at = db.Column(db.DateTime, default=_utcnow)
+    # Part of the dashboard card cache key, so every UPDATE must move it
+    updated_at = db.Column(db.DateTime, default=_utcnow, onupdate=_utcnow)
     
-    def __init__(self, account_name, secret, issuer=None):
+    def __init__(self, account_name, secret, issuer=None, digits=totp_engine.DEFAULT_DIGITS,
+                 period=totp_engine.DEFAULT_PERIOD, algorithm=totp_engine.DEFAULT_ALGORITHM):
         self.account_name = account_name
         self.secret = secret
         if issuer:
             self.issuer = issuer
+        self.digits, self.period, self.algorithm = totp_engine.validate_params(digits, period, algorithm)
+    
+    @property
+    def secret(self):
+        """The base32 secret, decrypted from stored_secret"""
+        return secret_store.decrypt(self.stored_secret)
+    
+    @secret.setter
+    def secret(self, secret):
+        self.stored_secret = secret_store.encrypt(secret)
     
-    def get_totp_code(self):
-        """Generate current TOTP code"""
-        totp = pyotp.TOTP(self.secret)
-        return totp.now()
+    def get_totp_code(self, for_time=None):
+        """Generate TOTP code for a unix timestamp (defaults to the current code)"""
+        if for_time is None:
+            for_time = time.time()
+        # The decrypted key is cached, so this doesn't decrypt on every call
+        return secret_store.totp_key(self.stored_secret, self.digits, self.period, self.algorithm).code_at(for_time)
     
     def get_remaining_time(self):
         """Get remaining time in seconds for current TOTP code"""
-        totp = pyotp.TOTP(self.secret)
-        return 30 - (int(datetime.now().timestamp()) % 30)
+        return totp_engine.remaining_time(period=self.period)
     
     def get_qr_code_url(self):
         """Generate QR code URL for easy setup in authenticator apps"""
-        return pyotp.totp.TOTP(self.secret).provisioning_uri(
-            name=self.account_name,
-            issuer_name=self.issuer
-        )
-    
-    def generate_qr_code_image(self):
-        """Generate QR code image as base64 string"""
-        qr_url = self.get_qr_code_url()
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Convert to base64 string
-        buffer = io.BytesIO()
-        img.save(buffer, format='PNG')
-        buffer.seek(0)
-        img_str = base64.b64encode(buffer.getvalue()).decode()
-        
-        return f"data:image/png;base64,{img_str}"
+        return provisioning_uri(self.secret, self.account_name, self.issuer, self.digits, self.period, self.algorithm)
     
     def __repr__(self):
         return f'<MFAAccount {self.account_name}>'
+
+
+class AuditEvent(db.Model):
+    """An account's code or secret being viewed or copied, or every account being exported (queued by audit_log and written in batches)"""
+    __tablename__ = 'audit_events'
+    # The query API filters by account or action and pages newest first by id
+    __table_args__ = (
+        db.Index('ix_audit_events_account_id_id', 'account_id', 'id'),
+        db.Index('ix_audit_events_action_id', 'action', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    occurred_at = db.Column(db.DateTime, nullable=False, default=_utcnow, index=True)
+    action = db.Column(db.String(20), nullable=False)
+    # Not a foreign key: the trail outlives deleted accounts
+    account_id = db.Column(db.Integer, nullable=True)
+    # Client address and user agent of the request
+    actor = db.Column(db.String(64), nullable=True)
+    user_agent = db.Column(db.String(200), nullable=True)
+    
+    def to_dict(self):
+        """Serialize the event for the audit API"""
+        return {
+            'id': self.id,
+            'occurred_at': self.occurred_at.isoformat(),
+            'action': self.action,
+            'account_id': self.account_id,
+            'actor': self.actor,
+            'user_agent': self.user_agent
+        }
+    
+    def __repr__(self):
+        return f'<AuditEvent {self.action} {self.account_id}>'
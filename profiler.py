@@ -0,0 +1,173 @@
+"""
+Opt-in request profiler for MFA Manager
+Times each request by phase (SQL queries, code generation, QR rendering,
+template rendering, JSON serialization), logs requests slower than
+SLOW_REQUEST_MS with that breakdown, and optionally runs cProfile on a
+sample of requests, writing a .prof file for each slow one.
+
+Everything is off unless enabled through config.get_profiler_options().
+"""
+
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+# Phases in log order; time not covered by any of them is reported as 'other'
+PHASES = ('query', 'codes', 'qr', 'render', 'serialize')
+
+
+class RequestProfiler:
+    """Per-request phase timer with an optional sampled cProfile run"""
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_request_ms = 0
+        self.profile_requests = False
+        self.sample_rate = 0.0
+        self.directory = 'profiles'
+        # cProfile can only profile one request at a time
+        self._profile_lock = threading.Lock()
+
+    def init_app(self, app, engine, options):
+        """Install the request, SQL and template hooks if profiling or the slow-request log is enabled"""
+        self.slow_request_ms = options['slow_request_ms']
+        self.profile_requests = options['profile_requests']
+        self.sample_rate = options['sample_rate']
+        self.directory = options['directory']
+        self.enabled = bool(self.slow_request_ms or self.profile_requests)
+        if not self.enabled:
+            return
+
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._cleanup_request)
+        self.instrument_engine(engine)
+        before_render_template.connect(self._start_render, app)
+        template_rendered.connect(self._finish_render, app)
+
+    def instrument_engine(self, engine):
+        """Time SQL statements run on an engine as the query phase, if profiling is enabled"""
+        if not self.enabled:
+            return
+        event.listen(engine, 'before_cursor_execute', self._start_query)
+        event.listen(engine, 'after_cursor_execute', self._finish_query)
+        event.listen(engine, 'handle_error', self._fail_query)
+
+    @contextmanager
+    def span(self, phase):
+        """Attribute the time spent in the block to a phase of the current request"""
+        if not self.enabled or not has_request_context() or '_profile' not in g:
+            yield
+            return
+        self._enter(phase)
+        try:
+            yield
+        finally:
+            self._exit()
+
+    def _enter(self, phase):
+        state = g.get('_profile')
+        if state is None:
+            return
+        now = time.perf_counter()
+        stack = state['stack']
+        if stack:
+            # Pause the enclosing phase so nested time is only counted once
+            stack[-1][1] = self._add(state, stack[-1][0], stack[-1][1], now)
+        stack.append([phase, now])
+
+    def _exit(self, phase=None):
+        state = g.get('_profile')
+        if state is None or not state['stack'] or phase not in (None, state['stack'][-1][0]):
+            return
+        now = time.perf_counter()
+        phase, started = state['stack'].pop()
+        self._add(state, phase, started, now)
+        if state['stack']:
+            state['stack'][-1][1] = now
+
+    @staticmethod
+    def _add(state, phase, started, now):
+        state['phases'][phase] = state['phases'].get(phase, 0.0) + now - started
+        return now
+
+    def _start_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_profile' in g:
+            g._profile['queries'] += 1
+            self._enter('query')
+
+    def _finish_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and '_profile' in g:
+            self._exit()
+
+    def _fail_query(self, context):
+        # after_cursor_execute doesn't fire for a failed statement, so close its span here
+        if has_request_context() and '_profile' in g:
+            self._exit('query')
+
+    def _start_render(self, sender, template, context, **extra):
+        self._enter('render')
+
+    def _finish_render(self, sender, template, context, **extra):
+        self._exit()
+
+    def _start_request(self):
+        profile = None
+        if (self.profile_requests and random.random() < self.sample_rate
+                and self._profile_lock.acquire(blocking=False)):
+            import cProfile
+            profile = cProfile.Profile()
+        g._profile = {'started': time.perf_counter(), 'phases': {}, 'stack': [], 'queries': 0, 'profile': profile}
+        if profile:
+            profile.enable()
+
+    def _finish_request(self, response):
+        state = g.get('_profile')
+        if state is None:
+            return response
+        elapsed_ms = (time.perf_counter() - state['started']) * 1000
+        profile = self._stop_profile(state)
+
+        phases = {phase: state['phases'].get(phase, 0.0) * 1000 for phase in PHASES}
+        phases['other'] = max(0.0, elapsed_ms - sum(phases.values()))
+        response.headers['Server-Timing'] = ', '.join(
+            f'{phase};dur={duration:.1f}' for phase, duration in phases.items() if duration
+        ) + f', total;dur={elapsed_ms:.1f}'
+
+        if elapsed_ms >= self.slow_request_ms:
+            if self.slow_request_ms:
+                breakdown = ', '.join(f'{phase} {duration:.0f} ms' for phase, duration in phases.items() if duration)
+                print(f"🐢 Slow request: {request.method} {request.full_path.rstrip('?')} -> {response.status_code} "
+                      f"in {elapsed_ms:.0f} ms ({state['queries']} queries; {breakdown})")
+            if profile:
+                self._write_profile(profile, elapsed_ms)
+        return response
+
+    def _cleanup_request(self, exc):
+        state = g.pop('_profile', None)
+        if state is not None:
+            self._stop_profile(state)
+
+    def _stop_profile(self, state):
+        profile = state['profile']
+        if profile is not None:
+            state['profile'] = None
+            profile.disable()
+            self._profile_lock.release()
+        return profile
+
+    def _write_profile(self, profile, elapsed_ms):
+        """Write a sampled profile, named by time, method, path and duration (open with pstats or snakeviz)"""
+        os.makedirs(self.directory, exist_ok=True)
+        path_name = re.sub(r'[^A-Za-z0-9]+', '_', request.path).strip('_') or 'index'
+        filename = f'{int(time.time() * 1000)}-{request.method}-{path_name}-{elapsed_ms:.0f}ms.prof'
+        profile.dump_stats(os.path.join(self.directory, filename))
+
+
+profiler = RequestProfiler()
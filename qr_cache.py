@@ -0,0 +1,83 @@
+"""
+QR code rendering cache for MFA Manager
+Renders provisioning QR codes as PNG or SVG and keeps the most recently
+used images in a bounded LRU cache keyed on (stored secret, account_name,
+issuer), so a lookup never has to decrypt the secret.
+"""
+
+import hashlib
+import io
+
+from lru import LRUCache
+
+CONTENT_TYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def render_qr_code(data, image_format='png'):
+    """
+    Render data as a QR code image.
+
+    SVG output is generated by qrcode itself and never touches Pillow.
+    qrcode (and Pillow, for PNG) are imported on first use, so processes
+    that never render a QR code don't pay for loading them.
+
+    Returns:
+        bytes: Encoded image
+    """
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = io.BytesIO()
+    if image_format == 'svg':
+        from qrcode.image.svg import SvgPathImage
+        qr.make_image(image_factory=SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class QRCodeCache:
+    """Bounded LRU cache of rendered QR code images"""
+
+    def __init__(self, maxsize=256):
+        self._images = LRUCache(maxsize)
+
+    @staticmethod
+    def _account_key(account):
+        return (account.stored_secret, account.account_name, account.issuer,
+                account.digits, account.period, account.algorithm)
+
+    def get(self, account, image_format='png'):
+        """
+        Get the QR code image for an account, rendering it only on a cache miss.
+
+        Returns:
+            tuple: (image bytes, ETag)
+        """
+        def render():
+            image = render_qr_code(account.get_qr_code_url(), image_format)
+            return image, hashlib.sha1(image).hexdigest()
+
+        return self._images.get(self._account_key(account) + (image_format,), render)
+
+    def invalidate(self, account):
+        """Drop every cached image rendered from the account's current secret, name, issuer and TOTP parameters"""
+        account_key = self._account_key(account)
+        self._images.discard(lambda key: key[:-1] == account_key)
+
+    def clear(self):
+        """Drop all cached images and reset the hit/miss counters"""
+        self._images.clear()
+
+    def stats(self):
+        """Get hit/miss counters for the cache"""
+        return self._images.stats()
+
+
+qr_cache = QRCodeCache()
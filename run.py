@@ -6,23 +6,71 @@ A secure Flask application for managing MFA secrets and generating TOTP codes.
 
 import os
 from app import app, db
-from config import get_port, get_host, is_production, get_database_path
+from audit_log import audit_log
+from migrations import upgrade, LATEST_VERSION
+from config import get_port, get_host, is_production, get_database_path, get_server_mode, get_server_options, get_stream_options
 
 def create_database():
-    """Initialize the database with all tables"""
+    """Initialize the database and apply any pending schema migrations"""
     with app.app_context():
-        # Create all database tables
-        db.create_all()
-        # Run migration to add hidden column if it doesn't exist
-        try:
-            from migrate_add_hidden_column import migrate
-            migrate()
-        except Exception as e:
-            # Migration will be handled automatically by SQLAlchemy for new databases
-            # This is just a safety check for existing databases
-            print(f"Note: Migration check completed (this is normal for new databases): {str(e)}")
+        applied = upgrade(db.engine, verbose=True)
+        if applied:
+            print(f"✓ Database upgraded to schema version {LATEST_VERSION}")
         print("✓ Database initialized successfully!")
 
+def _post_fork(server, worker):
+    """Give each forked worker its own database connections instead of the master's"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+def _worker_exit(server, worker):
+    """Write the worker's queued audit events before it exits"""
+    audit_log.close()
+
+def run_production_server(host, port):
+    """
+    Serve the app with gunicorn: pre-forked worker processes, each with a thread pool.
+    
+    Send SIGHUP to the master process for a graceful restart of all workers.
+    Every request, and every open page's live code stream, holds one of a
+    worker's threads, so live streams are capped at MAX_STREAMS per worker
+    and further pages poll instead.
+    
+    Returns:
+        bool: False if gunicorn isn't available (e.g. on Windows)
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("⚠️  Warning: gunicorn is not installed, falling back to the development server")
+        return False
+    
+    options = get_server_options()
+    max_streams = get_stream_options()['max_streams']
+    if max_streams >= options['threads']:
+        print("⚠️  Warning: MAX_STREAMS is not below WEB_THREADS, open pages can take every thread and stall other requests")
+    
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('workers', options['workers'])
+            self.cfg.set('threads', options['threads'])
+            self.cfg.set('timeout', options['timeout'])
+            self.cfg.set('graceful_timeout', options['graceful_timeout'])
+            self.cfg.set('max_requests', options['max_requests'])
+            self.cfg.set('max_requests_jitter', options['max_requests'] // 10)
+            self.cfg.set('post_fork', _post_fork)
+            self.cfg.set('worker_exit', _worker_exit)
+        
+        def load(self):
+            return app
+    
+    print(f"🚀 Production server: {options['workers']} workers x {options['threads']} threads, "
+          f"up to {max_streams} live code streams per worker")
+    ProductionServer().run()
+    return True
+
 def run_app():
     """Run the Flask application"""
     print("\n" + "="*50)
@@ -56,11 +104,14 @@ def run_app():
     
     # Run the application
     try:
+        if get_server_mode() == 'gunicorn' and run_production_server(host, port):
+            return
         app.run(
             debug=not production_mode,
             host=host,
             port=port,
-            use_reloader=not production_mode
+            use_reloader=not production_mode,
+            threaded=True
         )
     except KeyboardInterrupt:
         print("\n👋 MFA Manager stopped by user")
@@ -0,0 +1,163 @@
+"""
+Account search index for MFA Manager
+Keeps an SQLite FTS5 trigram index over account names and issuers in sync
+with the mfa_accounts table through triggers, so substring searches use the
+index instead of scanning the table with ilike('%q%').
+"""
+
+import sqlite3
+from functools import lru_cache
+
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, MFAAccount
+
+FTS_TABLE = 'mfa_accounts_fts'
+
+# Trigram indexes can only match queries of at least this many characters
+MIN_INDEXED_QUERY = 3
+
+_CREATE_STATEMENTS = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        account_name, issuer,
+        content='mfa_accounts', content_rowid='id', tokenize='trigram'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS mfa_accounts_fts_insert AFTER INSERT ON mfa_accounts BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, account_name, issuer)
+        VALUES (new.id, new.account_name, new.issuer);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS mfa_accounts_fts_delete AFTER DELETE ON mfa_accounts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, account_name, issuer)
+        VALUES ('delete', old.id, old.account_name, old.issuer);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS mfa_accounts_fts_update AFTER UPDATE OF account_name, issuer ON mfa_accounts BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, account_name, issuer)
+        VALUES ('delete', old.id, old.account_name, old.issuer);
+        INSERT INTO {FTS_TABLE}(rowid, account_name, issuer)
+        VALUES (new.id, new.account_name, new.issuer);
+    END""",
+]
+
+_SEARCH_SQL = f"""
+    SELECT a.id FROM {FTS_TABLE} f JOIN mfa_accounts a ON a.id = f.rowid
+    WHERE {FTS_TABLE} MATCH :match
+    ORDER BY
+        CASE
+            WHEN a.account_name = :query COLLATE NOCASE THEN 0
+            WHEN a.account_name LIKE :prefix ESCAPE '\\' THEN 1
+            WHEN a.issuer LIKE :prefix ESCAPE '\\' THEN 2
+            ELSE 3
+        END,
+        f.rank, a.id
+    LIMIT :limit
+"""
+
+
+@lru_cache(maxsize=None)
+def fts5_available():
+    """Check (once, on first use) whether this SQLite build has FTS5 with the trigram tokenizer"""
+    connection = sqlite3.connect(':memory:')
+    try:
+        connection.execute("CREATE VIRTUAL TABLE t USING fts5(x, tokenize='trigram')")
+        return True
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def install_search_index(connection):
+    """
+    Create the search index and its sync triggers if they don't exist yet.
+
+    A newly created index is populated from the existing rows. Does nothing
+    on SQLite builds without FTS5 trigram support.
+
+    Returns:
+        bool: True if the index is available
+    """
+    if not fts5_available() or connection.dialect.name != 'sqlite':
+        return False
+
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {'name': FTS_TABLE}
+    ).first()
+
+    for statement in _CREATE_STATEMENTS:
+        connection.execute(text(statement))
+    if not exists:
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def drop_search_index(connection):
+    """Drop the search index (its triggers go away with the mfa_accounts table)"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+@event.listens_for(MFAAccount.__table__, 'after_create')
+def _create_search_index(target, connection, **kw):
+    install_search_index(connection)
+
+
+@event.listens_for(MFAAccount.__table__, 'after_drop')
+def _drop_search_index(target, connection, **kw):
+    drop_search_index(connection)
+
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def _scan_accounts(query, limit=None):
+    """Fallback search with a case-insensitive substring scan"""
+    accounts = MFAAccount.query.filter(
+        db.or_(
+            MFAAccount.account_name.ilike(f'%{query}%'),
+            MFAAccount.issuer.ilike(f'%{query}%')
+        )
+    ).order_by(MFAAccount.id)
+    if limit:
+        accounts = accounts.limit(limit)
+    return accounts.all()
+
+
+def find_accounts(query, limit=None):
+    """
+    Find accounts whose name or issuer contains the query, best matches first.
+
+    Exact name matches rank first, then name prefixes, then issuer prefixes,
+    then any other substring match ordered by FTS relevance. Queries shorter
+    than the trigram size fall back to a table scan.
+
+    Args:
+        query: Case-insensitive search text
+        limit: Maximum number of accounts to return (None for all)
+
+    Returns:
+        list: Matching MFAAccount objects
+    """
+    if not fts5_available() or len(query) < MIN_INDEXED_QUERY:
+        return _scan_accounts(query, limit)
+
+    try:
+        rows = db.session.execute(text(_SEARCH_SQL), {
+            'match': '"' + query.replace('"', '""') + '"',
+            'query': query,
+            'prefix': _escape_like(query) + '%',
+            'limit': limit or -1
+        }).all()
+    except OperationalError:
+        # The index hasn't been installed on this database yet
+        db.session.rollback()
+        return _scan_accounts(query, limit)
+
+    ids = [row[0] for row in rows]
+    if not ids:
+        return []
+
+    accounts = {account.id: account for account in MFAAccount.query.filter(MFAAccount.id.in_(ids))}
+    return [accounts[account_id] for account_id in ids if account_id in accounts]
@@ -0,0 +1,156 @@
+"""
+Envelope encryption of account secrets for MFA Manager
+Each secret is encrypted with its own random data key (AES-256-GCM), and the
+data key is stored alongside it, wrapped by the master key from
+config.get_encryption_options(). Rotating the master key therefore only
+re-wraps data keys. Decrypted TOTP keys are held in a bounded LRU cache keyed
+on the stored value, so the code endpoints decrypt an account once, not on
+every poll.
+
+Stored values look like
+    enc1:<master key id>:<wrapped data key>:<encrypted secret>
+with URL-safe base64 parts. Values without the enc1: prefix are plaintext
+secrets written before encryption was enabled; they are still readable.
+"""
+
+import base64
+import hashlib
+import os
+
+import totp_engine
+from lru import LRUCache
+
+PREFIX = 'enc1:'
+
+_NONCE_SIZE = 12
+
+
+def key_id(master_key):
+    """Short fingerprint naming the master key a value was wrapped with"""
+    return hashlib.sha256(master_key).hexdigest()[:8]
+
+
+def is_encrypted(stored):
+    """Check whether a stored secret is an encrypted value rather than plaintext"""
+    return stored.startswith(PREFIX)
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _seal(key, plaintext, associated_data=None):
+    # cryptography takes ~20 ms to import, so processes that never touch a secret don't load it
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    nonce = os.urandom(_NONCE_SIZE)
+    return nonce + AESGCM(key).encrypt(nonce, plaintext, associated_data)
+
+
+def _open(key, sealed, associated_data=None):
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    try:
+        return AESGCM(key).decrypt(sealed[:_NONCE_SIZE], sealed[_NONCE_SIZE:], associated_data)
+    except InvalidTag:
+        raise ValueError('Encrypted secret failed authentication (wrong key or modified value)') from None
+
+
+class SecretStore:
+    """Encrypts and decrypts stored secrets, caching the decrypted TOTP keys"""
+
+    def __init__(self, maxsize=4096):
+        self.configured = False
+        self.current_key_id = None
+        self._master_keys = {}
+        self._keys = LRUCache(maxsize)
+
+    def configure(self, options):
+        """Load the master keys and cache size from config.get_encryption_options()"""
+        master_keys = [options['master_key']] + list(options['previous_keys'])
+        self._master_keys = {key_id(key): key for key in master_keys if key}
+        self.current_key_id = key_id(options['master_key']) if options['master_key'] else None
+        self._keys.maxsize = options['key_cache_size']
+        self.configured = True
+        self.clear()
+
+    @property
+    def maxsize(self):
+        """Most decrypted keys held in the cache"""
+        return self._keys.maxsize
+
+    @property
+    def enabled(self):
+        """True if new secrets are encrypted (a master key is configured)"""
+        return self.current_key_id is not None
+
+    def encrypt(self, secret):
+        """Encrypt a base32 secret under a fresh data key, or return it unchanged if encryption is off"""
+        if not self.enabled:
+            return secret
+        data_key = os.urandom(32)
+        wrapped = _seal(self._master_keys[self.current_key_id], data_key, self.current_key_id.encode())
+        return f'{PREFIX}{self.current_key_id}:{_b64encode(wrapped)}:{_b64encode(_seal(data_key, secret.encode()))}'
+
+    def _unwrap(self, stored):
+        """Split an encrypted value into its data key and encrypted secret"""
+        try:
+            master_key_id, wrapped, sealed = stored[len(PREFIX):].split(':')
+        except ValueError:
+            raise ValueError('Malformed encrypted secret') from None
+        master_key = self._master_keys.get(master_key_id)
+        if master_key is None:
+            raise ValueError(f'Secret is encrypted with master key {master_key_id}, which is not configured')
+        return _open(master_key, _b64decode(wrapped), master_key_id.encode()), sealed
+
+    def decrypt(self, stored):
+        """
+        Get the base32 secret from a stored value (plaintext values are returned as they are).
+
+        Raises:
+            ValueError: If the value was encrypted with a master key that isn't configured, or was modified
+        """
+        if not is_encrypted(stored):
+            return stored
+        data_key, sealed = self._unwrap(stored)
+        return _open(data_key, _b64decode(sealed)).decode()
+
+    def is_current(self, stored):
+        """Check whether a stored value is already encrypted under the current master key"""
+        return self.enabled and stored.startswith(f'{PREFIX}{self.current_key_id}:')
+
+    def rewrap(self, stored):
+        """
+        Re-wrap an encrypted value's data key under the current master key.
+
+        The encrypted secret itself is kept as it is; plaintext values are encrypted.
+        """
+        if not self.enabled:
+            raise ValueError('No master key is configured')
+        if not is_encrypted(stored):
+            return self.encrypt(stored)
+        data_key, sealed = self._unwrap(stored)
+        wrapped = _seal(self._master_keys[self.current_key_id], data_key, self.current_key_id.encode())
+        return f'{PREFIX}{self.current_key_id}:{_b64encode(wrapped)}:{sealed}'
+
+    def totp_key(self, stored, digits=totp_engine.DEFAULT_DIGITS, period=totp_engine.DEFAULT_PERIOD,
+                 algorithm=totp_engine.DEFAULT_ALGORITHM):
+        """Get the compiled TOTPKey for a stored secret and its parameters, decrypting it only on a cache miss"""
+        return self._keys.get(
+            (stored, digits, period, algorithm),
+            lambda: totp_engine.TOTPKey(totp_engine.decode_secret(self.decrypt(stored)), digits, period, algorithm)
+        )
+
+    def clear(self):
+        """Drop all decrypted keys and reset the hit/miss counters"""
+        self._keys.clear()
+
+    def stats(self):
+        """Get hit/miss counters for the decrypted key cache"""
+        return self._keys.stats()
+
+
+secret_store = SecretStore()
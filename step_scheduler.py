@@ -0,0 +1,65 @@
+"""
+Time step scheduler for MFA Manager
+Accounts are grouped by TOTP period. A heap holds the next step boundary of
+each group, so a live stream or the CLI's watch mode can sleep until the
+next group rolls over and then refresh only the codes of the groups that did,
+instead of polling every second or assuming a single 30-second period.
+"""
+
+import heapq
+import time
+
+from totp_engine import DEFAULT_PERIOD
+
+
+def period_groups(periods):
+    """The set of periods to schedule, the default period if there are no accounts"""
+    return frozenset(periods or ()) or frozenset((DEFAULT_PERIOD,))
+
+
+def next_boundary(period, timestamp):
+    """Unix time at which the step after the one containing the timestamp starts"""
+    return (int(timestamp) // period + 1) * period
+
+
+def current_steps(periods, now=None):
+    """
+    Get the current time step of every period group.
+
+    Returns:
+        tuple: Sorted (period, step) pairs
+    """
+    if now is None:
+        now = time.time()
+    return tuple((period, int(now) // period) for period in sorted(period_groups(periods)))
+
+
+class StepScheduler:
+    """Heap of (next step boundary, period), one entry per period group"""
+
+    def __init__(self, periods=None, now=None):
+        if now is None:
+            now = time.time()
+        self.periods = period_groups(periods)
+        self._heap = [(next_boundary(period, now), period) for period in self.periods]
+        heapq.heapify(self._heap)
+
+    def next_boundary(self):
+        """Unix time of the earliest upcoming step boundary"""
+        return self._heap[0][0]
+
+    def due(self, now=None):
+        """
+        Pop every boundary that has passed and schedule the group's next one.
+
+        Returns:
+            set: Periods whose codes rolled over since the last call
+        """
+        if now is None:
+            now = time.time()
+        rolled = set()
+        while self._heap[0][0] <= now:
+            _, period = self._heap[0]
+            heapq.heapreplace(self._heap, (next_boundary(period, now), period))
+            rolled.add(period)
+        return rolled
@@ -0,0 +1,382 @@
+"""
+Multi-tenant database sharding for MFA Manager
+With TENANT_MODE set (see config.get_tenant_options), each request names a
+tenant by a header, a subdomain or a /t/<tenant> path prefix, and each
+tenant's accounts live in their own SQLite file in TENANT_DIRECTORY, so
+teams never wait on each other's write lock. Models keep using db.session,
+which binds to the request's shard (see models.TenantSession).
+
+Shard engines are opened on first use, migrated, and kept in a bounded LRU.
+Shards beyond MAX_OPEN_SHARDS, or unused for SHARD_IDLE_SECONDS, are closed
+when another shard is acquired or released, but never while a request (or
+a live code stream) is still using them.
+
+Usage:
+    python tenants.py list                      # tenants with their file sizes and account counts
+    python tenants.py create <tenant>           # create and migrate a tenant database
+    python tenants.py compact [<tenant> ...]    # checkpoint, VACUUM and optimize (default: every tenant)
+"""
+
+import os
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from flask import abort, g, has_app_context, request
+from sqlalchemy import create_engine, text
+
+import migrations
+from accounts_version import version_watcher
+from code_cache import TOTPCodeCache, code_cache
+from metrics import metrics
+from models import db, apply_sqlite_pragmas
+from profiler import profiler
+
+# Tenant names double as file names and subdomains
+TENANT_NAME = re.compile(r'^[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?$')
+
+# Endpoints that serve the whole process rather than a tenant
+SHARED_ENDPOINTS = ('static', 'get_metrics', 'healthz')
+
+_PATH_PREFIX = re.compile(r'^/t/([^/]+)(/.*)?$')
+_ENVIRON_KEY = 'mfa_manager.tenant'
+
+
+def split_tenant_prefix(path):
+    """Split a /t/<tenant>/... path into the tenant and the rest of the path, or (None, path) without a prefix"""
+    match = _PATH_PREFIX.match(path)
+    if match is None:
+        return None, path
+    return match.group(1), match.group(2) or '/'
+
+
+class UnknownTenant(LookupError):
+    """Raised for a tenant without a database when tenants aren't created on demand"""
+
+
+class Shard:
+    """An open tenant database: its engine and the code cache for its accounts"""
+
+    def __init__(self, name, path, engine):
+        self.name = name
+        self.path = path
+        self.engine = engine
+        self.code_cache = TOTPCodeCache()
+        self.active = 0
+        self.last_used = time.monotonic()
+
+
+class _PathPrefixMiddleware:
+    """Move a leading /t/<tenant> from PATH_INFO to SCRIPT_NAME, so routes match and url_for keeps the prefix"""
+
+    def __init__(self, wsgi_app, manager):
+        self.wsgi_app = wsgi_app
+        self.manager = manager
+
+    def __call__(self, environ, start_response):
+        if self.manager.mode == 'path':
+            name, path = split_tenant_prefix(environ.get('PATH_INFO', ''))
+            if name is not None:
+                environ[_ENVIRON_KEY] = name
+                environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + f'/t/{name}'
+                environ['PATH_INFO'] = path
+        return self.wsgi_app(environ, start_response)
+
+
+class ShardManager:
+    """Routes requests to per-tenant SQLite databases, keeping a bounded LRU of open engines"""
+
+    def __init__(self):
+        self.mode = 'off'
+        self.header = 'X-Tenant'
+        self.domain = None
+        self.directory = 'tenants'
+        self.auto_create = False
+        self.max_open = 64
+        self.idle_seconds = 300
+        self.pool_size = 2
+        self.opened = 0
+        self.closed = 0
+        self._instance_path = ''
+        self._engine_options = {}
+        self._pragmas = {}
+        self._shards = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app, options, engine_options, pragmas):
+        """Install the routing hooks; shard engines get the app's pool options and SQLite PRAGMAs"""
+        self._instance_path = app.instance_path
+        self._engine_options = engine_options
+        self._pragmas = pragmas
+        app.wsgi_app = _PathPrefixMiddleware(app.wsgi_app, self)
+        app.before_request(self._select_shard)
+        app.after_request(self._vary_on_tenant)
+        app.teardown_request(self._release_shard)
+        self.configure(options)
+
+    def configure(self, options):
+        """Apply settings from config.get_tenant_options(), closing any open shards"""
+        self.close_all()
+        self.mode = options['mode']
+        self.header = options['header']
+        self.domain = options['domain']
+        directory = options['directory']
+        self.directory = directory if os.path.isabs(directory) else os.path.join(self._instance_path, directory)
+        self.auto_create = options['auto_create']
+        self.max_open = options['max_open']
+        self.idle_seconds = options['idle_seconds']
+        self.pool_size = options['pool_size']
+
+    @property
+    def enabled(self):
+        """True if requests are routed to tenant databases"""
+        return self.mode != 'off'
+
+    def path(self, name):
+        """Database file of a tenant"""
+        return os.path.join(self.directory, f'{name}.db')
+
+    def size(self, name):
+        """Bytes a tenant's database takes on disk, including its write-ahead log"""
+        path = self.path(name)
+        return sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+
+    def tenants(self):
+        """Names of every tenant with a database, sorted"""
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            entry[:-3] for entry in os.listdir(self.directory)
+            if entry.endswith('.db') and TENANT_NAME.match(entry[:-3])
+        )
+
+    def tenant_name(self):
+        """The tenant the current request names, or None"""
+        if self.mode == 'header':
+            name = request.headers.get(self.header)
+        elif self.mode == 'subdomain':
+            name = self.tenant_for_host(request.host)
+        else:
+            name = request.environ.get(_ENVIRON_KEY)
+        return name.lower() if name else None
+
+    def tenant_for_host(self, host):
+        """The tenant named by the subdomain of a Host header value, or None"""
+        host = host.rsplit(':', 1)[0].lower()
+        return host[:-len(self.domain) - 1] if host.endswith(f'.{self.domain}') else None
+
+    def acquire(self, name, create=None):
+        """
+        Get a tenant's shard, opening it if needed, and mark it in use until release().
+
+        Args:
+            name: Tenant name
+            create: Create the database if it doesn't exist (defaults to TENANT_AUTO_CREATE)
+
+        Raises:
+            ValueError: If the name isn't a valid tenant name
+            UnknownTenant: If the tenant has no database and isn't created
+        """
+        if not TENANT_NAME.match(name):
+            raise ValueError(f"Invalid tenant name '{name}' (lowercase letters, digits and hyphens)")
+
+        # Opening runs the migrations, so two threads must never open the same database at once
+        with self._lock:
+            shard = self._shards.get(name)
+            if shard is None:
+                path = self.path(name)
+                if not os.path.exists(path) and not (self.auto_create if create is None else create):
+                    raise UnknownTenant(f"Tenant '{name}' does not exist")
+                shard = self._shards[name] = self._open(name, path)
+            self._shards.move_to_end(name)
+            shard.active += 1
+            shard.last_used = time.monotonic()
+
+        self.evict()
+        return shard
+
+    def release(self, shard):
+        """Mark a shard acquired with acquire() as no longer in use by the caller"""
+        with self._lock:
+            shard.active -= 1
+            shard.last_used = time.monotonic()
+        self.evict()
+
+    def evict(self, now=None):
+        """
+        Close the least recently used shards beyond MAX_OPEN_SHARDS, and shards idle for SHARD_IDLE_SECONDS.
+
+        Shards in use are skipped, so the number open can briefly exceed the limit.
+
+        Returns:
+            list: Names of the shards closed
+        """
+        closing = []
+        with self._lock:
+            now = time.monotonic() if now is None else now
+            excess = len(self._shards) - self.max_open
+            for name, shard in list(self._shards.items()):
+                if shard.active:
+                    continue
+                if excess > 0 or now - shard.last_used >= self.idle_seconds:
+                    del self._shards[name]
+                    closing.append(shard)
+                    excess -= 1
+
+        for shard in closing:
+            self._close(shard)
+        return [shard.name for shard in closing]
+
+    def close_all(self):
+        """Close every shard, e.g. after a fork or before reconfiguring"""
+        with self._lock:
+            closing = list(self._shards.values())
+            self._shards.clear()
+        for shard in closing:
+            self._close(shard)
+
+    def open_shards(self):
+        """Names of the open shards, least recently used first"""
+        with self._lock:
+            return list(self._shards)
+
+    def compact(self, name):
+        """
+        Checkpoint a tenant's write-ahead log, VACUUM its database and refresh the query planner statistics.
+
+        Returns:
+            tuple: (bytes on disk before, bytes on disk after)
+        """
+        shard = self.acquire(name, create=False)
+        try:
+            before = self.size(name)
+            with shard.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text('VACUUM'))
+                connection.execute(text('PRAGMA wal_checkpoint(TRUNCATE)'))
+                connection.execute(text('PRAGMA optimize'))
+            return before, self.size(name)
+        finally:
+            self.release(shard)
+
+    def stats(self):
+        """Get counters for the shard LRU"""
+        with self._lock:
+            return {
+                'open': len(self._shards),
+                'active': sum(1 for shard in self._shards.values() if shard.active),
+                'max_open': self.max_open,
+                'opened': self.opened,
+                'closed': self.closed
+            }
+
+    def _open(self, name, path):
+        os.makedirs(self.directory, exist_ok=True)
+        engine = create_engine(f'sqlite:///{path}', **{**self._engine_options, 'pool_size': self.pool_size})
+        apply_sqlite_pragmas(engine, self._pragmas)
+        metrics.instrument_engine(engine)
+        profiler.instrument_engine(engine)
+        try:
+            migrations.upgrade(engine)
+        except Exception:
+            engine.dispose()
+            raise
+        self.opened += 1
+        return Shard(name, path, engine)
+
+    def _close(self, shard):
+        version_watcher.unwatch(shard.engine)
+        shard.engine.dispose()
+        self.closed += 1
+
+    def _select_shard(self):
+        if not self.enabled or request.endpoint in SHARED_ENDPOINTS:
+            return
+        name = self.tenant_name()
+        if not name:
+            abort(404)
+        try:
+            g.shard = self.acquire(name)
+        except ValueError:
+            abort(400)
+        except UnknownTenant:
+            abort(404)
+
+    def _vary_on_tenant(self, response):
+        if self.mode == 'header':
+            response.vary.add(self.header)
+        return response
+
+    def _release_shard(self, exc):
+        shard = g.pop('shard', None)
+        if shard is not None:
+            # Return the connection before the shard may be closed
+            db.session.remove()
+            self.release(shard)
+
+
+def current_tenant():
+    """Name of the current request's tenant, or '' when it uses the shared database"""
+    shard = g.get('shard') if has_app_context() else None
+    return shard.name if shard is not None else ''
+
+
+def current_engine():
+    """Engine of the current request's database (needs an app context)"""
+    shard = g.get('shard')
+    return shard.engine if shard is not None else db.engine
+
+
+def current_code_cache():
+    """Code cache for the current request's accounts"""
+    shard = g.get('shard') if has_app_context() else None
+    return shard.code_cache if shard is not None else code_cache
+
+
+shards = ShardManager()
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='List, create or compact tenant databases')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help='List tenants with their file sizes and account counts')
+    create_parser = subparsers.add_parser('create', help='Create and migrate a tenant database')
+    create_parser.add_argument('tenant')
+    compact_parser = subparsers.add_parser('compact', help='Checkpoint, VACUUM and optimize tenant databases')
+    compact_parser.add_argument('tenants', nargs='*', help='Tenants to compact (default: all)')
+    args = parser.parse_args()
+
+    # Use the app's configured manager (run as a script, this module is a separate copy) so tenant
+    # databases resolve exactly as when serving
+    from app import shards
+
+    try:
+        if args.command == 'create':
+            shards.release(shards.acquire(args.tenant, create=True))
+            print(f"✓ Tenant '{args.tenant}' created at {shards.path(args.tenant)}")
+        elif args.command == 'compact':
+            for name in args.tenants or shards.tenants():
+                before, after = shards.compact(name)
+                print(f"✓ {name}: {before / 1024:.1f} KiB -> {after / 1024:.1f} KiB")
+        else:
+            for name in shards.tenants():
+                shard = shards.acquire(name, create=False)
+                try:
+                    with shard.engine.connect() as connection:
+                        accounts = connection.execute(text('SELECT COUNT(*) FROM mfa_accounts')).scalar()
+                finally:
+                    shards.release(shard)
+                print(f"{name:<32} {shards.size(name) / 1024:>10.1f} KiB {accounts:>8} accounts")
+    except (ValueError, UnknownTenant) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    finally:
+        shards.close_all()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,499 @@
+import gzip
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import threading
+import unittest
+from unittest import mock
+
+import pyotp
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import app, db
+from models import MFAAccount
+from code_cache import code_cache
+from qr_cache import qr_cache
+from fragment_cache import fragment_cache
+
+# A fixed clock halfway through a 30-second step, for tests that compare codes or ETags across requests
+FROZEN_TIME = 1_700_000_025.0
+
+
+class TestCodeAPI(unittest.TestCase):
+    """Unit tests for the live code API endpoints"""
+
+    def setUp(self):
+        """Set up test client and test database"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        test_accounts = [
+            MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'),
+            MFAAccount(account_name='Google Account', secret='JBSWY3DPEHPK3PXQ', issuer='Google'),
+        ]
+        for account in test_accounts:
+            db.session.add(account)
+        db.session.commit()
+        code_cache.clear()
+        fragment_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def read_event(self, chunks):
+        """Read chunks from an SSE response until a full event has arrived"""
+        for chunk in chunks:
+            text = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if text.startswith('event:'):
+                lines = dict(line.split(': ', 1) for line in text.strip().split('\n'))
+                return lines['event'], json.loads(lines['data'])
+        return None, None
+
+    def test_codes_stream_pushes_current_codes(self):
+        """Test case 1: /api/codes/stream sends the current codes as an SSE event"""
+        response = self.client.get('/api/codes/stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.mimetype.startswith('text/event-stream'))
+
+        event, data = self.read_event(response.response)
+        self.assertEqual(event, 'codes')
+        self.assertEqual({account['account_name'] for account in data}, {'GitHub Account', 'Google Account'})
+        self.assertTrue(all(len(account['totp_code']) == 6 for account in data))
+        response.close()
+
+    def test_single_code_stream(self):
+        """Test case 2: /api/code/<id>/stream sends the account's code"""
+        response = self.client.get('/api/code/1/stream')
+        event, data = self.read_event(response.response)
+        self.assertEqual(event, 'codes')
+        self.assertEqual(data['id'], 1)
+        response.close()
+
+    def test_single_code_stream_unknown_account(self):
+        """Test case 3: streaming an unknown account returns 404"""
+        response = self.client.get('/api/code/999/stream')
+        self.assertEqual(response.status_code, 404)
+
+    @mock.patch('time.time', mock.Mock(return_value=FROZEN_TIME))
+    def test_codes_conditional_get(self):
+        """Test case 4: /api/codes returns 304 when the client has the current ETag"""
+        response = self.client.get('/api/codes')
+        etag = response.headers['ETag']
+        self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/codes', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['ETag'], etag)
+
+    @mock.patch('time.time', mock.Mock(return_value=FROZEN_TIME))
+    def test_etag_depends_on_query(self):
+        """Test case 5: different searches get different ETags"""
+        github = self.client.get('/api/search?q=GitHub').headers['ETag']
+        google = self.client.get('/api/search?q=Google').headers['ETag']
+        self.assertNotEqual(github, google)
+
+        response = self.client.get('/api/search?q=Google', headers={'If-None-Match': github})
+        self.assertEqual(response.status_code, 200)
+
+    @mock.patch('time.time', mock.Mock(return_value=FROZEN_TIME))
+    def test_etag_changes_when_accounts_change(self):
+        """Test case 6: hiding an account invalidates the single-code ETag"""
+        etag = self.client.get('/api/code/1').headers['ETag']
+        self.client.post('/toggle_hidden/1')
+
+        response = self.client.get('/api/code/1', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_code_window(self):
+        """Test case 7: window=N returns the current code plus N lookahead codes"""
+        data = self.client.get('/api/code/1?window=2').get_json()
+        account = db.session.get(MFAAccount, 1)
+
+        self.assertEqual(len(data['codes']), 3)
+        self.assertEqual(data['codes'][0]['totp_code'], data['totp_code'])
+        for previous, code in zip(data['codes'], data['codes'][1:]):
+            self.assertEqual(code['valid_from'], previous['valid_until'])
+        for code in data['codes']:
+            self.assertEqual(code['valid_until'] - code['valid_from'], 30)
+            self.assertEqual(code['totp_code'], account.get_totp_code(for_time=code['valid_from']))
+
+    def test_codes_window_and_invalid_window(self):
+        """Test case 8: /api/codes accepts window and rejects out-of-range values"""
+        data = self.client.get('/api/codes?window=1').get_json()
+        self.assertTrue(all(len(account['codes']) == 2 for account in data))
+
+        self.assertEqual(self.client.get('/api/codes?window=-1').status_code, 400)
+        self.assertEqual(self.client.get('/api/codes?window=abc').status_code, 400)
+        self.assertEqual(self.client.get('/api/code/1?window=99').status_code, 400)
+
+    def test_codes_cursor_pagination(self):
+        """Test case 9: /api/codes pages through accounts by id with limit and cursor, or up to an id with through"""
+        db.session.add(MFAAccount(account_name='AWS Console', secret='JBSWY3DPEHPK3PXR', issuer='Amazon'))
+        db.session.commit()
+
+        response = self.client.get('/api/codes?limit=2')
+        self.assertEqual([account['id'] for account in response.get_json()], [1, 2])
+        cursor = response.headers['X-Next-Cursor']
+
+        response = self.client.get(f'/api/codes?limit=2&cursor={cursor}')
+        self.assertEqual([account['id'] for account in response.get_json()], [3])
+        self.assertNotIn('X-Next-Cursor', response.headers)
+
+        # The dashboard only asks for the accounts whose cards it has loaded
+        response = self.client.get('/api/codes?through=2')
+        self.assertEqual([account['id'] for account in response.get_json()], [1, 2])
+
+        self.assertEqual(self.client.get('/api/codes?limit=0').status_code, 400)
+        self.assertEqual(self.client.get('/api/codes?cursor=x').status_code, 400)
+
+    def test_codes_field_selection(self):
+        """Test case 10: fields= returns only the selected fields plus id"""
+        data = self.client.get('/api/codes?fields=totp_code').get_json()
+        self.assertEqual(set(data[0]), {'id', 'totp_code'})
+
+        data = self.client.get('/api/search?q=Google&fields=issuer').get_json()
+        self.assertEqual(data, [{'id': 2, 'issuer': 'Google'}])
+
+        response = self.client.get('/api/codes?fields=secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_dashboard_partial_pages(self):
+        """Test case 11: the dashboard serves later pages as card fragments"""
+        response = self.client.get('/?partial=true&cursor=1')
+        self.assertEqual(response.status_code, 200)
+        html = response.get_data(as_text=True)
+        self.assertIn('Google Account', html)
+        self.assertNotIn('GitHub Account', html)
+        self.assertNotIn('<html', html)
+
+    def test_codes_columnar_format(self):
+        """Test case 12: format=columnar returns parallel arrays with each account's expiry and period"""
+        db.session.add(MFAAccount(account_name='AWS Account', secret='JBSWY3DPEHPK3PXR', period=60))
+        db.session.commit()
+        rows = self.client.get('/api/codes?window=1').get_json()
+        data = self.client.get('/api/codes?window=1&format=columnar').get_json()
+
+        self.assertEqual(data['id'], [row['id'] for row in rows])
+        self.assertEqual(data['totp_code'], [row['totp_code'] for row in rows])
+        self.assertEqual(data['codes'], [[code['totp_code'] for code in row['codes']] for row in rows])
+        self.assertEqual(data['period'], [30, 30, 60])
+        for index, row in enumerate(rows):
+            for position, code in enumerate(row['codes']):
+                self.assertEqual(code['valid_until'], data['valid_until'][index] + position * data['period'][index])
+        self.assertEqual(len(data['remaining_time']), 3)
+
+        self.assertEqual(self.client.get('/api/codes?format=xml').status_code, 400)
+
+    def test_msgpack_negotiation(self):
+        """Test case 13: clients that prefer MessagePack get it, with a distinct ETag"""
+        import msgpack
+
+        json_response = self.client.get('/api/codes?format=columnar')
+        response = self.client.get('/api/codes?format=columnar', headers={'Accept': 'application/x-msgpack'})
+        self.assertEqual(response.mimetype, 'application/x-msgpack')
+        self.assertEqual(msgpack.unpackb(response.data)['id'], json_response.get_json()['id'])
+        self.assertNotEqual(response.headers['ETag'], json_response.headers['ETag'])
+        self.assertIn('Accept', response.headers['Vary'])
+
+    @mock.patch('time.time', mock.Mock(return_value=FROZEN_TIME))
+    def test_compression_negotiation(self):
+        """Test case 14: large JSON responses are compressed and keep conditional GETs working"""
+        for index in range(50):
+            db.session.add(MFAAccount(account_name=f'Account {index}', secret='JBSWY3DPEHPK3PXP', issuer='Bulk'))
+        db.session.commit()
+
+        plain = self.client.get('/api/codes')
+        self.assertNotIn('Content-Encoding', plain.headers)
+
+        response = self.client.get('/api/codes', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(response.data)), plain.get_json())
+        self.assertTrue(response.headers['ETag'].startswith('W/'))
+
+        response = self.client.get('/api/codes', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+
+        response = self.client.get('/api/codes', headers={
+            'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']
+        })
+        self.assertEqual(response.status_code, 304)
+
+        # Small responses are not worth compressing
+        response = self.client.get('/api/code/1', headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_dashboard_fragment_cache(self):
+        """Test case 15: dashboard cards are rendered once per account version, with fresh codes filled in"""
+        html = self.client.get('/').get_data(as_text=True)
+        self.assertIn(code_cache.get_code(db.session.get(MFAAccount, 1)), html)
+        self.assertNotIn('\x00', html)
+        self.assertEqual(fragment_cache.stats()['misses'], 2)
+
+        self.client.get('/').get_data()
+        self.assertEqual(fragment_cache.stats()['hits'], 2)
+
+        # Editing an account moves its updated_at, so only its card is rendered again
+        self.client.post('/api/accounts/batch', json={'operations': [{'action': 'set_issuer', 'ids': [1], 'issuer': 'Octocat'}]})
+        html = self.client.get('/').get_data(as_text=True)
+        self.assertIn('Octocat', html)
+        self.assertEqual(fragment_cache.stats()['misses'], 3)
+
+        response = self.client.get('/', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn(b'Octocat', gzip.decompress(response.data))
+
+    def test_account_totp_parameters(self):
+        """Test case 16: accounts added with their own period, digits and algorithm get matching codes and URIs"""
+        response = self.client.post('/add', data={
+            'account_name': 'AWS Account', 'secret': 'JBSWY3DPEHPK3PXR',
+            'digits': '8', 'period': '60', 'algorithm': 'sha256'
+        })
+        self.assertEqual(response.status_code, 302)
+        account = MFAAccount.query.filter_by(account_name='AWS Account').one()
+        totp = pyotp.TOTP('JBSWY3DPEHPK3PXR', digits=8, interval=60, digest=hashlib.sha256)
+
+        data = self.client.get(f'/api/code/{account.id}?window=1').get_json()
+        self.assertEqual(data['totp_code'], totp.at(data['codes'][0]['valid_from']))
+        self.assertEqual(data['codes'][0]['valid_until'] % 60, 0)
+        self.assertLessEqual(data['remaining_time'], 60)
+        self.assertIn('algorithm=SHA256&digits=8&period=60', account.get_qr_code_url())
+
+        # Unsupported settings are refused, and editing keeps the account's settings if the form omits them
+        self.client.post('/add', data={'account_name': 'Bad Account', 'secret': 'JBSWY3DPEHPK3PXR', 'digits': '4'})
+        self.assertIsNone(MFAAccount.query.filter_by(account_name='Bad Account').first())
+        self.client.post(f'/edit/{account.id}', data={'account_name': 'AWS Account', 'secret': 'JBSWY3DPEHPK3PXR'})
+        db.session.refresh(account)
+        self.assertEqual((account.digits, account.period, account.algorithm), (8, 60, 'sha256'))
+
+
+    def test_streams_per_process_are_capped(self):
+        """Test case 17: streams beyond MAX_STREAMS get 503 so the page polls, and a closed stream frees its slot"""
+        with mock.patch('app._stream_slots', threading.BoundedSemaphore(1)):
+            first = self.client.get('/api/codes/stream')
+            self.assertEqual(first.status_code, 200)
+            refused = self.client.get('/api/code/1/stream')
+            self.assertEqual(refused.status_code, 503)
+            self.assertIn('Retry-After', refused.headers)
+
+            first.close()
+            second = self.client.get('/api/code/1/stream')
+            self.assertEqual(second.status_code, 200)
+            second.close()
+
+class TestQRCodeEndpoint(unittest.TestCase):
+    """Unit tests for the cached QR code image endpoint"""
+
+    def setUp(self):
+        """Set up test client, test database and an empty QR cache"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.add(MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'))
+        db.session.commit()
+        qr_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_png_is_rendered_once(self):
+        """Test case 1: repeat requests are served from the cache and revalidate with 304"""
+        response = self.client.get('/account/1/qr.png')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertTrue(response.data.startswith(b'\x89PNG'))
+        self.assertIn('private', response.headers['Cache-Control'])
+
+        etag = response.headers['ETag']
+        response = self.client.get('/account/1/qr.png', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(qr_cache.stats()['misses'], 1)
+        self.assertEqual(qr_cache.stats()['hits'], 1)
+
+    def test_svg_output(self):
+        """Test case 2: the SVG variant is served as image/svg+xml"""
+        response = self.client.get('/account/1/qr.svg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/svg+xml')
+        self.assertIn(b'<svg', response.data)
+
+    def test_edit_invalidates_cached_image(self):
+        """Test case 3: editing the account drops the cached image"""
+        etag = self.client.get('/account/1/qr.png').headers['ETag']
+        self.client.post('/edit/1', data={
+            'account_name': 'GitHub Account',
+            'secret': 'JBSWY3DPEHPK3PXQ',
+            'issuer': 'GitHub'
+        })
+        self.assertEqual(qr_cache.stats()['size'], 0)
+
+        response = self.client.get('/account/1/qr.png', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_unknown_account(self):
+        """Test case 4: unknown accounts return 404"""
+        self.assertEqual(self.client.get('/account/999/qr.png').status_code, 404)
+
+    def test_qrcode_is_imported_on_first_use(self):
+        """Test case 5: importing the app doesn't load qrcode or Pillow"""
+        loaded = subprocess.run(
+            [sys.executable, '-c', "import sys, app; print(sorted({'qrcode', 'PIL'} & set(sys.modules)))"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip().splitlines()[-1]
+        self.assertEqual(loaded, '[]')
+
+
+class TestAccountsBatchAndExport(unittest.TestCase):
+    """Unit tests for the batch mutation and export endpoints"""
+
+    def setUp(self):
+        """Set up test client and test database"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        for index in range(5):
+            db.session.add(MFAAccount(account_name=f'Account {index}', secret='JBSWY3DPEHPK3PXP', issuer='Old'))
+        db.session.commit()
+        code_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_batch_operations(self):
+        """Test case 1: several operations are applied in one request"""
+        response = self.client.post('/api/accounts/batch', json={'operations': [
+            {'action': 'hide', 'ids': [1, 2, 3]},
+            {'action': 'unhide', 'ids': [3]},
+            {'action': 'set_issuer', 'ids': [1, 2, 3, 4], 'issuer': 'New'},
+            {'action': 'delete', 'ids': [5, 999]},
+        ]})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([result['affected'] for result in response.get_json()['results']], [3, 1, 4, 1])
+
+        accounts = {account.id: account for account in MFAAccount.query.all()}
+        self.assertEqual(sorted(accounts), [1, 2, 3, 4])
+        self.assertEqual([accounts[i].hidden for i in (1, 2, 3, 4)], [True, True, False, False])
+        self.assertEqual({account.issuer for account in accounts.values()}, {'New'})
+
+        visible = self.client.get('/api/codes').get_json()
+        self.assertEqual([account['id'] for account in visible], [3, 4])
+
+    def test_batch_rejects_invalid_requests(self):
+        """Test case 2: invalid operations are rejected without changing anything"""
+        for body in (
+            {},
+            {'operations': [{'action': 'explode', 'ids': [1]}]},
+            {'operations': [{'action': 'hide', 'ids': ['1']}]},
+            {'operations': [{'action': 'hide', 'ids': [1]}, {'action': 'set_issuer', 'ids': [1]}]},
+        ):
+            response = self.client.post('/api/accounts/batch', json=body)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.get_json()['status'], 'error')
+        self.assertFalse(MFAAccount.query.filter_by(hidden=True).count())
+
+    def test_export_formats(self):
+        """Test case 3: exports stream one NDJSON object or otpauth URI per account"""
+        response = self.client.get('/api/export')
+        self.assertEqual(response.mimetype, 'application/x-ndjson')
+        self.assertEqual(response.headers['Cache-Control'], 'no-store')
+        rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        self.assertEqual([row['account_name'] for row in rows], [f'Account {index}' for index in range(5)])
+        self.assertEqual(rows[0]['secret'], 'JBSWY3DPEHPK3PXP')
+
+        lines = self.client.get('/api/export?format=otpauth').get_data(as_text=True).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertTrue(lines[0].startswith('otpauth://totp/Old:Account%200?secret=JBSWY3DPEHPK3PXP'))
+
+        self.assertEqual(self.client.get('/api/export?format=csv').status_code, 400)
+
+
+class TestMetricsAndHealth(unittest.TestCase):
+    """Unit tests for the /metrics and /healthz endpoints"""
+
+    def setUp(self):
+        """Set up test client and test database"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.add(MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'))
+        db.session.commit()
+        code_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_healthz(self):
+        """Test case 1: /healthz answers without computing codes"""
+        response = self.client.get('/healthz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'status': 'ok'})
+        self.assertEqual(code_cache.stats()['misses'], 0)
+
+    def test_metrics_exposition(self):
+        """Test case 2: /metrics reports route, SQL and cache metrics in Prometheus text format"""
+        self.client.get('/api/code/1')
+        self.client.get('/api/code/1')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.content_type.startswith('text/plain'))
+        body = response.get_data(as_text=True)
+
+        self.assertRegex(body, r'mfa_http_requests_total\{route="/api/code/<int:account_id>",method="GET",status="200"\} \d+')
+        self.assertIn('mfa_http_request_duration_seconds_bucket{route="/api/code/<int:account_id>",method="GET",le="+Inf"}', body)
+        self.assertRegex(body, r'mfa_db_query_duration_seconds_count [1-9]')
+        self.assertIn('mfa_totp_codes_computed_total 1\n', body)
+        self.assertIn('mfa_code_cache_hit_ratio 0.5\n', body)
+
+    def test_failed_queries_are_not_left_open(self):
+        """Test case 3: a failed statement doesn't leave its start time on the pooled connection"""
+        with db.engine.connect() as connection:
+            with self.assertRaises(OperationalError):
+                connection.execute(text('SELECT * FROM no_such_table'))
+            self.assertEqual(connection.info.get('_metrics_query_started'), [])
+
+    def test_in_memory_database(self):
+        """Test case 4: the app starts on an in-memory database, which gets no pool sizing"""
+        status = subprocess.run(
+            [sys.executable, '-c', "from app import app; print(app.test_client().get('/healthz').status_code)"],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+            env={**os.environ, 'DATABASE_PATH': ':memory:'}
+        ).stdout.strip().splitlines()[-1]
+        self.assertEqual(status, '200')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,171 @@
+import asyncio
+import json
+import unittest
+
+from app import app, db
+from models import MFAAccount, AuditEvent
+from audit_log import audit_log
+from asgi import CodeServer
+
+
+async def _request(server, path, query=b'', headers=()):
+    """Run one plain request through the ASGI app and return (status, headers, body)"""
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': list(headers),
+             'client': ('127.0.0.1', 50000)}
+    await server(scope, receive, send)
+    response_headers = {key.decode(): value.decode() for key, value in messages[0]['headers']}
+    return messages[0]['status'], response_headers, b''.join(message.get('body', b'') for message in messages[1:])
+
+
+class _Stream:
+    """An open ASGI stream whose events can be read one at a time"""
+
+    def __init__(self, server, path, query=b''):
+        self.events = asyncio.Queue()
+        self._disconnected = asyncio.Event()
+        scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query, 'headers': []}
+        self.task = asyncio.ensure_future(server(scope, self._receive, self._send))
+
+    async def _receive(self):
+        await self._disconnected.wait()
+        return {'type': 'http.disconnect'}
+
+    async def _send(self, message):
+        body = message.get('body', b'').decode()
+        if body.startswith('event:'):
+            lines = dict(line.split(': ', 1) for line in body.strip().split('\n'))
+            await self.events.put((lines['event'], json.loads(lines['data'])))
+
+    async def next_event(self):
+        return await asyncio.wait_for(self.events.get(), 5)
+
+    async def close(self):
+        self._disconnected.set()
+        await asyncio.wait_for(self.task, 5)
+
+
+class TestASGICodeServer(unittest.TestCase):
+    """Unit tests for the asynchronous code API serving path"""
+
+    def setUp(self):
+        """Set up test accounts and a fresh ASGI app"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+        with app.app_context():
+            db.create_all()
+            db.session.add(MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'))
+            db.session.add(MFAAccount(account_name='Google Account', secret='JBSWY3DPEHPK3PXQ', issuer='Google'))
+            db.session.commit()
+        self.server = CodeServer()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        with app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+    def test_codes_match_flask(self):
+        """Test case 1: /api/codes sends the Flask app's payload and ETag, and revalidates with 304"""
+        async def scenario():
+            status, headers, body = await _request(self.server, '/api/codes', b'window=1&format=columnar')
+            revalidated = await _request(self.server, '/api/codes', b'window=1&format=columnar',
+                                         [(b'if-none-match', headers['etag'].encode())])
+            invalid = await _request(self.server, '/api/codes', b'window=99')
+            single = await _request(self.server, '/api/code/1', b'fields=totp_code')
+            missing = await _request(self.server, '/api/code/99')
+            scoped = await _request(self.server, '/api/codes', b'through=1&fields=id')
+            return status, headers, body, revalidated, invalid, single, missing, scoped
+
+        status, headers, body, revalidated, invalid, single, missing, scoped = asyncio.run(scenario())
+        flask_response = self.client.get('/api/codes?window=1&format=columnar')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['etag'], flask_response.headers['ETag'])
+        payload, flask_payload = json.loads(body), flask_response.get_json()
+        payload.pop('remaining_time'), flask_payload.pop('remaining_time')
+        self.assertEqual(payload, flask_payload)
+        self.assertEqual(revalidated[0], 304)
+        self.assertEqual(invalid[0], 400)
+        self.assertEqual(set(json.loads(single[2])), {'id', 'totp_code'})
+        self.assertEqual(missing[0], 404)
+        self.assertEqual([entry['id'] for entry in json.loads(scoped[2])], [1])
+
+    def test_stream_fans_out_and_follows_changes(self):
+        """Test case 2: subscribers share one channel, and account changes are pushed to them"""
+        async def scenario():
+            first, second = _Stream(self.server, '/api/codes/stream'), _Stream(self.server, '/api/codes/stream')
+            events = [await first.next_event(), await second.next_event()]
+            snapshot = self.server.snapshots['']
+            self.assertEqual(len(snapshot.channels), 1)
+            self.assertEqual(next(iter(snapshot.channels.values())).subscribers, 2)
+
+            # Another process adds an account
+            await asyncio.to_thread(self.client.post, '/add',
+                                    data={'account_name': 'AWS Account', 'secret': 'JBSWY3DPEHPK3PXR'})
+            await self.server.poll()
+            events += [await first.next_event(), await second.next_event()]
+
+            await first.close()
+            await second.close()
+            await self.server.shutdown()
+            return events, snapshot.channels
+
+        events, channels = asyncio.run(scenario())
+        self.assertEqual([len(data) for event, data in events], [2, 2, 3, 3])
+        self.assertEqual(events[2], events[3])
+        self.assertEqual(channels, {})
+
+    def test_single_stream_ends_on_delete(self):
+        """Test case 3: an account's stream sends a deleted event when the account is removed"""
+        async def scenario():
+            stream = _Stream(self.server, '/api/code/1/stream', b'window=1')
+            first = await stream.next_event()
+            await asyncio.to_thread(self.client.post, '/delete/1')
+            await self.server.poll()
+            second = await stream.next_event()
+            await asyncio.wait_for(stream.task, 5)
+            await self.server.shutdown()
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        self.assertEqual(first[0], 'codes')
+        self.assertEqual(len(first[1]['codes']), 2)
+        self.assertEqual(second, ('deleted', {}))
+
+    def test_code_fetches_and_streams_are_audited(self):
+        """Test case 4: sent codes and stream connects are audited like the Flask routes, revalidations and repeat polls aren't"""
+        with app.app_context():
+            audit_log.flush()
+            db.session.execute(AuditEvent.__table__.delete())
+            db.session.commit()
+
+        async def scenario():
+            user_agent = [(b'user-agent', b'asgi-test')]
+            status, headers, body = await _request(self.server, '/api/code/2', headers=user_agent)
+            await _request(self.server, '/api/code/2',
+                           headers=user_agent + [(b'if-none-match', headers['etag'].encode())])
+            await _request(self.server, '/api/code/2', b'poll=1')
+            await _request(self.server, '/api/codes')
+            stream = _Stream(self.server, '/api/code/1/stream')
+            await stream.next_event()
+            await stream.close()
+            await self.server.shutdown()
+
+        asyncio.run(scenario())
+        audit_log.flush()
+        with app.app_context():
+            events = AuditEvent.query.order_by(AuditEvent.id).all()
+            self.assertEqual([(event.action, event.account_id) for event in events], [('code', 2), ('code', 1)])
+            self.assertEqual((events[0].actor, events[0].user_agent), ('127.0.0.1', 'asgi-test'))
+
+
+if __name__ == '__main__':
+    unittest.main()
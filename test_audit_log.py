@@ -0,0 +1,129 @@
+import unittest
+from types import SimpleNamespace
+
+from app import app, db
+from models import MFAAccount, AuditEvent
+from code_cache import code_cache
+from audit_log import audit_log
+
+
+def _options(**overrides):
+    options = {'enabled': True, 'queue_size': 10000, 'batch_size': 500, 'flush_ms': 1000}
+    options.update(overrides)
+    return options
+
+
+class TestAuditLog(unittest.TestCase):
+    """Unit tests for the write-behind audit log and its query API"""
+
+    def setUp(self):
+        """Set up test client and test database"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.add(MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'))
+        db.session.add(MFAAccount(account_name='Google Account', secret='JBSWY3DPEHPK3PXQ', issuer='Google'))
+        db.session.commit()
+        code_cache.clear()
+        # Events from other test modules may still be queued
+        audit_log.configure(_options())
+        db.session.execute(AuditEvent.__table__.delete())
+        db.session.commit()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        audit_log.configure(_options())
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_views_and_copies_are_written_in_batches(self):
+        """Test case 1: views, code fetches and reported copies are queued and written in one transaction"""
+        before = audit_log.stats()
+        self.client.get('/account/1')
+        etag = self.client.get('/api/code/1').headers['ETag']
+        # A revalidated code was not sent again, so it isn't audited
+        self.client.get('/api/code/1', headers={'If-None-Match': etag})
+        # Nor are the detail page's repeat polls
+        self.client.get('/api/code/1?poll=1')
+        response = self.client.post('/api/audit', json={'account_id': 2, 'action': 'copy_secret'},
+                                    headers={'User-Agent': 'audit-test'})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(AuditEvent.query.count(), 0)
+
+        audit_log.flush()
+        stats = audit_log.stats()
+        self.assertEqual([stats[key] - before[key] for key in ('recorded', 'written', 'batches')], [3, 3, 1])
+
+        events = self.client.get('/api/audit').get_json()
+        self.assertEqual([(event['action'], event['account_id']) for event in events],
+                         [('copy_secret', 2), ('code', 1), ('view', 1)])
+        self.assertEqual(events[0]['user_agent'], 'audit-test')
+        self.assertEqual(events[0]['actor'], '127.0.0.1')
+
+    def test_query_filters_and_pages(self):
+        """Test case 2: the query API filters by account, action and time and pages newest first"""
+        for account_id in (1, 2, 1, 1):
+            self.client.post('/api/audit', json={'account_id': account_id, 'action': 'copy_code'})
+        self.client.get('/account/1')
+        audit_log.flush()
+
+        response = self.client.get('/api/audit?account_id=1&action=copy_code&limit=2')
+        first = response.get_json()
+        self.assertEqual(len(first), 2)
+        second = self.client.get(
+            f"/api/audit?account_id=1&action=copy_code&limit=2&cursor={response.headers['X-Next-Cursor']}"
+        ).get_json()
+        self.assertEqual(len(second), 1)
+        self.assertNotIn('X-Next-Cursor', self.client.get('/api/audit?account_id=2').headers)
+        self.assertLess(second[0]['id'], first[-1]['id'])
+
+        self.assertEqual(len(self.client.get('/api/audit?since=2000-01-01T00:00:00Z').get_json()), 5)
+        self.assertEqual(self.client.get('/api/audit?until=2000-01-01').get_json(), [])
+
+        for query in ('action=delete', 'since=yesterday', 'limit=0'):
+            self.assertEqual(self.client.get(f'/api/audit?{query}').status_code, 400)
+        self.assertEqual(self.client.post('/api/audit', json={'account_id': 1, 'action': 'view'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/audit', json={'account_id': 99, 'action': 'copy_code'}).status_code, 404)
+
+    def test_full_queue_drops_and_close_flushes(self):
+        """Test case 3: a full queue drops and counts events, and closing writes what was queued"""
+        audit_log.configure(_options(queue_size=2, batch_size=1, flush_ms=0))
+        before = audit_log.stats()
+        # Stand in for a busy writer so the queue fills up
+        writer = SimpleNamespace(alive=True, is_alive=lambda: writer.alive)
+        audit_log._thread = writer
+        with app.test_request_context():
+            for _ in range(3):
+                audit_log.record('view', 1)
+        self.assertEqual(audit_log.stats()['dropped'] - before['dropped'], 1)
+
+        # Closing starts a writer for whatever is still queued
+        writer.alive = False
+        audit_log.close()
+        stats = audit_log.stats()
+        self.assertEqual([stats[key] - before[key] for key in ('written', 'batches')], [2, 2])
+        self.assertEqual(stats['queued'], 0)
+        self.assertEqual(AuditEvent.query.count(), 2)
+        self.assertIn(f"mfa_audit_events_dropped_total {stats['dropped']}",
+                      self.client.get('/metrics').get_data(as_text=True))
+
+    def test_streams_and_exports_are_audited(self):
+        """Test case 4: an account's stream is audited once per connect and an export once for all accounts"""
+        response = self.client.get('/api/code/1/stream')
+        next(response.response)
+        response.close()
+        self.assertEqual(len(self.client.get('/api/export?format=otpauth').get_data(as_text=True).splitlines()), 2)
+        audit_log.flush()
+
+        events = self.client.get('/api/audit').get_json()
+        self.assertEqual([(event['action'], event['account_id']) for event in events], [('export', None), ('code', 1)])
+        self.assertEqual(len(self.client.get('/api/audit?action=export').get_json()), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
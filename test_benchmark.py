@@ -0,0 +1,45 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import benchmark
+
+
+class TestBenchmark(unittest.TestCase):
+    """Unit tests for the benchmark suite"""
+
+    def test_run_benchmarks(self):
+        """Test case 1: every scenario runs against a seeded scratch database and reports statistics"""
+        # benchmark.py seeds and drops the app's database, so it runs in its own process,
+        # where main() points DATABASE_PATH at a temporary file before the app is imported
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            subprocess.run(
+                [sys.executable, 'benchmark.py', '--sizes', '5', '--iterations', '3', '--output', output],
+                capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+            )
+            with open(output, encoding='utf-8') as output_file:
+                results = json.load(output_file)['results']
+        self.assertEqual(set(results['5']), {scenario[0] for scenario in benchmark.SCENARIOS})
+        for stats in results['5'].values():
+            self.assertEqual(stats['requests'], 3)
+            self.assertLessEqual(stats['min_ms'], stats['p50_ms'])
+            self.assertLessEqual(stats['p50_ms'], stats['max_ms'])
+
+    def test_compare_results(self):
+        """Test case 2: scenarios slower than the threshold are flagged as regressions"""
+        baseline = {'10': {'index': {'p50_ms': 2.0}, 'api_codes': {'p50_ms': 1.0}}}
+        results = {'10': {'index': {'p50_ms': 2.2}, 'api_codes': {'p50_ms': 1.5}, 'api_code': {'p50_ms': 1.0}}}
+
+        comparison = benchmark.compare_results(results, baseline, threshold=0.2)
+        self.assertEqual(
+            {entry['scenario']: entry['regression'] for entry in comparison},
+            {'index': False, 'api_codes': True}
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
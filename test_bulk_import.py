@@ -0,0 +1,112 @@
+import base64
+import io
+import unittest
+from urllib.parse import quote
+
+from app import app, db
+from models import MFAAccount
+from code_cache import code_cache
+import bulk_import
+
+
+def _field(number, value):
+    """Encode a length-delimited or varint protobuf field"""
+    if isinstance(value, int):
+        return bytes([number << 3, value])
+    if isinstance(value, str):
+        value = value.encode()
+    return bytes([number << 3 | 2, len(value)]) + value
+
+
+def _migration_uri(*otp_parameters):
+    payload = b''.join(_field(1, b''.join(_field(n, v) for n, v in params)) for params in otp_parameters)
+    return 'otpauth-migration://offline?data=' + quote(base64.b64encode(payload).decode())
+
+
+class TestBulkImport(unittest.TestCase):
+    """Unit tests for the bulk account importer"""
+
+    def setUp(self):
+        """Set up test client and test database"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        db.session.add(MFAAccount(account_name='existing@example.com', secret='JBSWY3DPEHPK3PXP', issuer='GitHub'))
+        db.session.commit()
+        code_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_parse_otpauth_uri(self):
+        """Test case 1: otpauth:// labels are split into account name and issuer"""
+        self.assertEqual(
+            bulk_import.parse_otpauth_uri('otpauth://totp/ACME%20Co:john@example.com?secret=JBSWY3DPEHPK3PXP'),
+            ('john@example.com', 'JBSWY3DPEHPK3PXP', 'ACME Co', 6, 30, 'sha1')
+        )
+        self.assertEqual(
+            bulk_import.parse_otpauth_uri('otpauth://totp/john?secret=JBSWY3DPEHPK3PXP&algorithm=SHA256&digits=8&period=60'),
+            ('john', 'JBSWY3DPEHPK3PXP', None, 8, 60, 'sha256')
+        )
+        with self.assertRaises(ValueError):
+            bulk_import.parse_otpauth_uri('otpauth://hotp/john?secret=JBSWY3DPEHPK3PXP&counter=0')
+        with self.assertRaises(ValueError):
+            bulk_import.parse_otpauth_uri('otpauth://totp/john?secret=JBSWY3DPEHPK3PXP&algorithm=MD5')
+
+    def test_parse_migration_payload(self):
+        """Test case 2: Google Authenticator exports are decoded with their algorithm and digits, skipping HOTP entries"""
+        uri = _migration_uri(
+            [(1, b'Hello!\xde\xad\xbe\xef'), (2, 'alice@example.com'), (3, 'Google'), (4, 1), (5, 1), (6, 2)],
+            [(1, b'12345'), (2, 'counter'), (6, 1)],
+            [(1, b'Hello!\xde\xad\xbe\xef'), (2, 'bob@example.com'), (4, 2), (5, 2), (6, 2)],
+        )
+        entries = bulk_import.parse_migration_payload(uri)
+        self.assertEqual(entries[0], ('alice@example.com', 'JBSWY3DPEHPK3PXP', 'Google', 6, 30, 'sha1'))
+        self.assertIsInstance(entries[1], ValueError)
+        self.assertEqual(entries[2], ('bob@example.com', 'JBSWY3DPEHPK3PXP', None, 8, 30, 'sha256'))
+
+    def test_import_reports_errors_per_line(self):
+        """Test case 3: valid lines are imported and every bad line is reported"""
+        lines = [
+            '# exported accounts',
+            'otpauth://totp/GitHub:new@example.com?secret=JBSWY3DPEHPK3PXP&issuer=GitHub',
+            'otpauth://totp/GitHub:existing@example.com?secret=JBSWY3DPEHPK3PXP',
+            'otpauth://totp/Bad:bad@example.com?secret=not-base32!',
+            'otpauth://totp/GitHub:new@example.com?secret=JBSWY3DPEHPK3PXQ',
+            'https://example.com',
+            '',
+            _migration_uri([(1, b'Hello!\xde\xad\xbe\xef'), (2, 'alice@example.com'), (3, 'Google')]),
+        ]
+        report = bulk_import.import_accounts(lines, chunk_size=2)
+
+        self.assertEqual(report['imported'], 2)
+        self.assertEqual([error['line'] for error in report['errors']], [3, 4, 5, 6])
+        self.assertEqual(report['errors'][0]['error'], 'account name already exists')
+        self.assertEqual(
+            {account.account_name for account in MFAAccount.query.all()},
+            {'existing@example.com', 'new@example.com', 'alice@example.com'}
+        )
+
+    def test_import_endpoint_accepts_uploads(self):
+        """Test case 4: /api/import streams an uploaded file"""
+        data = b'otpauth://totp/Slack:bob@example.com?secret=JBSWY3DPEHPK3PXP\n'
+        response = self.client.post('/api/import', data={'file': (io.BytesIO(data), 'accounts.txt')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json(), {'status': 'success', 'imported': 1, 'errors': []})
+
+        codes = self.client.get('/api/codes').get_json()
+        self.assertIn('bob@example.com', {account['account_name'] for account in codes})
+
+        response = self.client.post('/api/import', data=data, content_type='text/plain')
+        self.assertEqual(response.get_json()['errors'][0]['error'], 'account name already exists')
+
+
+if __name__ == '__main__':
+    unittest.main()
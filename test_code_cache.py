@@ -0,0 +1,105 @@
+import hashlib
+import unittest
+
+import pyotp
+
+from app import app, db
+from accounts_version import sync_accounts_version
+from models import MFAAccount
+from code_cache import TOTPCodeCache, code_cache
+
+
+class TestTOTPCodeCache(unittest.TestCase):
+    """Unit tests for the time-step-keyed TOTP code cache"""
+
+    def setUp(self):
+        """Set up test client, test database and an empty cache"""
+        app.config['TESTING'] = True
+        self.client = app.test_client()
+
+        self.app_context = app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+        self.account = MFAAccount(
+            account_name='GitHub Account',
+            secret='JBSWY3DPEHPK3PXP',
+            issuer='GitHub'
+        )
+        db.session.add(self.account)
+        db.session.commit()
+        code_cache.clear()
+
+    def tearDown(self):
+        """Clean up after tests"""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_code_computed_once_per_time_step(self):
+        """Repeated lookups inside one window are cache hits"""
+        cache = TOTPCodeCache()
+        first = cache.get_code(self.account, timestamp=59)
+        second = cache.get_code(self.account, timestamp=31)
+        self.assertEqual(first, second)
+        self.assertEqual(first, self.account.get_totp_code(for_time=30))
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_new_time_step_is_a_miss(self):
+        """A new window computes a fresh code and evicts the old step"""
+        cache = TOTPCodeCache()
+        cache.get_code(self.account, timestamp=0)
+        code = cache.get_code(self.account, timestamp=30)
+        self.assertEqual(code, self.account.get_totp_code(for_time=30))
+        self.assertEqual(cache.stats()['misses'], 2)
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_changed_secret_is_not_served_from_cache(self):
+        """An entry computed from an old secret is never returned"""
+        cache = TOTPCodeCache()
+        cache.get_code(self.account, timestamp=0)
+        self.account.secret = 'JBSWY3DPEHPK3PXQ'
+        code = cache.get_code(self.account, timestamp=0)
+        self.assertEqual(code, self.account.get_totp_code(for_time=0))
+        self.assertEqual(cache.stats()['hits'], 0)
+
+    def test_periods_are_cached_and_pruned_separately(self):
+        """A 60-second account keeps its code across a 30-second rollover and matches pyotp"""
+        account = MFAAccount(account_name='AWS Account', secret='JBSWY3DPEHPK3PXQ', digits=8, period=60,
+                             algorithm='sha256')
+        db.session.add(account)
+        db.session.commit()
+
+        cache = TOTPCodeCache()
+        cache.get_code(self.account, timestamp=0)
+        code = cache.get_code(account, timestamp=0)
+        self.assertEqual(code, pyotp.TOTP('JBSWY3DPEHPK3PXQ', digits=8, interval=60, digest=hashlib.sha256).at(0))
+        cache.get_code(self.account, timestamp=30)
+        self.assertEqual(cache.get_code(account, timestamp=30), code)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['size'], 2)
+
+        sync_accounts_version(cache)
+        self.assertEqual(cache.periods, {30, 60})
+        self.assertEqual(cache.steps(timestamp=90), ((30, 3), (60, 1)))
+
+    def test_api_polling_hits_cache_and_edit_invalidates(self):
+        """Polling /api/codes reuses codes until the account is edited"""
+        self.client.get('/api/codes')
+        self.client.get('/api/codes')
+        self.assertGreaterEqual(code_cache.stats()['hits'], 1)
+
+        self.client.post(f'/edit/{self.account.id}', data={
+            'account_name': 'GitHub Account',
+            'secret': 'JBSWY3DPEHPK3PXQ',
+            'issuer': 'GitHub'
+        })
+        self.assertEqual(code_cache.stats()['size'], 0)
+
+        data = self.client.get('/api/cache/stats').get_json()
+        self.assertIn('hit_ratio', data)
+
+
+if __name__ == '__main__':
+    unittest.main()
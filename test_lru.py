@@ -0,0 +1,41 @@
+import unittest
+
+from lru import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Unit tests for the bounded LRU cache shared by the QR, fragment and key caches"""
+
+    def test_least_recently_used_entry_is_evicted(self):
+        """Test case 1: values are computed once per key and the least recently used key is evicted first"""
+        cache = LRUCache(2)
+        computed = []
+
+        def create(key):
+            computed.append(key)
+            return key.upper()
+
+        self.assertEqual(cache.get('a', lambda: create('a')), 'A')
+        cache.get('b', lambda: create('b'))
+        cache.get('a', lambda: create('a'))
+        cache.get('c', lambda: create('c'))
+        cache.get('b', lambda: create('b'))
+
+        self.assertEqual(computed, ['a', 'b', 'c', 'b'])
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 4, 'hit_ratio': 0.2, 'size': 2, 'maxsize': 2})
+
+    def test_discard_and_clear(self):
+        """Test case 2: discard drops matching keys, clear drops everything and resets the counters"""
+        cache = LRUCache(10)
+        for key in (('x', 1), ('x', 2), ('y', 1)):
+            cache.get(key, lambda: 'value')
+
+        cache.discard(lambda key: key[0] == 'x')
+        self.assertEqual(cache.stats()['size'], 1)
+
+        cache.clear()
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 0, 'hit_ratio': 0.0, 'size': 0, 'maxsize': 10})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+import pyotp
+from sqlalchemy import create_engine
+
+import migrations
+import mfa_cli
+from secret_store import SecretStore
+
+
+class TestMFACli(unittest.TestCase):
+    """Unit tests for the standalone command-line code reader"""
+
+    def setUp(self):
+        """Create a migrated temporary database with a few accounts"""
+        handle, self.database_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        engine = create_engine(f'sqlite:///{self.database_path}')
+        migrations.upgrade(engine)
+        engine.dispose()
+
+        connection = sqlite3.connect(self.database_path)
+        connection.executemany(
+            "INSERT INTO mfa_accounts (account_name, secret, issuer, hidden) VALUES (?, ?, ?, ?)",
+            [
+                ('GitHub Account', 'JBSWY3DPEHPK3PXP', 'GitHub', 0),
+                ('Google Account', 'JBSWY3DPEHPK3PXQ', 'Google', 1),
+                ('50%_off', 'JBSWY3DPEHPK3PXR', 'Shop', 0),
+            ]
+        )
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        """Remove the temporary database"""
+        os.remove(self.database_path)
+
+    def run_cli(self, *args):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+            status = mfa_cli.main(['--database', self.database_path, *args])
+        return status, output.getvalue()
+
+    def test_json_output_matches_pyotp(self):
+        """Test case 1: visible accounts are printed with the same codes pyotp generates"""
+        status, output = self.run_cli('--json')
+        self.assertEqual(status, 0)
+        entries = json.loads(output)
+        self.assertEqual([entry['account_name'] for entry in entries], ['50%_off', 'GitHub Account'])
+        github = entries[1]
+        self.assertEqual(github['totp_code'], pyotp.TOTP('JBSWY3DPEHPK3PXP').at(github['valid_until'] - 30))
+
+    def test_filters(self):
+        """Test case 2: name substrings, issuer patterns and ids select accounts"""
+        self.assertEqual(len(self.run_cli('--code-only', 'account')[1].split()), 1)
+        self.assertEqual(len(self.run_cli('--code-only', '%_')[1].split()), 1)
+        self.assertEqual(len(self.run_cli('--code-only', '--all', '--issuer', 'G*')[1].split()), 2)
+        # Hidden accounts are returned when asked for by id
+        self.assertEqual(self.run_cli('--code-only', '--id', '2')[1].strip(), pyotp.TOTP('JBSWY3DPEHPK3PXQ').now())
+        self.assertEqual(self.run_cli('nothing')[0], 1)
+
+    def test_web_stack_is_not_imported(self):
+        """Test case 3: the CLI doesn't import Flask, SQLAlchemy or qrcode"""
+        output = subprocess.run(
+            [sys.executable, '-c', 'import sys, mfa_cli; '
+             'print(sorted({"flask", "sqlalchemy", "qrcode"} & set(sys.modules)))'],
+            capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+        self.assertEqual(output, '[]')
+
+    def test_encrypted_secrets(self):
+        """Test case 4: encrypted secrets are decrypted with the configured master key, and fail cleanly without it"""
+        handle, key_path = tempfile.mkstemp()
+        with os.fdopen(handle, 'w') as key_file:
+            key_file.write('k' * 64)
+        self.addCleanup(os.remove, key_path)
+
+        with mock.patch.dict(os.environ, {'ENCRYPTION_KEY_FILE': key_path}):
+            from config import get_encryption_options
+            store = SecretStore()
+            store.configure(get_encryption_options())
+            connection = sqlite3.connect(self.database_path)
+            connection.execute("UPDATE mfa_accounts SET secret = ? WHERE id = 1", (store.encrypt('JBSWY3DPEHPK3PXP'),))
+            connection.commit()
+            connection.close()
+
+            self.assertEqual(self.run_cli('--code-only', '--id', '1')[1].strip(), pyotp.TOTP('JBSWY3DPEHPK3PXP').now())
+
+        with mock.patch.dict(os.environ, {'ENCRYPTION_KEY_FILE': '', 'SECRET_KEY': ''}):
+            status, output = self.run_cli('--json', '--id', '1')
+            self.assertEqual(status, 2)
+            # The missing key warning goes to stderr, keeping stdout machine-readable
+            self.assertEqual(output, '')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy import create_engine, inspect
+
+import migrations
+
+
+class TestMigrations(unittest.TestCase):
+    """Unit tests for the versioned schema migrations"""
+
+    def setUp(self):
+        """Create a temporary database file"""
+        handle, self.database_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_engine(f'sqlite:///{self.database_path}')
+
+    def tearDown(self):
+        """Remove the temporary database file"""
+        self.engine.dispose()
+        os.remove(self.database_path)
+
+    def test_new_database_is_created_at_latest_version(self):
+        """Test case 1: upgrading an empty database creates the full schema"""
+        applied = migrations.upgrade(self.engine)
+        self.assertEqual(applied, [version for version, _, _ in migrations.MIGRATIONS])
+
+        with self.engine.connect() as connection:
+            self.assertEqual(migrations.get_schema_version(connection), migrations.LATEST_VERSION)
+            indexes = {index['name'] for index in inspect(connection).get_indexes('mfa_accounts')}
+        self.assertTrue({
+            'ix_mfa_accounts_hidden',
+            'ix_mfa_accounts_issuer',
+            'ix_mfa_accounts_account_name_nocase',
+            'ix_mfa_accounts_period'
+        } <= indexes)
+
+    def test_current_database_is_skipped(self):
+        """Test case 2: a second upgrade applies nothing"""
+        migrations.upgrade(self.engine)
+        self.assertEqual(migrations.upgrade(self.engine), [])
+
+    def test_dropped_tables_are_recreated(self):
+        """Test case 3: a database that keeps its schema version after its tables were dropped is rebuilt"""
+        migrations.upgrade(self.engine)
+        with self.engine.begin() as connection:
+            for table in ('audit_events', 'mfa_accounts', 'app_state'):
+                connection.exec_driver_sql(f'DROP TABLE {table}')
+
+        self.assertEqual(migrations.upgrade(self.engine), [version for version, _, _ in migrations.MIGRATIONS])
+        with self.engine.connect() as connection:
+            self.assertEqual(migrations._missing_tables(connection), set())
+            self.assertEqual(migrations.get_schema_version(connection), migrations.LATEST_VERSION)
+
+    def test_legacy_database_gets_hidden_column(self):
+        """Test case 4: databases from before the hidden and TOTP parameter columns are upgraded in place"""
+        connection = sqlite3.connect(self.database_path)
+        connection.execute(
+            "CREATE TABLE mfa_accounts (id INTEGER PRIMARY KEY, account_name VARCHAR(100) NOT NULL UNIQUE, "
+            "secret VARCHAR(100) NOT NULL, issuer VARCHAR(100), created_at DATETIME, updated_at DATETIME)"
+        )
+        connection.execute("INSERT INTO mfa_accounts (account_name, secret) VALUES ('Legacy', 'JBSWY3DPEHPK3PXP')")
+        connection.commit()
+        connection.close()
+
+        migrations.upgrade(self.engine)
+
+        connection = sqlite3.connect(self.database_path)
+        self.assertEqual(
+            connection.execute("SELECT account_name, hidden, period, digits, algorithm FROM mfa_accounts").fetchall(),
+            [('Legacy', 0, 30, 6, 'sha1')]
+        )
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
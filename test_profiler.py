@@ -0,0 +1,102 @@
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from flask import Flask, render_template_string
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from profiler import RequestProfiler
+
+
+class TestRequestProfiler(unittest.TestCase):
+    """Unit tests for the opt-in request profiler"""
+
+    def setUp(self):
+        """Build a small app with a query, a timed span and a template render"""
+        self.directory = tempfile.mkdtemp()
+        self.engine = create_engine('sqlite://')
+        self.app = Flask(__name__)
+        self.profiler = RequestProfiler()
+
+        @self.app.route('/work')
+        def work():
+            with self.engine.connect() as connection:
+                connection.execute(text('SELECT 1'))
+            with self.profiler.span('codes'):
+                time.sleep(0.002)
+            return render_template_string('{{ value }}', value='done')
+
+        @self.app.route('/fallback')
+        def fallback():
+            with self.engine.connect() as connection:
+                try:
+                    connection.execute(text('SELECT * FROM no_such_table'))
+                except OperationalError:
+                    pass
+                # Unattributed time, then another statement
+                time.sleep(0.02)
+                connection.execute(text('SELECT 1'))
+            return 'done'
+
+    def tearDown(self):
+        """Remove written profiles"""
+        self.engine.dispose()
+        shutil.rmtree(self.directory)
+
+    def init_profiler(self, **options):
+        self.profiler.init_app(self.app, self.engine, {
+            'slow_request_ms': 0, 'profile_requests': False, 'sample_rate': 1.0, 'directory': self.directory, **options
+        })
+
+    def test_disabled_by_default(self):
+        """Test case 1: nothing is timed or logged unless enabled"""
+        self.init_profiler()
+        response = self.app.test_client().get('/work')
+        self.assertNotIn('Server-Timing', response.headers)
+
+    def test_slow_request_log_breaks_down_phases(self):
+        """Test case 2: slow requests are logged with time by phase"""
+        self.init_profiler(slow_request_ms=1)
+
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            response = self.app.test_client().get('/work')
+
+        self.assertEqual(response.data, b'done')
+        timing = response.headers['Server-Timing']
+        for phase in ('query', 'codes', 'render', 'total'):
+            self.assertIn(f'{phase};dur=', timing)
+        self.assertIn('Slow request: GET /work -> 200', output.getvalue())
+        self.assertIn('1 queries', output.getvalue())
+
+    def test_sampled_profiles_are_written(self):
+        """Test case 3: sampled requests over the threshold are written as .prof files"""
+        self.init_profiler(profile_requests=True)
+        client = self.app.test_client()
+        client.get('/work')
+        client.get('/work')
+
+        profiles = os.listdir(self.directory)
+        self.assertEqual(len(profiles), 2)
+        self.assertTrue(all('-GET-work-' in name and name.endswith('ms.prof') for name in profiles))
+        self.assertFalse(self.profiler._profile_lock.locked())
+
+
+    def test_failed_query_closes_its_span(self):
+        """Test case 4: time after a failed statement isn't counted as query time"""
+        self.init_profiler(slow_request_ms=1)
+        with contextlib.redirect_stdout(io.StringIO()):
+            response = self.app.test_client().get('/fallback')
+
+        timing = dict(part.strip().split(';dur=') for part in response.headers['Server-Timing'].split(','))
+        self.assertGreaterEqual(float(timing['other']), 20)
+        self.assertLess(float(timing['query']), 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
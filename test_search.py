@@ -10,7 +10,6 @@ class TestSearchEndpoint(unittest.TestCase):
     def setUp(self):
         """Set up test client and test database"""
         # Use in-memory database for tests
-        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
         app.config['TESTING'] = True
         self.client = app.test_client()
 
@@ -121,6 +120,57 @@ class TestSearchEndpoint(unittest.TestCase):
         self.assertGreater(account['remaining_time'], 0)
         self.assertLessEqual(account['remaining_time'], 30)
 
+    def test_search_matches_substring_in_middle(self):
+        """Test case 6: /api/search matches text in the middle of a name or issuer"""
+        response = self.client.get('/api/search?q=web serv')
+        data = response.get_json()
+        self.assertEqual([account['account_name'] for account in data], ['AWS Console'])
+
+        response = self.client.get('/api/search?q=ropb')
+        data = response.get_json()
+        self.assertEqual([account['account_name'] for account in data], ['Dropbox'])
+
+    def test_search_ranks_prefix_matches_first(self):
+        """Test case 7: /api/search ranks name prefix matches above other substring matches"""
+        db.session.add(MFAAccount(account_name='Work Google', secret='JBSWY3DPEHPK3PXT', issuer='Workspace'))
+        db.session.commit()
+
+        response = self.client.get('/api/search?q=goo')
+        data = response.get_json()
+        self.assertEqual([account['account_name'] for account in data], ['Google Account', 'Work Google'])
+
+    def test_search_short_query(self):
+        """Test case 8: /api/search handles queries shorter than the index trigram size"""
+        response = self.client.get('/api/search?q=aw')
+        data = response.get_json()
+        self.assertEqual([account['account_name'] for account in data], ['AWS Console'])
+
+    def test_search_limit(self):
+        """Test case 9: /api/search honours the limit parameter"""
+        response = self.client.get('/api/search?q=account&limit=1')
+        data = response.get_json()
+        self.assertEqual(len(data), 1)
+
+        response = self.client.get('/api/search?limit=2')
+        self.assertEqual(len(response.get_json()), 2)
+
+        response = self.client.get('/api/search?limit=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_search_index_follows_edits(self):
+        """Test case 10: renamed and deleted accounts are reflected in search results"""
+        self.client.post('/edit/1', data={
+            'account_name': 'Octocat',
+            'secret': 'JBSWY3DPEHPK3PXP',
+            'issuer': 'GitHub'
+        })
+        response = self.client.get('/api/search?q=octo')
+        self.assertEqual([account['account_name'] for account in response.get_json()], ['Octocat'])
+
+        self.client.post('/delete/1')
+        response = self.client.get('/api/search?q=octo')
+        self.assertEqual(response.get_json(), [])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,148 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import pyotp
+from sqlalchemy import create_engine
+
+import key_rotation
+import migrations
+from app import app, db
+from models import MFAAccount
+from secret_store import SecretStore, secret_store, is_encrypted
+
+OLD_KEY = b'o' * 32
+NEW_KEY = b'n' * 32
+
+
+def _options(master_key, previous_keys=()):
+    return {'master_key': master_key, 'previous_keys': list(previous_keys), 'key_cache_size': 4}
+
+
+class TestSecretStore(unittest.TestCase):
+    """Unit tests for envelope encryption of secrets and the decrypted key cache"""
+
+    def test_round_trip_and_plaintext_passthrough(self):
+        """Test case 1: secrets decrypt to the original, each with its own data key"""
+        store = SecretStore()
+        store.configure(_options(NEW_KEY))
+        first, second = store.encrypt('JBSWY3DPEHPK3PXP'), store.encrypt('JBSWY3DPEHPK3PXP')
+        self.assertTrue(is_encrypted(first))
+        self.assertNotEqual(first, second)
+        self.assertNotIn('JBSWY3DPEHPK3PXP', first)
+        self.assertEqual(store.decrypt(first), 'JBSWY3DPEHPK3PXP')
+        # Secrets written before encryption was enabled are still readable
+        self.assertEqual(store.decrypt('JBSWY3DPEHPK3PXP'), 'JBSWY3DPEHPK3PXP')
+
+    def test_rewrap_and_unknown_keys(self):
+        """Test case 2: rotation re-wraps under the new key; unknown keys and tampering are rejected"""
+        old_store = SecretStore()
+        old_store.configure(_options(OLD_KEY))
+        stored = old_store.encrypt('JBSWY3DPEHPK3PXP')
+
+        store = SecretStore()
+        store.configure(_options(NEW_KEY, [OLD_KEY]))
+        self.assertFalse(store.is_current(stored))
+        rewrapped = store.rewrap(stored)
+        self.assertTrue(store.is_current(rewrapped))
+        # Only the data key is re-wrapped, the encrypted secret is unchanged
+        self.assertEqual(rewrapped.rsplit(':', 1)[1], stored.rsplit(':', 1)[1])
+
+        new_only = SecretStore()
+        new_only.configure(_options(NEW_KEY))
+        self.assertEqual(new_only.decrypt(rewrapped), 'JBSWY3DPEHPK3PXP')
+        with self.assertRaises(ValueError):
+            new_only.decrypt(stored)
+        with self.assertRaises(ValueError):
+            new_only.decrypt(rewrapped[:-2] + ('AA' if not rewrapped.endswith('AA') else 'BB'))
+
+    def test_key_cache_decrypts_once(self):
+        """Test case 3: the TOTP key for a stored secret is decrypted once and the cache is bounded"""
+        store = SecretStore()
+        store.configure(_options(NEW_KEY))
+        stored = store.encrypt('JBSWY3DPEHPK3PXP')
+        for _ in range(3):
+            self.assertEqual(store.totp_key(stored).code_at(1700000000), pyotp.TOTP('JBSWY3DPEHPK3PXP').at(1700000000))
+        self.assertEqual((store.stats()['hits'], store.stats()['misses']), (2, 1))
+
+        for _ in range(10):
+            store.totp_key(store.encrypt('JBSWY3DPEHPK3PXP'))
+        self.assertEqual(store.stats()['size'], 4)
+
+
+class TestEncryptedAccounts(unittest.TestCase):
+    """Integration tests for encrypted secrets in the app, key rotation and the CLI"""
+
+    def setUp(self):
+        """Encrypt under a test master key in a temporary database"""
+        handle, self.database_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.engine = create_engine(f'sqlite:///{self.database_path}')
+        secret_store.configure(_options(OLD_KEY))
+
+    def tearDown(self):
+        """Turn encryption back off for the other test modules"""
+        secret_store.configure(_options(None))
+        self.engine.dispose()
+        os.remove(self.database_path)
+
+    def _stored_secrets(self):
+        connection = sqlite3.connect(self.database_path)
+        try:
+            return [row[0] for row in connection.execute("SELECT secret FROM mfa_accounts ORDER BY id")]
+        finally:
+            connection.close()
+
+    def test_app_stores_encrypted_secrets(self):
+        """Test case 4: new accounts are encrypted at rest and still produce the right codes"""
+        with app.app_context():
+            db.create_all()
+            try:
+                account = MFAAccount(account_name='GitHub Account', secret='JBSWY3DPEHPK3PXP', issuer='GitHub')
+                db.session.add(account)
+                db.session.commit()
+                self.assertTrue(is_encrypted(account.stored_secret))
+                self.assertEqual(account.secret, 'JBSWY3DPEHPK3PXP')
+
+                response = app.test_client().get(f'/api/code/{account.id}')
+                self.assertEqual(response.get_json()['totp_code'], pyotp.TOTP('JBSWY3DPEHPK3PXP').now())
+            finally:
+                db.session.remove()
+                db.drop_all()
+
+    def test_migration_and_rotation(self):
+        """Test case 5: the migration encrypts legacy rows and rotate re-wraps them under a new key"""
+        connection = sqlite3.connect(self.database_path)
+        connection.execute(
+            "CREATE TABLE mfa_accounts (id INTEGER PRIMARY KEY, account_name VARCHAR(100) NOT NULL UNIQUE, "
+            "secret VARCHAR(100) NOT NULL, issuer VARCHAR(100), created_at DATETIME, updated_at DATETIME)"
+        )
+        connection.executemany(
+            "INSERT INTO mfa_accounts (account_name, secret, updated_at) VALUES (?, ?, '2024-01-01 00:00:00')",
+            [(f'Legacy {index}', 'JBSWY3DPEHPK3PXP') for index in range(5)]
+        )
+        connection.commit()
+        connection.close()
+
+        migrations.upgrade(self.engine)
+        stored = self._stored_secrets()
+        self.assertTrue(all(secret_store.is_current(value) for value in stored))
+
+        secret_store.configure(_options(NEW_KEY, [OLD_KEY]))
+        with self.engine.connect() as connection:
+            self.assertEqual(key_rotation.rotate_secrets(connection, chunk_size=2), 5)
+            self.assertEqual(key_rotation.rotate_secrets(connection, chunk_size=2), 0)
+        rotated = self._stored_secrets()
+        self.assertTrue(all(secret_store.is_current(value) for value in rotated))
+        self.assertEqual({secret_store.decrypt(value) for value in rotated}, {'JBSWY3DPEHPK3PXP'})
+
+        # Rotation is not an edit
+        connection = sqlite3.connect(self.database_path)
+        self.assertEqual({row[0] for row in connection.execute("SELECT updated_at FROM mfa_accounts")},
+                         {'2024-01-01 00:00:00'})
+        connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
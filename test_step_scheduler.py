@@ -0,0 +1,30 @@
+import unittest
+
+from step_scheduler import StepScheduler, current_steps, period_groups
+
+
+class TestStepScheduler(unittest.TestCase):
+    """Unit tests for the per-period step boundary scheduler"""
+
+    def test_due_returns_only_groups_that_rolled_over(self):
+        """Test case 1: each period group is due at its own boundaries"""
+        scheduler = StepScheduler({30, 60}, now=1000)
+        self.assertEqual(scheduler.next_boundary(), 1020)
+        self.assertEqual(scheduler.due(now=1019), set())
+        self.assertEqual(scheduler.due(now=1020), {30, 60})
+        self.assertEqual(scheduler.next_boundary(), 1050)
+        self.assertEqual(scheduler.due(now=1050), {30})
+        self.assertEqual(scheduler.next_boundary(), 1080)
+        # A late wakeup catches up in one call instead of replaying missed boundaries
+        self.assertEqual(scheduler.due(now=1200), {30, 60})
+        self.assertEqual(scheduler.next_boundary(), 1230)
+
+    def test_defaults_and_steps(self):
+        """Test case 2: no periods means the default period, steps are sorted by period"""
+        self.assertEqual(StepScheduler(set(), now=0).periods, frozenset({30}))
+        self.assertEqual(period_groups(None), period_groups({30}))
+        self.assertEqual(current_steps({60, 30}, now=125), ((30, 4), (60, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from app import app
+from tenants import shards, UnknownTenant
+
+
+def _options(directory, mode='header', **overrides):
+    options = {
+        'mode': mode, 'header': 'X-Tenant', 'domain': 'mfa.example.com', 'directory': directory,
+        'auto_create': True, 'max_open': 64, 'idle_seconds': 300, 'pool_size': 2
+    }
+    options.update(overrides)
+    return options
+
+
+class TestTenants(unittest.TestCase):
+    """Unit tests for routing tenants to their own databases"""
+
+    def setUp(self):
+        """Put tenant databases in a temporary directory"""
+        app.config['TESTING'] = True
+        self.directory = tempfile.mkdtemp()
+        self.client = app.test_client()
+
+    def tearDown(self):
+        """Turn tenants back off for the other test modules"""
+        shards.configure(_options(self.directory, mode='off'))
+        shutil.rmtree(self.directory)
+
+    def _add(self, name, **kwargs):
+        return self.client.post('/add', data={'account_name': name, 'secret': 'JBSWY3DPEHPK3PXP'}, **kwargs)
+
+    def test_header_routing_isolates_tenants(self):
+        """Test case 1: each tenant named by the header only sees the accounts in its own database"""
+        shards.configure(_options(self.directory))
+        self._add('Acme Account', headers={'X-Tenant': 'acme'})
+        self._add('Globex Account', headers={'X-Tenant': 'globex'})
+
+        response = self.client.get('/api/codes', headers={'X-Tenant': 'acme'})
+        self.assertEqual([entry['account_name'] for entry in response.get_json()], ['Acme Account'])
+        self.assertIn('X-Tenant', response.vary)
+        other = self.client.get('/api/codes', headers={'X-Tenant': 'globex'})
+        self.assertEqual([entry['account_name'] for entry in other.get_json()], ['Globex Account'])
+        self.assertNotEqual(response.headers['ETag'], other.headers['ETag'])
+
+        self.assertEqual(shards.tenants(), ['acme', 'globex'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory, 'acme.db')))
+
+        # No tenant, an invalid one, or an unknown one without auto-create
+        self.assertEqual(self.client.get('/api/codes').status_code, 404)
+        self.assertEqual(self.client.get('/api/codes', headers={'X-Tenant': '../etc'}).status_code, 400)
+        shards.configure(_options(self.directory, auto_create=False))
+        self.assertEqual(self.client.get('/api/codes', headers={'X-Tenant': 'initech'}).status_code, 404)
+        self.assertEqual(self.client.get('/api/codes', headers={'X-Tenant': 'acme'}).status_code, 200)
+        # Process-wide endpoints don't need a tenant
+        self.assertEqual(self.client.get('/healthz').status_code, 200)
+
+    def test_path_and_subdomain_routing(self):
+        """Test case 2: path prefixes are kept in generated URLs, subdomains name the tenant too"""
+        shards.configure(_options(self.directory, mode='path'))
+        response = self.client.post('/t/acme/add', data={'account_name': 'Acme Account', 'secret': 'JBSWY3DPEHPK3PXP'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.location, '/t/acme/')
+
+        html = self.client.get('/t/acme/').get_data(as_text=True)
+        self.assertIn('Acme Account', html)
+        self.assertIn("'/t/acme/api/codes/stream?", html)
+        self.assertEqual(len(self.client.get('/t/globex/api/codes').get_json()), 0)
+
+        shards.configure(_options(self.directory, mode='subdomain'))
+        response = self.client.get('/api/codes', base_url='http://acme.mfa.example.com')
+        self.assertEqual([entry['account_name'] for entry in response.get_json()], ['Acme Account'])
+
+    def test_lru_closes_idle_and_excess_shards(self):
+        """Test case 3: at most max_open shards stay open, idle ones are closed, shards in use never are"""
+        shards.configure(_options(self.directory, max_open=2))
+        for name in ('one', 'two', 'three'):
+            shards.release(shards.acquire(name))
+        self.assertEqual(shards.open_shards(), ['two', 'three'])
+
+        in_use = shards.acquire('two')
+        for name in ('four', 'five'):
+            shards.release(shards.acquire(name))
+        self.assertIn('two', shards.open_shards())
+
+        shards.release(in_use)
+        self.assertEqual(shards.open_shards(), ['two', 'five'])
+        self.assertEqual(shards.evict(now=time.monotonic() + 301), ['two', 'five'])
+        self.assertEqual(shards.open_shards(), [])
+        self.assertEqual(shards.stats()['opened'] - shards.stats()['closed'], 0)
+
+        with self.assertRaises(UnknownTenant):
+            shards.acquire('six', create=False)
+
+    def test_compact(self):
+        """Test case 4: compacting a tenant gives back the space of deleted rows"""
+        shards.configure(_options(self.directory))
+        path = os.path.join(self.directory, 'acme.db')
+        shards.release(shards.acquire('acme'))
+        connection = sqlite3.connect(path)
+        connection.executemany(
+            "INSERT INTO mfa_accounts (account_name, secret, hidden) VALUES (?, ?, 0)",
+            [(f'Account {index:05d} {"x" * 60}', 'JBSWY3DPEHPK3PXP') for index in range(3000)]
+        )
+        connection.commit()
+        connection.execute("DELETE FROM mfa_accounts")
+        connection.commit()
+        connection.close()
+
+        before, after = shards.compact('acme')
+        self.assertLess(after, before)
+        self.assertEqual(after, os.path.getsize(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
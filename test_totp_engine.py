@@ -0,0 +1,89 @@
+import base64
+import hashlib
+import unittest
+
+import pyotp
+
+import totp_engine
+
+
+# RFC 6238 Appendix B test vectors: (unix time, sha1, sha256, sha512)
+RFC6238_VECTORS = [
+    (59, '94287082', '46119246', '90693936'),
+    (1111111109, '07081804', '68084774', '25091201'),
+    (1111111111, '14050471', '67062674', '99943326'),
+    (1234567890, '89005924', '91819424', '93441116'),
+    (2000000000, '69279037', '90698825', '38618901'),
+    (20000000000, '65353130', '77737706', '47863826'),
+]
+
+RFC6238_KEYS = {
+    'sha1': b'12345678901234567890',
+    'sha256': b'12345678901234567890123456789012',
+    'sha512': b'1234567890123456789012345678901234567890123456789012345678901234',
+}
+
+SECRETS = [
+    'JBSWY3DPEHPK3PXP',
+    'JBSWY3DPEHPK3PXQ',
+    'GEZDGNBVGY3TQOJQGEZDGNBVGY3TQOJQ',
+    'jbswy3dpehpk3pxp',
+    'JBSW Y3DP EHPK 3PXP',
+    'MFRGGZDFMZTWQ2LK',
+    'ORSXG5A',
+]
+
+
+class TestTOTPEngine(unittest.TestCase):
+    """Parity tests for the TOTP engine against RFC 6238 and pyotp"""
+
+    def test_rfc6238_vectors(self):
+        """Test case 1: engine reproduces every RFC 6238 Appendix B code"""
+        for timestamp, *expected in RFC6238_VECTORS:
+            for algorithm, code in zip(('sha1', 'sha256', 'sha512'), expected):
+                key = totp_engine.TOTPKey(RFC6238_KEYS[algorithm], digits=8, algorithm=algorithm)
+                self.assertEqual(key.code_at(timestamp), code, f'{algorithm} at {timestamp}')
+
+    def test_rfc6238_vectors_from_base32(self):
+        """Test case 2: base32 secrets decode to the RFC keys"""
+        secret = base64.b32encode(RFC6238_KEYS['sha1']).decode()
+        for timestamp, code, _, _ in RFC6238_VECTORS:
+            key = totp_engine.compile_secret(secret, digits=8)
+            self.assertEqual(key.code_at(timestamp), code)
+
+    def test_parity_with_pyotp(self):
+        """Test case 3: engine matches pyotp for many secrets and timestamps"""
+        timestamps = [0, 29, 30, 59, 1111111109, 1700000000, 1700000029, 2000000000]
+        for secret in SECRETS:
+            totp = pyotp.TOTP(secret.replace(' ', ''))
+            for timestamp in timestamps:
+                self.assertEqual(totp_engine.code_at(secret, timestamp), totp.at(timestamp))
+
+    def test_remaining_time(self):
+        """Test case 4: remaining time counts down to the next step boundary"""
+        self.assertEqual(totp_engine.remaining_time(0), 30)
+        self.assertEqual(totp_engine.remaining_time(29), 1)
+        self.assertEqual(totp_engine.remaining_time(30), 30)
+        self.assertEqual(totp_engine.remaining_time(119, period=60), 1)
+
+    def test_account_parameters(self):
+        """Test case 5: compiled keys and validate_params honour each account's digits, period and algorithm"""
+        key = totp_engine.compile_secret('JBSWY3DPEHPK3PXP', 8, 60, 'sha256')
+        self.assertEqual(
+            key.code_at(1700000000),
+            pyotp.TOTP('JBSWY3DPEHPK3PXP', digits=8, interval=60, digest=hashlib.sha256).at(1700000000)
+        )
+
+        self.assertEqual(totp_engine.validate_params('8', '60', 'SHA512'), (8, 60, 'sha512'))
+        for digits, period, algorithm in ((5, 30, 'sha1'), (6, 5, 'sha1'), (6, 30, 'md5'), ('six', 30, 'sha1')):
+            with self.assertRaises(ValueError):
+                totp_engine.validate_params(digits, period, algorithm)
+
+    def test_invalid_secret(self):
+        """Test case 6: invalid base32 raises ValueError"""
+        with self.assertRaises(ValueError):
+            totp_engine.decode_secret('NOT-BASE32!')
+
+
+if __name__ == '__main__':
+    unittest.main()
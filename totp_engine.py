@@ -0,0 +1,111 @@
+"""
+TOTP code generation engine for MFA Manager
+Decodes each base32 secret to raw key bytes once and computes RFC 4226/6238
+codes directly with hmac.digest, instead of building a pyotp.TOTP per call.
+"""
+
+import base64
+import hmac
+import struct
+import time
+from functools import lru_cache
+
+DEFAULT_PERIOD = 30
+DEFAULT_DIGITS = 6
+DEFAULT_ALGORITHM = 'sha1'
+
+# Parameters accounts may use; authenticator apps support little beyond these
+ALGORITHMS = ('sha1', 'sha256', 'sha512')
+MIN_DIGITS, MAX_DIGITS = 6, 8
+MIN_PERIOD, MAX_PERIOD = 10, 300
+
+_COUNTER = struct.Struct('>Q')
+_POWERS = {digits: 10 ** digits for digits in range(1, 11)}
+
+
+class TOTPKey:
+    """Compiled TOTP parameters for a single secret"""
+
+    __slots__ = ('key', 'digits', 'period', 'algorithm')
+
+    def __init__(self, key, digits=DEFAULT_DIGITS, period=DEFAULT_PERIOD, algorithm=DEFAULT_ALGORITHM):
+        self.key = key
+        self.digits = digits
+        self.period = period
+        self.algorithm = algorithm
+
+    def code_at(self, timestamp):
+        """Generate the code valid at a unix timestamp"""
+        return hotp(self.key, int(timestamp) // self.period, self.digits, self.algorithm)
+
+    def __repr__(self):
+        return f'<TOTPKey {self.algorithm}/{self.digits}/{self.period}s>'
+
+
+def decode_secret(secret):
+    """
+    Decode a base32 secret to raw key bytes, the same way pyotp does.
+
+    Raises:
+        ValueError: If the secret is not valid base32
+    """
+    secret = secret.replace(' ', '')
+    missing_padding = len(secret) % 8
+    if missing_padding:
+        secret += '=' * (8 - missing_padding)
+    try:
+        return base64.b32decode(secret, casefold=True)
+    except Exception as e:
+        raise ValueError(f'Invalid base32 secret: {e}') from e
+
+
+@lru_cache(maxsize=4096)
+def compile_secret(secret, digits=DEFAULT_DIGITS, period=DEFAULT_PERIOD, algorithm=DEFAULT_ALGORITHM):
+    """Get the compiled TOTPKey for a secret, decoding it only on first use"""
+    return TOTPKey(decode_secret(secret), digits, period, algorithm)
+
+
+def hotp(key, counter, digits=DEFAULT_DIGITS, algorithm=DEFAULT_ALGORITHM):
+    """Compute an RFC 4226 HOTP value for raw key bytes and a counter"""
+    mac = hmac.digest(key, _COUNTER.pack(counter), algorithm)
+    offset = mac[-1] & 0x0F
+    binary = int.from_bytes(mac[offset:offset + 4], 'big') & 0x7FFFFFFF
+    return str(binary % _POWERS[digits]).zfill(digits)
+
+
+def code_at(secret, timestamp=None):
+    """Generate the code for a base32 secret at a unix timestamp (defaults to now)"""
+    if timestamp is None:
+        timestamp = time.time()
+    return compile_secret(secret).code_at(timestamp)
+
+
+def validate_params(digits=DEFAULT_DIGITS, period=DEFAULT_PERIOD, algorithm=DEFAULT_ALGORITHM):
+    """
+    Normalize an account's TOTP parameters (algorithm names are case-insensitive).
+
+    Returns:
+        tuple: (digits, period, algorithm)
+
+    Raises:
+        ValueError: If a parameter is not one authenticator apps support
+    """
+    try:
+        digits, period = int(digits), int(period)
+    except (TypeError, ValueError):
+        raise ValueError('digits and period must be integers') from None
+    algorithm = str(algorithm).lower()
+    if not MIN_DIGITS <= digits <= MAX_DIGITS:
+        raise ValueError(f'digits must be from {MIN_DIGITS} to {MAX_DIGITS}')
+    if not MIN_PERIOD <= period <= MAX_PERIOD:
+        raise ValueError(f'period must be from {MIN_PERIOD} to {MAX_PERIOD} seconds')
+    if algorithm not in ALGORITHMS:
+        raise ValueError(f'algorithm must be one of: {", ".join(name.upper() for name in ALGORITHMS)}')
+    return digits, period, algorithm
+
+
+def remaining_time(timestamp=None, period=DEFAULT_PERIOD):
+    """Get the seconds left before the code valid at a timestamp expires"""
+    if timestamp is None:
+        timestamp = time.time()
+    return period - (int(timestamp) % period)